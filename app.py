@@ -1,98 +1,453 @@
 import os
 import datetime
 import re
-from flask import Flask, request, render_template, jsonify
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from flask import Flask, Response, request, render_template, jsonify, g, has_request_context, copy_current_request_context, stream_with_context
+from werkzeug.local import LocalProxy
 from dateutil import parser
 import requests
 import pytz
 # from datetime import datetime
 import datetime
+import time
+import hashlib
+import threading
+import json
+import uuid
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from dateutil.parser import parse
+from googleapiclient.errors import HttpError
+from calendar_client import CalendarClientManager
+from scheduling import (SCOPES, TIMEZONE, WORKING_HOURS, EVENT_FIELDS, is_within_working_hours,
+                        parse_local_datetime, format_event, event_time_fields)
+from event_store import EventStore
+from event_record import Event
+from busy_index import BusyIndex, BusyIndexRegistry
+from slots import find_free_slots, format_slots
+from slot_ranking import SlotPreferences, parse_hours, score_slots, top_slots, BUFFER_BEFORE, BUFFER_AFTER
+from bitmaps import busy_bitmaps, minute_mask, free_bitmaps, free_runs, slots_in_runs
+from batch import execute_batch, MAX_BATCH_SIZE
+from freebusy import FreeBusyCache
+from window_versions import WindowVersions
+from watch import WatchChannelManager
+from user_clients import CredentialStore, UserClientPool
+from write_queue import WriteQueue, is_retryable, backoff_delay
+from paging import iter_events, iter_event_pages, DEFAULT_PAGE_SIZE
+from streaming import negotiate, wants_gzip, iter_chunks, encode_pages, JSON, STREAM_PAGE_SIZE
+from ics import ImportLog, export_calendar, iter_lines, iter_vevents, vevent_to_google
+import rate_limit
+from rate_limit import RateLimiter
+from metrics import REGISTRY, Histogram, InstrumentedRequest, instrument_app, cache_samples
+from payloads import PAYLOAD_STATS, PayloadRequest
 
 app = Flask(__name__)
+# Per-route latency, in-flight and error metrics, served at /metrics
+instrument_app(app)
 
-# Configuration
-SCOPES = ['https://www.googleapis.com/auth/calendar']
-TIMEZONE = "Asia/Kolkata"
-WORKING_HOURS = (9, 17)  # Office hours (9 AM - 5 PM)
+# Configuration (SCOPES, TIMEZONE and WORKING_HOURS live in scheduling.py)
+# Where busy time for the primary calendar comes from: "mirror" (local event store) or "freebusy"
+AVAILABILITY_BACKEND = os.getenv('AVAILABILITY_BACKEND', 'mirror')
+# Calendars to receive push notifications for, and how stale the mirror may get while they arrive
+WATCHED_CALENDARS = os.getenv('WATCHED_CALENDARS', 'primary').split(',')
+WATCHED_MAX_STALENESS = float(os.getenv('WATCHED_MAX_STALENESS', '600'))
+# Header naming the user a request acts for; without it the token.json account is used.
+# Set it from a trusted front end or auth proxy, never from end users directly.
+USER_HEADER = os.getenv('USER_HEADER', 'X-Calendar-User')
+# Queue /add, /update-event and /delete writes by default; a request's "async" field overrides it
+ASYNC_WRITES = os.getenv('ASYNC_WRITES', '0') == '1'
+# Attempts per event when an ICS import batch item hits a rate limit or server error
+IMPORT_MAX_ATTEMPTS = int(os.getenv('IMPORT_MAX_ATTEMPTS', '4'))
+
+# Every Calendar API call asks for its route's fields only, and is sized and timed
+class CalendarRequest(PayloadRequest, InstrumentedRequest):
+    pass
+
+# Built once per process and shared by every route
+# Token bucket per Google account, shared by every process on this host
+rate_limiter = RateLimiter()
+calendar_client = CalendarClientManager(SCOPES, request_builder=rate_limiter.request_builder('default', CalendarRequest))
+
+# Per-account state: Calendar client, local mirror and the caches fed by it
+class Tenant:
+    """
+    Everything the routes need for one Google account. The token.json account
+    is the default tenant; other users get one each from the client pool and
+    lose it when the pool evicts them (their mirror rows stay in SQLite).
+    """
+
+    def __init__(self, service_factory, store_key=None):
+        self.get_service = service_factory
+        # Local mirror of the primary calendar, kept current with incremental sync
+        self.event_store = EventStore(service_factory, timezone=TIMEZONE, store_key=store_key)
+        # In-memory busy intervals, updated on every mirror change
+        self.busy_index = BusyIndexRegistry().attach(self.event_store)
+        # FreeBusy intervals cached per (calendar, day), for other calendars and the freebusy backend
+        self.freebusy_cache = FreeBusyCache(service_factory, timezone=TIMEZONE)
+        self.event_store.add_listener(self.invalidate_freebusy)
+        # Per-day change clock of the mirror, used to version GET responses
+        self.window_versions = WindowVersions(pytz.timezone(TIMEZONE)).attach(self.event_store)
+
+    def invalidate_freebusy(self, changed, removed, full):
+        """Drops cached FreeBusy days that a mirror change may have touched."""
+        if full or removed:
+            self.freebusy_cache.invalidate('primary')
+            return
+        for _, start_ts, end_ts in changed:
+            self.freebusy_cache.invalidate_between('primary', start_ts, end_ts)
+
+    def size(self):
+        """Items held in memory: mirrored busy intervals and cached FreeBusy intervals."""
+        return len(self.busy_index) + len(self.freebusy_cache)
+
+default_tenant = Tenant(lambda: calendar_client.get_service())
+
+# Credentials and warm clients for every other user, LRU-bounded
+# A user's tenant counts towards the pool's state bound, so large mirrors are evicted sooner
+user_pool = UserClientPool(CredentialStore(scopes=SCOPES), calendar_client.get_discovery_document,
+                           request_builder=lambda user_id: rate_limiter.request_builder(f"user-{user_id}", CalendarRequest),
+                           state_size=lambda client: client.state['tenant'].size() if 'tenant' in client.state else 0)
+tenant_lock = threading.Lock()
+
+def trim_user_pool(changed, removed, full):
+    """A full sync is where a mirror grows most, so the pool's bounds are re-checked after one."""
+    if full:
+        user_pool.trim()
+
+def get_user_tenant(client):
+    """The tenant kept on a user's pooled client, created on first use."""
+    tenant = client.state.get('tenant')
+    if tenant is None:
+        with tenant_lock:
+            tenant = client.state.get('tenant')
+            if tenant is None:
+                # Bound to this client, so an evicted tenant never re-creates its pool entry
+                tenant = client.state['tenant'] = Tenant(
+                    lambda: user_pool.get_service(client), store_key=f"user:{client.user_id}")
+                tenant.event_store.add_listener(trim_user_pool)
+    return tenant
+
+def acquire_tenant(user_id):
+    """Returns (tenant, client); the client stays pinned in the pool until release_tenant(client)."""
+    if not user_id:
+        return default_tenant, None
+    client = user_pool.acquire(user_id)
+    return get_user_tenant(client), client
+
+def release_tenant(client):
+    if client is not None:
+        user_pool.release(client)
+
+def current_user_id():
+    """The user named by USER_HEADER, or None for the default account and background work."""
+    return request.headers.get(USER_HEADER) or None if has_request_context() else None
+
+def current_tenant():
+    """The tenant of the user named by USER_HEADER; background work uses the default tenant."""
+    if not has_request_context():
+        return default_tenant
+    if 'tenant' not in g:
+        g.tenant, g.user_client = acquire_tenant(current_user_id())
+    return g.tenant
+
+@app.teardown_request
+def release_current_tenant(exception=None):
+    release_tenant(g.pop('user_client', None))
+
+@app.before_request
+def reset_quota_wait():
+    rate_limiter.take_wait()
+
+QUOTA_WAIT_SECONDS = Histogram('calendar_quota_wait_seconds', "Time a request spent waiting for API quota",
+                               ('route',))
+
+@app.after_request
+def report_quota_wait(response):
+    """Tells callers how long this request queued for API quota, as a Server-Timing metric."""
+    waited = rate_limiter.take_wait()
+    QUOTA_WAIT_SECONDS.labels(request.url_rule.rule if request.url_rule else 'unmatched').observe(waited)
+    if waited:
+        response.headers.add('Server-Timing', f'quota;dur={waited * 1000:.1f};desc="Calendar API quota wait"')
+    return response
+
+@app.before_request
+def resolve_tenant():
+    try:
+        current_tenant()
+    except (LookupError, ValueError) as e:
+        return jsonify({"success": False, "error": e.args[0]}), 401
 
 def get_calendar_service():
-    """Gets an authorized Google Calendar API service instance."""
-    creds = None
-    # The file token.json stores the user's access and refresh tokens
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    # If there are no (valid) credentials available, let the user log in
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+    """Gets an authorized Google Calendar API service instance for the current user."""
+    return current_tenant().get_service()
+
+# The current user's mirror and caches; routes use these like plain module globals
+event_store = LocalProxy(lambda: current_tenant().event_store)
+busy_index = LocalProxy(lambda: current_tenant().busy_index)
+freebusy_cache = LocalProxy(lambda: current_tenant().freebusy_cache)
+window_versions = LocalProxy(lambda: current_tenant().window_versions)
+
+# Push notifications: pull changes as soon as Google reports them
+def on_calendar_change(calendar_id):
+    """Incremental pull for the mirror (its listeners drop affected days); other calendars lose their FreeBusy days."""
+    if calendar_id == event_store.calendar_id:
+        # Nobody is waiting on this pull, so it yields quota to request-time calls
+        with rate_limit.background():
+            event_store.sync()
+    else:
+        freebusy_cache.invalidate(calendar_id)
+
+def on_calendar_followed(calendar_id):
+    """Another process pulled this change into the shared mirror; rebuild from its rows instead of pulling again."""
+    if calendar_id == event_store.calendar_id:
+        event_store.follow()
+    else:
+        freebusy_cache.invalidate(calendar_id)
+
+polling_max_staleness = event_store.max_staleness
+
+def on_watch_state(calendar_id, live):
+    """While a channel is open the mirror is kept current by pushes, so reads stop polling."""
+    if calendar_id == event_store.calendar_id:
+        event_store.max_staleness = WATCHED_MAX_STALENESS if live else polling_max_staleness
+
+watch_manager = WatchChannelManager(get_calendar_service, on_calendar_change, on_watch_state,
+                                    calendar_ids=WATCHED_CALENDARS, on_follow=on_calendar_followed)
+
+# Execute one queued write; called by write queue workers, outside any request
+def run_write_job(kind, payload, tenant):
+    """
+    Performs an insert, patch or delete for a user's tenant and writes the result through to their mirror.
+    Jobs can run more than once, so each kind tolerates an earlier attempt having already applied.
+    """
+    events = tenant.get_service().events()
+
+    if kind == 'insert':
+        try:
+            event = events.insert(calendarId='primary', body=payload['body']).execute()
+        except HttpError as e:
+            # The body carries an event id chosen at submit time, so 409 means an earlier attempt created it
+            if e.resp.status != 409:
+                raise
+            event = events.get(calendarId='primary', eventId=payload['body']['id']).execute()
+        tenant.event_store.upsert_event(event)
+        return {"event_id": event['id']}
+
+    if kind == 'patch':
+        patch_request = events.patch(calendarId='primary', eventId=payload['event_id'], body=payload['body'])
+        if payload.get('etag'):
+            patch_request.headers['If-Match'] = payload['etag']
+        try:
+            event = patch_request.execute()
+        except HttpError as e:
+            if e.resp.status != 412:
+                raise
+            # Either someone else edited the event, or an earlier attempt of this job already applied
+            event = events.get(calendarId='primary', eventId=payload['event_id']).execute()
+            if Event.from_google(event, pytz.timezone(TIMEZONE)).start != payload['start_ts']:
+                raise ValueError("Event was modified by someone else, please retry")
+        tenant.event_store.upsert_event(event)
+        return {"event_id": event['id']}
+
+    if kind == 'delete':
+        try:
+            events.delete(calendarId='primary', eventId=payload['event_id']).execute()
+        except HttpError as e:
+            # 410 Gone: already deleted, e.g. by an earlier attempt
+            if e.resp.status not in (404, 410):
+                raise
+        tenant.event_store.remove_event(payload['event_id'])
+        return {"event_id": payload['event_id']}
+
+    raise ValueError(f"Unknown job kind: {kind}")
+
+def run_queued_write(kind, payload, user_id):
+    """Queued writes were acknowledged already, so they yield quota to request-time calls."""
+    with rate_limit.background():
+        tenant, client = acquire_tenant(user_id)
+        try:
+            return run_write_job(kind, payload, tenant)
+        finally:
+            release_tenant(client)
+
+# Persisted queue for asynchronous writes
+write_queue = WriteQueue(run_queued_write)
+# Progress of ICS imports, so an interrupted one can resume
+import_log = ImportLog()
+
+# Background work starts in each serving process on its first request, whatever runs the app:
+# a preloading server forks after import, and the debug reloader's parent never serves.
+# Channels are renewed by one process only (the watch store's lock holder); queue claims are leased.
+background_pid = None
+background_lock = threading.Lock()
+
+@app.before_request
+def start_background_work():
+    global background_pid
+    if background_pid == os.getpid():
+        return
+    with background_lock:
+        if background_pid != os.getpid():
+            watch_manager.start()
+            # Resume writes a previous run left queued
+            write_queue.start()
+            background_pid = os.getpid()
+
+def wants_async_write(data):
+    return bool(data.get('async', ASYNC_WRITES))
+
+# Queue a write and acknowledge it with its job id
+def enqueue_write(kind, payload, message, validate=None):
+    """
+    Deduplicates on the Idempotency-Key header when given; otherwise an
+    identical write that is still queued or running is reused. validate()
+    returning (ok, reason) runs only for new writes, so a client retrying a
+    request gets its original job back rather than a conflict with it.
+    """
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key:
+        dedup_key, active_only = f"key:{current_user_id()}:{idempotency_key}", False
+    else:
+        digest = hashlib.sha1(json.dumps([kind, payload], sort_keys=True).encode()).hexdigest()
+        dedup_key, active_only = f"auto:{current_user_id()}:{digest}", True
+
+    job = write_queue.find(dedup_key, active_only)
+    if job is None and validate is not None:
+        ok, reason = validate()
+        if not ok:
+            return jsonify({"success": False, "error": reason})
+
+    if job is None and kind == 'insert':
+        # The id is chosen now so a retried insert cannot create a duplicate
+        payload['event_id'] = payload['body']['id'] = uuid.uuid4().hex
+
+    if job is None:
+        job = write_queue.submit(kind, payload, user_id=current_user_id(), dedup_key=dedup_key, active_only=active_only)
+    return jsonify({
+        "success": True,
+        "message": message,
+        "job_id": job['id'],
+        "status": job['status'],
+        "status_url": f"/jobs/{job['id']}",
+    }), 202
+
+# Busy time claimed by queued inserts and moves that have not reached Google yet
+def queued_conflict(start_time, end_time, exclude_event_id=None):
+    start_ts, end_ts = start_time.timestamp(), end_time.timestamp()
+    for payload in write_queue.active_payloads(current_user_id(), kinds=('insert', 'patch')):
+        if payload.get('event_id') == exclude_event_id and exclude_event_id:
+            continue
+        if payload['start_ts'] < end_ts and payload['end_ts'] > start_ts:
+            return True
+    return False
+
+# Runs independent upstream calls of a single request side by side
+stage_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="calendar-stage")
+
+# Read the per-request freshness controls for the mirrored read routes
+def get_freshness_args():
+    """Returns max_staleness (seconds) and force_refresh from the query string."""
+    return {
+        "max_staleness": request.args.get('max_staleness', type=float),
+        "force_refresh": request.args.get('refresh', 'false').lower() in ('1', 'true', 'yes'),
+    }
+
+# Read the calendars to check from the query string
+def get_calendar_ids_arg():
+    """Returns the comma-separated `calendars` param as a list, defaulting to the primary calendar."""
+    calendars = request.args.get('calendars', '')
+    return [calendar_id.strip() for calendar_id in calendars.split(',') if calendar_id.strip()] or ['primary']
+
+# Get busy intervals per calendar without downloading event payloads
+def get_busy_by_calendar(time_min, time_max, calendar_ids=('primary',), max_staleness=None,
+                         force_refresh=False, exclude_event_id=None):
+    """
+    Returns {calendar_id: [(start_ts, end_ts), ...]} of busy time overlapping [time_min, time_max).
+    The primary calendar is answered by the local busy index unless
+    AVAILABILITY_BACKEND is "freebusy"; every other calendar uses the FreeBusy cache.
+    Excluding an event needs event ids, so it always uses the busy index.
+    """
+    busy = {}
+    remote_ids = []
+    for calendar_id in calendar_ids:
+        if calendar_id == 'primary' and (AVAILABILITY_BACKEND == 'mirror' or exclude_event_id):
+            event_store.ensure_fresh(max_staleness=max_staleness, force=force_refresh)
+            busy[calendar_id] = [(start, end) for start, end, _ in busy_index.overlapping(
+                time_min.timestamp(), time_max.timestamp(), exclude_id=exclude_event_id)]
         else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
-
-    return build('calendar', 'v3', credentials=creds)
-
-# Check if time is within working hours
-def is_within_working_hours(start_time, end_time):
-    # Check if both start and end times are within working hours on their respective days
-    
-    start_time = parse(start_time)
-    end_time = parse(end_time)
-    
-    start_hour = start_time.hour
-    end_hour = end_time.hour
-    
-    # Check day boundary crossing
-    if start_time.date() != end_time.date():
-        return False, "Event cannot cross day boundaries"
-    
-    if start_hour < WORKING_HOURS[0]:
-        return False, f"Start time must be after {WORKING_HOURS[0]}:00 AM"
-    
-    if end_hour > WORKING_HOURS[1]:
-        return False, f"End time must be before {WORKING_HOURS[1]}:00 PM"
-    
-    if start_hour >= WORKING_HOURS[1]:
-        return False, f"Start time must be before {WORKING_HOURS[1]}:00 PM"
-        
-    if end_hour <= WORKING_HOURS[0]:
-        return False, f"End time must be after {WORKING_HOURS[0]}:00 AM"
-    
-    return True, "Within working hours"
+            remote_ids.append(calendar_id)
+
+    if remote_ids:
+        if force_refresh:
+            for calendar_id in remote_ids:
+                freebusy_cache.invalidate(calendar_id)
+        busy.update(freebusy_cache.busy_between(remote_ids, time_min, time_max))
+
+    return busy
+
+# Get busy intervals across calendars as one sorted list
+def get_busy_intervals(time_min, time_max, calendar_ids=('primary',), **kwargs):
+    """Returns sorted (start_ts, end_ts) busy intervals of all calendars; see get_busy_by_calendar."""
+    busy_by_calendar = get_busy_by_calendar(time_min, time_max, calendar_ids, **kwargs)
+    return sorted(interval for intervals in busy_by_calendar.values() for interval in intervals)
+
+# Get events overlapping a time window from the local mirror
+def get_store_events(time_min, time_max, max_staleness=None, force_refresh=False):
+    """
+    Serves events.list-equivalent results locally, syncing deltas if the mirror is stale.
+    Returns a generator so callers can stream or stop early.
+    """
+    event_store.ensure_fresh(max_staleness=max_staleness, force=force_refresh)
+    return event_store.events_between(time_min, time_max)
+
+# Whether availability for these calendars comes entirely from the mirror
+def answered_by_mirror(calendar_ids):
+    return AVAILABILITY_BACKEND == 'mirror' and list(calendar_ids) == ['primary']
+
+# Strong ETag for a read over [time_min, time_max) of the mirror
+def request_etag(time_min, time_max):
+    """
+    Hashes the route, its query string and the mirror's version of the window.
+    Syncs the mirror first (honouring max_staleness/refresh), so the ETag
+    matches what the route would serve; callers then read without syncing again.
+    """
+    freshness = get_freshness_args()
+    event_store.ensure_fresh(max_staleness=freshness["max_staleness"], force=freshness["force_refresh"])
+    version = window_versions.version(time_min.timestamp(), time_max.timestamp())
+    query = sorted(request.args.items(multi=True))
+    return hashlib.sha1(f"{request.path}|{query}|{version}".encode()).hexdigest()
+
+# Answer 304 before doing any work if the client already has this version
+def not_modified(etag):
+    if etag and request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return None
+
+# JSON response carrying an ETag, answered with 304 when If-None-Match matches
+def conditional_response(payload, etag=None):
+    """Without a mirror ETag (e.g. FreeBusy answers) the body itself is hashed."""
+    response = jsonify(payload)
+    if etag:
+        response.set_etag(etag)
+    else:
+        response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 # Check availability in Google Calendar
-def check_availability(start_time, end_time):
+def check_availability(start_time, end_time, exclude_event_id=None, calendar_ids=('primary',)):
     # First check if the proposed time is within working hours
     within_hours, reason = is_within_working_hours(start_time, end_time)
     if not within_hours:
         return False, reason
     
-    service = get_calendar_service()
-
-    # Format times for Google Calendar API
-    start_time_str = start_time.isoformat()
-    end_time_str = end_time.isoformat()
-    
-    # Check for conflicts in the calendar
-    events_result = service.events().list(
-        calendarId='primary',
-        timeMin=start_time_str,
-        timeMax=end_time_str,
-        singleEvents=True,
-        orderBy='startTime'
-    ).execute()
-    
-    events = events_result.get('items', [])
-    if events:
+    # Check for conflicts against the busy index / FreeBusy cache
+    if get_busy_intervals(start_time, end_time, calendar_ids, exclude_event_id=exclude_event_id):
         return False, "Time slot conflicts with an existing event"
+    if queued_conflict(start_time, end_time, exclude_event_id):
+        return False, "Time slot conflicts with a queued change"
     
     return True, "Time slot is available"
 
@@ -102,6 +457,7 @@ def delete_event(event_id):
     
     try:
         service.events().delete(calendarId='primary', eventId=event_id).execute()
+        event_store.remove_event(event_id)
         return True, "Event deleted successfully"
     except Exception as e:
         return False, f"Error deleting event: {str(e)}"
@@ -110,7 +466,13 @@ def delete_event(event_id):
 def get_available_slots():
     """
     Finds available time slots for a given date and meeting duration.
+    Pass start_date/end_date instead of date to search a range of days,
+    calendars=<id>,<id> to find time when all of those calendars are free,
+    and top=N to get only the N best slots (see get_ranked_slots).
     """
+    if request.args.get('start_date'):
+        return get_available_slots_in_range()
+
     date_str = request.args.get('date')  # Expected format: "YYYY-MM-DD"
     duration_str = request.args.get('duration')  # Expected format: "60 minutes" or similar
 
@@ -120,7 +482,6 @@ def get_available_slots():
         return jsonify({"success": False, "error": "Invalid duration format"})
 
     duration = int(duration_match.group())
-    slot_duration = datetime.timedelta(minutes=duration)
     
     # Parse date and create time bounds
     date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
@@ -132,71 +493,240 @@ def get_available_slots():
     start_of_day = timezone.localize(start_of_day)
     end_of_day = timezone.localize(end_of_day)
     
-    # Format for API
-    start_time_str = start_of_day.isoformat()
-    end_time_str = end_of_day.isoformat()
-    
-    service = get_calendar_service()
-    
-    # Get all events for the day
-    events_result = service.events().list(
-        calendarId='primary',
-        timeMin=start_time_str,
-        timeMax=end_time_str,
-        singleEvents=True,
-        orderBy='startTime'
-    ).execute()
+    if request.args.get('top'):
+        return get_ranked_slots([(start_of_day.timestamp(), end_of_day.timestamp())], duration, 30)
     
-    events = events_result.get('items', [])
+    # Unchanged day, unchanged answer
+    calendar_ids = get_calendar_ids_arg()
+    etag = request_etag(start_of_day, end_of_day) if answered_by_mirror(calendar_ids) else None
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
-    # Find all free slots
-    free_slots = []
-    current_time = start_of_day
+    # Get busy intervals for the day (no event payloads needed)
+    busy = get_busy_intervals(start_of_day, end_of_day, calendar_ids, **({} if etag else get_freshness_args()))
     
-    # If no events, the entire day is free
-    if not events:
-        while current_time + slot_duration <= end_of_day:
-            free_slots.append({
-                "start": current_time.isoformat(),
-                "end": (current_time + slot_duration).isoformat()
-            })
-            current_time += datetime.timedelta(minutes=30)
-    else:
-        # Process each event and find gaps
-        for event in events:
-            event_start = parser.parse(event['start'].get('dateTime', event['start'].get('date')))
-            event_end = parser.parse(event['end'].get('dateTime', event['end'].get('date')))
-            
-            # Add free slots before this event
-            while current_time + slot_duration <= event_start:
-                free_slots.append({
-                    "start": current_time.isoformat(),
-                    "end": (current_time + slot_duration).isoformat()
-                })
-                current_time += datetime.timedelta(minutes=30)
-            
-            # Move current time to after this event
-            current_time = event_end
-        
-        # Add any remaining slots after the last event
-        while current_time + slot_duration <= end_of_day:
-            free_slots.append({
-                "start": current_time.isoformat(),
-                "end": (current_time + slot_duration).isoformat()
-            })
-            current_time += datetime.timedelta(minutes=30)
+    # Same search as the range variant, for a one-day range
+    windows = [(start_of_day.timestamp(), end_of_day.timestamp())]
+    free_slots = format_slots(find_free_slots(busy, windows, duration), timezone)
     
-    return jsonify({
+    return conditional_response({
         "success": True, 
         "slots": free_slots,
         "message": f"Found {len(free_slots)} available time slots for the requested date and duration"
-    })
+    }, etag)
+
+# Find available slots over a range of days in one pass
+def get_available_slots_in_range():
+    """
+    Range variant of /available-slots.
+    Query params: start_date, end_date ("YYYY-MM-DD", inclusive), duration,
+    granularity (minutes between candidate starts, default 30), limit
+    (return only the first N slots) and calendars (comma-separated ids).
+    """
+    try:
+        duration_match = re.search(r'\d+', request.args.get('duration', ''))
+        if not duration_match:
+            return jsonify({"success": False, "error": "Invalid duration format"})
+        duration = int(duration_match.group())
+        granularity = request.args.get('granularity', 30, type=int)
+        limit = request.args.get('limit', type=int)
+
+        start_date = datetime.datetime.strptime(request.args['start_date'], "%Y-%m-%d").date()
+        end_date = datetime.datetime.strptime(
+            request.args.get('end_date', request.args['start_date']), "%Y-%m-%d").date()
+        if end_date < start_date:
+            return jsonify({"success": False, "error": "end_date must not be before start_date"})
+        if granularity <= 0:
+            return jsonify({"success": False, "error": "granularity must be positive"})
+
+        # Working-hour window for every day in the range
+        timezone = pytz.timezone(TIMEZONE)
+        windows = []
+        day = start_date
+        while day <= end_date:
+            open_time = timezone.localize(datetime.datetime.combine(day, datetime.time(WORKING_HOURS[0], 0)))
+            close_time = timezone.localize(datetime.datetime.combine(day, datetime.time(WORKING_HOURS[1], 0)))
+            windows.append((open_time.timestamp(), close_time.timestamp()))
+            day += datetime.timedelta(days=1)
+
+        if request.args.get('top'):
+            return get_ranked_slots(windows, duration, granularity)
+
+        # Busy intervals for the whole range in one lookup
+        range_start = datetime.datetime.fromtimestamp(windows[0][0], timezone)
+        range_end = datetime.datetime.fromtimestamp(windows[-1][1], timezone)
+        calendar_ids = get_calendar_ids_arg()
+        etag = request_etag(range_start, range_end) if answered_by_mirror(calendar_ids) else None
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        busy = get_busy_intervals(range_start, range_end, calendar_ids, **({} if etag else get_freshness_args()))
+
+        free_slots = format_slots(find_free_slots(busy, windows, duration, granularity, limit), timezone)
+
+        return conditional_response({
+            "success": True,
+            "slots": free_slots,
+            "message": f"Found {len(free_slots)} available time slots between {start_date} and {end_date}"
+        }, etag)
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+# Rank free slots and return only the best few
+def get_ranked_slots(windows, duration, granularity):
+    """
+    /available-slots with top=N: the N best non-overlapping slots, best first.
+    Query params: buffer_before, buffer_after (minutes kept free next to other
+    meetings), preferred_hours and focus_hours ("HH:MM-HH:MM,..."); unset
+    ones fall back to the SLOT_* settings of slot_ranking.py.
+    """
+    try:
+        top = request.args.get('top', type=int)
+        if not top or top <= 0:
+            return jsonify({"success": False, "error": "top must be a positive integer"})
+        preferences = SlotPreferences(
+            buffer_before=request.args.get('buffer_before', BUFFER_BEFORE, type=int),
+            buffer_after=request.args.get('buffer_after', BUFFER_AFTER, type=int),
+            preferred_hours=parse_hours(request.args['preferred_hours']) if 'preferred_hours' in request.args else None,
+            focus_hours=parse_hours(request.args['focus_hours']) if 'focus_hours' in request.args else None)
+        if preferences.buffer_before < 0 or preferences.buffer_after < 0:
+            return jsonify({"success": False, "error": "Buffers must not be negative"})
+
+        # Widened by the buffers, so meetings just outside working hours still keep their distance
+        timezone = pytz.timezone(TIMEZONE)
+        range_start = datetime.datetime.fromtimestamp(windows[0][0] - preferences.buffer_before * 60, timezone)
+        range_end = datetime.datetime.fromtimestamp(windows[-1][1] + preferences.buffer_after * 60, timezone)
+        calendar_ids = get_calendar_ids_arg()
+        etag = request_etag(range_start, range_end) if answered_by_mirror(calendar_ids) else None
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        busy = get_busy_intervals(range_start, range_end, calendar_ids, **({} if etag else get_freshness_args()))
+
+        ranked = top_slots(score_slots(busy, windows, duration, timezone, preferences, granularity), top)
+        slots = [
+            {
+                "start": datetime.datetime.fromtimestamp(start, timezone).isoformat(),
+                "end": datetime.datetime.fromtimestamp(end, timezone).isoformat(),
+                "score": round(score, 1)
+            }
+            for score, start, end in ranked
+        ]
+
+        return conditional_response({
+            "success": True,
+            "slots": slots,
+            "message": f"Found the {len(slots)} best time slots for the requested dates and duration"
+        }, etag)
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+@app.route('/check-specific-availability', methods=['GET'])
+def check_specific_availability():
+    """
+    Checks whether a slot is free.
+    Query params: datetime ("YYYY-MM-DDTHH:MM"), duration (minutes) and
+    calendars (comma-separated ids, default primary).
+    """
+    try:
+        start_time = parse_local_datetime(request.args['datetime'])
+        duration_match = re.search(r'\d+', request.args.get('duration', '60'))
+        if not duration_match:
+            return jsonify({"success": False, "error": "Invalid duration format"})
+        end_time = start_time + datetime.timedelta(minutes=int(duration_match.group()))
+
+        calendar_ids = get_calendar_ids_arg()
+        etag = request_etag(start_time, end_time) if answered_by_mirror(calendar_ids) else None
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        available, reason = check_availability(start_time, end_time, calendar_ids=calendar_ids)
+        return conditional_response({"success": True, "available": available, "reason": reason}, etag)
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+@app.route('/group-availability', methods=['GET'])
+def group_availability():
+    """
+    Finds times when every attendee is free.
+    Query params: attendees (comma-separated calendar ids, e.g. emails),
+    start_date/end_date ("YYYY-MM-DD", inclusive), duration and granularity
+    (minutes, default 15) and limit. Each calendar-day becomes a 1440-bit busy
+    bitmap; the attendees' bitmaps are ORed together and ANDed with working
+    hours, so the search costs the same for 2 attendees or 50.
+    """
+    try:
+        attendees = [attendee.strip() for attendee in request.args.get('attendees', '').split(',') if attendee.strip()]
+        if not attendees:
+            return jsonify({"success": False, "error": "attendees is required"})
+        duration_match = re.search(r'\d+', request.args.get('duration', ''))
+        if not duration_match:
+            return jsonify({"success": False, "error": "Invalid duration format"})
+        duration = int(duration_match.group())
+        granularity = request.args.get('granularity', 15, type=int)
+        limit = request.args.get('limit', type=int)
+        if granularity <= 0:
+            return jsonify({"success": False, "error": "granularity must be positive"})
+
+        start_date = datetime.datetime.strptime(request.args['start_date'], "%Y-%m-%d").date()
+        end_date = datetime.datetime.strptime(
+            request.args.get('end_date', request.args['start_date']), "%Y-%m-%d").date()
+        if end_date < start_date:
+            return jsonify({"success": False, "error": "end_date must not be before start_date"})
+
+        # Local midnights bounding each day of the range
+        timezone = pytz.timezone(TIMEZONE)
+        days = [start_date + datetime.timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+        midnights = [timezone.localize(datetime.datetime.combine(day, datetime.time(0, 0))) for day in days]
+        range_end = timezone.localize(datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time(0, 0)))
+
+        etag = request_etag(midnights[0], range_end) if answered_by_mirror(attendees) else None
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        busy_by_calendar = get_busy_by_calendar(midnights[0], range_end, attendees,
+                                                **({} if etag else get_freshness_args()))
+        bitmaps = busy_bitmaps([busy_by_calendar.get(attendee, []) for attendee in attendees],
+                               [midnight.timestamp() for midnight in midnights])
+        free = free_bitmaps(bitmaps, minute_mask(WORKING_HOURS[0] * 60, WORKING_HOURS[1] * 60))
+        runs = free_runs(free, duration)
+
+        def local_time(day_index, minute):
+            return datetime.datetime.fromtimestamp(midnights[day_index].timestamp() + minute * 60, timezone).isoformat()
+
+        free_slots = [
+            {"start": local_time(day, minute), "end": local_time(day, minute + duration)}
+            for day, minute in slots_in_runs(runs, duration, granularity, limit)
+        ]
+        free_windows = [
+            {"start": local_time(day, int(start)), "end": local_time(day, int(end))}
+            for day, start, end in zip(*runs)
+        ]
+
+        return conditional_response({
+            "success": True,
+            "slots": free_slots,
+            "free_windows": free_windows,
+            "message": f"Found {len(free_slots)} slots when all {len(attendees)} attendees are free "
+                       f"between {start_date} and {end_date}"
+        }, etag)
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
 
 @app.route('/delete', methods=['DELETE'])
 def delete_event_route():
     data = request.json
     try:
         event_id = data['event_id']
+        if wants_async_write(data):
+            return enqueue_write('delete', {"event_id": event_id}, "Event deletion queued")
         success, message = delete_event(event_id)
         if success:
             return jsonify({"success": True, "message": message})
@@ -221,34 +751,24 @@ def get_events_by_date():
         start_of_day = timezone.localize(start_of_day)
         end_of_day = timezone.localize(end_of_day)
         
-        service = get_calendar_service()
-        
-        # Get all events for the day
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=start_of_day.isoformat(),
-            timeMax=end_of_day.isoformat(),
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
+        etag = request_etag(start_of_day, end_of_day)
+        cached = not_modified(etag)
+        if cached:
+            return cached
         
-        events = events_result.get('items', [])
+        # Get all events for the day (request_etag has already synced the mirror)
+        events = get_store_events(start_of_day, end_of_day)
         
         # Format events for the response
         events_list = []
         for event in events:
-            events_list.append({
-                "id": event['id'],
-                "start_time": event['start'].get('dateTime', event['start'].get('date')),
-                "end_time": event['end'].get('dateTime', event['end'].get('date')),
-                "description": event.get('summary', 'No description')
-            })
+            events_list.append(format_event(event))
         
-        return jsonify({
+        return conditional_response({
             "success": True, 
             "slots": events_list,
             "message": f"Found {len(events_list)} events for {date_str}"
-        })
+        }, etag)
     
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
@@ -263,133 +783,297 @@ def get_events_by_datetime():
         # Add timezone information
         timezone = pytz.timezone(TIMEZONE)
         event_datetime = timezone.localize(event_datetime)
+        event_ts = int(event_datetime.timestamp())
         
         # Create a small window around the requested time
         start_time = event_datetime - datetime.timedelta(minutes=1)
         end_time = event_datetime + datetime.timedelta(minutes=1)
         
-        service = get_calendar_service()
+        etag = request_etag(start_time, end_time)
+        cached = not_modified(etag)
+        if cached:
+            return cached
         
         # Get events that may be happening at the requested time
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=start_time.isoformat(),
-            timeMax=end_time.isoformat(),
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        
-        events = events_result.get('items', [])
+        events = get_store_events(start_time, end_time)
         
         # Format events for the response
         events_list = []
         for event in events:
-            event_start = parser.parse(event['start'].get('dateTime', event['start'].get('date')))
-            event_end = parser.parse(event['end'].get('dateTime', event['end'].get('date')))
-            
             # Only include events that actually overlap with the requested time
-            if event_start <= event_datetime <= event_end:
-                events_list.append({
-                    "id": event['id'],
-                    "start_time": event['start'].get('dateTime', event['start'].get('date')),
-                    "end_time": event['end'].get('dateTime', event['end'].get('date')),
-                    "description": event.get('summary', 'No description')
-                })
+            if event.start <= event_ts <= event.end:
+                events_list.append(format_event(event))
         
         if events_list:
             message = f"Found {len(events_list)} event(s) at the specified time"
         else:
             message = "No events found at the specified time"
             
-        return jsonify({
+        return conditional_response({
             "success": True, 
             "slots": events_list,
             "message": message
-        })
+        }, etag)
     
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
-    
+
+# Pages of formatted events over a window, from the mirror or straight from the API
+def event_pages(time_min, time_max, calendar_id='primary', limit=None, fields=None, **freshness):
+    """
+    Yields lists of format_event() dicts ordered by start, reduced to `fields`
+    if given, and stops after `limit` events. The primary calendar is read
+    from the mirror (freshness: get_freshness_args()); other calendars page
+    through events.list, each page handed on as soon as it arrives and no
+    page requested once the limit is reached.
+    """
+    def select(event):
+        formatted = format_event(event)
+        return {field: formatted[field] for field in fields} if fields else formatted
+
+    if calendar_id == 'primary':
+        events = itertools.islice(get_store_events(time_min, time_max, **freshness), limit)
+        yield from iter_chunks(map(select, events), min(limit or STREAM_PAGE_SIZE, STREAM_PAGE_SIZE))
+        return
+    timezone = pytz.timezone(TIMEZONE)
+    remaining = limit
+    pages = iter_event_pages(get_calendar_service(), page_size=min(limit or DEFAULT_PAGE_SIZE, DEFAULT_PAGE_SIZE),
+                             calendarId=calendar_id, timeMin=time_min.isoformat(), timeMax=time_max.isoformat(),
+                             singleEvents=True, orderBy='startTime')
+    for page in pages:
+        events = [Event.from_google(item, timezone) for item in page.get('items', []) if item.get('status') != 'cancelled']
+        if remaining is not None:
+            events = events[:remaining]
+            remaining -= len(events)
+        yield [select(event) for event in events]
+        if remaining == 0:
+            return
+
+# Parse one end of a /get-events-by-range window
+def parse_range_bound(value, is_end=False):
+    """A datetime ("YYYY-MM-DDTHH:MM") is taken as is; a date covers its whole day, so an end date is inclusive."""
+    if 'T' in value:
+        return parse_local_datetime(value)
+    day = datetime.datetime.strptime(value, "%Y-%m-%d")
+    if is_end:
+        day += datetime.timedelta(days=1)
+    return pytz.timezone(TIMEZONE).localize(day)
+
+@app.route('/get-events-by-range', methods=['GET'])
+def get_events_by_range():
+    """
+    Events overlapping [start, end), by start time, in one read instead of one per day.
+    Query params: start, end ("YYYY-MM-DD" for whole days, end inclusive, or
+    "YYYY-MM-DDTHH:MM"; start_date/end_date are accepted too), fields
+    (comma-separated subset of id, start_time, end_time, description),
+    limit (only the first N events) and calendar (another calendar's id,
+    read through the API instead of the mirror).
+    The Accept header picks the format: application/x-ndjson streams one event
+    per line and application/msgpack one msgpack object per event (when the
+    msgpack package is installed); anything else gets one JSON document.
+    Streams are gzipped when Accept-Encoding allows it. They start with the
+    first page of events, and an error after that ends them with an
+    {"error": ...} record.
+    """
+    media_type = negotiate(request.accept_mimetypes)
+    if media_type is None:
+        return jsonify({"success": False, "error": "Supported types: application/json, application/x-ndjson, "
+                                                   "application/msgpack"}), 406
+    try:
+        start = request.args.get('start') or request.args['start_date']
+        end = request.args.get('end') or request.args.get('end_date') or start.split('T')[0]
+        time_min = parse_range_bound(start)
+        time_max = parse_range_bound(end, is_end=True)
+        if time_max <= time_min:
+            return jsonify({"success": False, "error": "end must be after start"})
+        fields = [field.strip() for field in request.args['fields'].split(',')] if request.args.get('fields') else None
+        if fields and not set(fields) <= set(EVENT_FIELDS):
+            return jsonify({"success": False, "error": f"fields must be among {', '.join(EVENT_FIELDS)}"})
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit <= 0:
+            return jsonify({"success": False, "error": "limit must be positive"})
+        calendar_id = request.args.get('calendar', 'primary')
+
+        if media_type == JSON:
+            etag = request_etag(time_min, time_max) if calendar_id == 'primary' else None
+            cached = not_modified(etag)
+            if cached:
+                return cached
+            events_list = [event for page in event_pages(time_min, time_max, calendar_id, limit, fields)
+                           for event in page]
+            return conditional_response({
+                "success": True,
+                "slots": events_list,
+                "message": f"Found {len(events_list)} events between {start} and {end}"
+            }, etag)
+
+        pages = event_pages(time_min, time_max, calendar_id, limit, fields, **get_freshness_args())
+        # Wait for the first page, so a failing query still gets an error status
+        first = next(pages, [])
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+    def stream():
+        yield first
+        try:
+            yield from pages
+        except Exception as e:
+            yield [{"error": str(e)}]
+
+    compress = wants_gzip(request.accept_encodings)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(encode_pages(stream(), media_type, compress)),
+                    mimetype=media_type, headers=headers)
+
+# Run a pipeline stage and record how long it took
+def timed_stage(timings, name, fn, *args, **kwargs):
+    started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+
+# Fetch an event's current state from Google
+def fetch_event(event_id):
+    event = get_calendar_service().events().get(calendarId='primary', eventId=event_id).execute()
+    return Event.from_google(event, pytz.timezone(TIMEZONE))
+
+# Patch an event only if it still has the ETag we validated against
+def patch_event_if_match(event_id, body, etag):
+    patch_request = get_calendar_service().events().patch(calendarId='primary', eventId=event_id, body=body)
+    if etag:
+        patch_request.headers['If-Match'] = etag
+    return patch_request.execute()
+
 @app.route('/update-event', methods=['PUT'])
 def update_event():
+    """
+    Moves an event to a new start time/duration.
+    The event's ETag comes from the local mirror when it is there; otherwise
+    events.get runs concurrently with the conflict check. The write is a
+    patch guarded by If-Match, so a concurrent edit is reported instead of
+    overwritten; occurrences expanded locally have no ETag and are patched
+    unguarded. Per-stage timings are returned in milliseconds.
+    """
     data = request.json
+    timings = {}
     try:
         event_id = data['event_id']
-        new_start_time = datetime.datetime.fromisoformat(data['new_start_time'])
+        new_start_time = parse_local_datetime(data['new_start_time'])
         new_end_time = new_start_time + datetime.timedelta(minutes=int(data['duration']))
-        
-        # Convert to the correct timezone
-        tz = pytz.timezone(TIMEZONE)
-        new_start_time = tz.localize(new_start_time)
-        new_end_time = tz.localize(new_end_time)
 
         # Check if the new time is within working hours
-        within_hours, reason = is_within_working_hours(new_start_time, new_end_time)
+        within_hours, reason = timed_stage(
+            timings, "validate_ms", is_within_working_hours, new_start_time, new_end_time)
         if not within_hours:
-            return jsonify({"success": False, "error": reason})
+            return jsonify({"success": False, "error": reason, "timings": timings})
 
-        service = get_calendar_service()
-
-        # Get the current event details
-        event = service.events().get(calendarId='primary', eventId=event_id).execute()
+        # Get the current ETag from the mirror, or fetch it while we check conflicts
+        event = event_store.get_event(event_id)
+        fetch_future = None
+        if event is None:
+            fetch_future = stage_executor.submit(
+                copy_current_request_context(timed_stage), timings, "fetch_ms", fetch_event, event_id)
 
         # Check if the new time slot is available before updating
-        is_available, reason = check_availability(new_start_time, new_end_time)
-        if not is_available:
-            return jsonify({"success": False, "error": reason})
-
-        # Update the event with new times
-        event['start'] = {
-            'dateTime': new_start_time.isoformat(),
-            'timeZone': TIMEZONE,
-        }
-        event['end'] = {
-            'dateTime': new_end_time.isoformat(),
-            'timeZone': TIMEZONE,
-        }
+        busy = timed_stage(timings, "conflict_check_ms", get_busy_intervals,
+                           new_start_time, new_end_time, exclude_event_id=event_id)
+        if fetch_future is not None:
+            event = fetch_future.result()
+        if busy:
+            return jsonify({"success": False, "error": "Time slot conflicts with an existing event", "timings": timings})
+        if queued_conflict(new_start_time, new_end_time, exclude_event_id=event_id):
+            return jsonify({"success": False, "error": "Time slot conflicts with a queued change", "timings": timings})
 
+        # Patch only the fields that change
+        body = event_time_fields(new_start_time, new_end_time)
         if 'description' in data:
-            event['description'] = data['description']
-            event['summary'] = data['description']
+            body['description'] = data['description']
+            body['summary'] = data['description']
 
-        updated_event = service.events().update(calendarId='primary', eventId=event_id, body=event).execute()
+        if wants_async_write(data):
+            return enqueue_write('patch', {
+                "event_id": event_id, "body": body, "etag": event.etag if event else None,
+                "start_ts": int(new_start_time.timestamp()), "end_ts": int(new_end_time.timestamp()),
+            }, "Event update queued")
+
+        try:
+            updated_event = timed_stage(timings, "patch_ms", patch_event_if_match, event_id, body, event.etag)
+        except HttpError as e:
+            if e.resp.status != 412:
+                raise
+            if fetch_future is not None:
+                return jsonify({"success": False, "error": "Event was modified by someone else, please retry", "timings": timings})
+            # The mirror's ETag was stale; retry once against the live event
+            event = timed_stage(timings, "fetch_ms", fetch_event, event_id)
+            updated_event = timed_stage(timings, "patch_retry_ms", patch_event_if_match, event_id, body, event.etag)
+        event_store.upsert_event(updated_event)
 
         return jsonify({
             "success": True,
             "message": "Event updated successfully",
-            "event_id": updated_event['id']
+            "event_id": updated_event['id'],
+            "timings": timings
         })
 
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)})
+        return jsonify({"success": False, "error": str(e), "timings": timings})
 
 @app.route('/add', methods=['POST'])
 def quick_add_event():
-    """Endpoint to quickly add an event using Google Calendar's quickAdd feature"""
+    """
+    Endpoint to add an event.
+    With start_time ("YYYY-MM-DDTHH:MM") and duration (minutes), working hours
+    and conflicts are checked locally and the event is created with a single
+    events.insert. Free text in description alone falls back to quickAdd.
+    """
     data = request.json
     try:
-        
-        # TODO: Make sure to send this thing as input
-        # # Check if the new time slot is available before updating
-        # is_available, reason = check_availability(new_start_time, new_end_time)
-        # if not is_available:
-        #     return jsonify({"success": False, "error": reason})
-        
-        text = data['description']  # E.g. "Meeting with John tomorrow at 3pm"
-        
         service = get_calendar_service()
-        created_event = service.events().quickAdd(
-            calendarId='primary',
-            text=text
-        ).execute()
-        
-        start_time = created_event['start']['dateTime']
-        end_time = created_event['end']['dateTime']
-        
-        within_hours, reason = is_within_working_hours(start_time, end_time)
-        if not within_hours:
-            service.events().delete(calendarId='primary', eventId=created_event['id']).execute()
-            return jsonify({"success": False, "reason": reason})
+
+        if data.get('start_time'):
+            start_time = parse_local_datetime(data['start_time'])
+            duration_match = re.search(r'\d+', str(data.get('duration', '60')))
+            if not duration_match:
+                return jsonify({"success": False, "error": "Invalid duration format"})
+            end_time = start_time + datetime.timedelta(minutes=int(duration_match.group()))
+
+            body = event_time_fields(start_time, end_time)
+            body['summary'] = data.get('description', 'No description')
+            if wants_async_write(data):
+                return enqueue_write('insert', {
+                    "body": body,
+                    "start_ts": int(start_time.timestamp()), "end_ts": int(end_time.timestamp()),
+                }, "Event creation queued", validate=lambda: check_availability(start_time, end_time))
+
+            # Validate before writing so a rejected request costs no API calls
+            is_available, reason = check_availability(start_time, end_time)
+            if not is_available:
+                return jsonify({"success": False, "error": reason})
+
+            created_event = service.events().insert(calendarId='primary', body=body).execute()
+        else:
+            text = data['description']  # E.g. "Meeting with John tomorrow at 3pm"
+            
+            created_event = service.events().quickAdd(
+                calendarId='primary',
+                text=text
+            ).execute()
+            
+            timezone = pytz.timezone(TIMEZONE)
+            record = Event.from_google(created_event, timezone)
+            
+            # quickAdd only tells us the time after creating the event, so check it afterwards
+            is_available, reason = check_availability(
+                record.start_datetime().astimezone(timezone), record.end_datetime().astimezone(timezone),
+                exclude_event_id=record.id)
+            if not is_available:
+                service.events().delete(calendarId='primary', eventId=created_event['id']).execute()
+                return jsonify({"success": False, "error": reason})
+
+        event_store.upsert_event(created_event)
         
         return jsonify({
             "success": True,
@@ -405,5 +1089,288 @@ def quick_add_event():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
+# Turn one /batch operation into a Calendar API request
+def build_batch_request(service, operation, pending):
+    """
+    Validates an operation locally and returns the HttpRequest to send.
+    `pending` holds the intervals already accepted in this batch, so two
+    operations in one request cannot claim the same slot.
+    Raises ValueError with a user-facing reason if the operation is rejected.
+    """
+    op = operation.get('op')
+    if op == 'delete':
+        return service.events().delete(calendarId='primary', eventId=operation['event_id'])
+
+    if op not in ('create', 'update'):
+        raise ValueError(f"Unknown op: {op}")
+
+    start_key = 'start_time' if op == 'create' else 'new_start_time'
+    start_time = parse_local_datetime(operation[start_key])
+    end_time = start_time + datetime.timedelta(minutes=int(operation.get('duration', 60)))
+
+    is_available, reason = check_availability(start_time, end_time, exclude_event_id=operation.get('event_id'))
+    if not is_available:
+        raise ValueError(reason)
+    if not pending.is_free(start_time.timestamp(), end_time.timestamp()):
+        raise ValueError("Time slot conflicts with another operation in this batch")
+    pending.add(operation.get('event_id') or id(operation), start_time.timestamp(), end_time.timestamp())
+
+    body = event_time_fields(start_time, end_time)
+    if op == 'create':
+        body['summary'] = operation.get('description', 'No description')
+        return service.events().insert(calendarId='primary', body=body)
+
+    if 'description' in operation:
+        body['description'] = operation['description']
+        body['summary'] = operation['description']
+    return service.events().patch(calendarId='primary', eventId=operation['event_id'], body=body)
+
+@app.route('/batch', methods=['POST'])
+def batch_events():
+    """
+    Runs many create/update/delete operations through Calendar batch requests.
+    Body: {"operations": [
+        {"op": "create", "start_time": "...", "duration": 60, "description": "..."},
+        {"op": "update", "event_id": "...", "new_start_time": "...", "duration": 30},
+        {"op": "delete", "event_id": "..."}
+    ]}
+    Operations are sent in batches of up to 50; results are reported per item.
+    """
+    data = request.json
+    try:
+        operations = data['operations']
+        service = get_calendar_service()
+
+        results = [None] * len(operations)
+        api_requests = []
+        pending = BusyIndex()
+        for index, operation in enumerate(operations):
+            try:
+                api_requests.append((index, build_batch_request(service, operation, pending)))
+            except Exception as e:
+                results[index] = {"index": index, "op": operation.get('op'), "success": False, "error": str(e)}
+
+        for index, (response, exception) in execute_batch(service, api_requests).items():
+            operation = operations[index]
+            if exception is not None:
+                results[index] = {"index": index, "op": operation['op'], "success": False, "error": str(exception)}
+                continue
+
+            if operation['op'] == 'delete':
+                event_store.remove_event(operation['event_id'])
+                event_id = operation['event_id']
+            else:
+                event_store.upsert_event(response)
+                event_id = response['id']
+            results[index] = {"index": index, "op": operation['op'], "success": True, "event_id": event_id}
+
+        succeeded = sum(1 for result in results if result["success"])
+        return jsonify({
+            "success": True,
+            "results": results,
+            "message": f"{succeeded} of {len(operations)} operations succeeded "
+                       f"in {-(-len(api_requests) // MAX_BATCH_SIZE)} batch request(s)"
+        })
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+@app.route('/export.ics', methods=['GET'])
+def export_ics():
+    """
+    Streams the primary calendar as an iCalendar file.
+    Optional start_date/end_date ("YYYY-MM-DD", inclusive) limit it to events
+    overlapping those days. Events are read one events.list page at a time
+    and written out as they arrive, so memory use does not grow with the
+    calendar; recurring series are exported once, with their rules.
+    """
+    try:
+        timezone = pytz.timezone(TIMEZONE)
+        params = {"calendarId": 'primary', "singleEvents": False}
+        if request.args.get('start_date'):
+            start_date = datetime.datetime.strptime(request.args['start_date'], "%Y-%m-%d")
+            params["timeMin"] = timezone.localize(start_date).isoformat()
+        if request.args.get('end_date'):
+            end_date = datetime.datetime.strptime(request.args['end_date'], "%Y-%m-%d") + datetime.timedelta(days=1)
+            params["timeMax"] = timezone.localize(end_date).isoformat()
+
+        events = iter_events(get_calendar_service(), page_size=2500, **params)
+        # Fetch the first page now, so a failing query is answered with an error rather than a truncated file
+        first = next(events, None)
+        chunks = export_calendar(itertools.chain([first] if first else [], events), TIMEZONE)
+        return Response(stream_with_context(chunks), mimetype='text/calendar',
+                        headers={"Content-Disposition": 'attachment; filename="calendar.ics"'})
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+# Import one batch of parsed events, retrying items that hit transient errors
+def import_batch(service, bodies):
+    """
+    Sends events.import requests for [(index, body)] through batch requests.
+    Returns {index: (event, error)}; an error is still retryable if it is an
+    HttpError that is_retryable() accepts after IMPORT_MAX_ATTEMPTS attempts.
+    """
+    results = {}
+    pending = bodies
+    for attempt in range(1, IMPORT_MAX_ATTEMPTS + 1):
+        api_requests = [(index, service.events().import_(calendarId='primary', body=body)) for index, body in pending]
+        retry = []
+        for index, (response, exception) in execute_batch(service, api_requests).items():
+            results[index] = (response, exception)
+            if exception is not None and is_retryable(exception):
+                retry.append(index)
+        if not retry or attempt == IMPORT_MAX_ATTEMPTS:
+            break
+        time.sleep(backoff_delay(attempt))
+        pending = [(index, body) for index, body in pending if index in retry]
+    return results
+
+@app.route('/import.ics', methods=['POST'])
+def import_ics():
+    """
+    Imports an iCalendar file sent as the request body into the primary calendar.
+    The file is parsed as it is read and its VEVENTs are sent through
+    events.import in batches of up to 50. The response streams one NDJSON
+    progress line per batch. Pass import_id to resume an interrupted import:
+    the events already processed are skipped. events.import matches events
+    by UID, so sending some of them again updates rather than duplicates.
+    """
+    try:
+        user_id = current_user_id()
+        import_id = request.args.get('import_id') or uuid.uuid4().hex
+        # Ownership is checked before anything is written, so another user's import is never touched
+        existing = import_log.get(import_id)
+        if existing is not None and existing['user_id'] != user_id:
+            return jsonify({"success": False, "error": "Import not found"}), 404
+        progress = import_log.start(import_id, user_id)
+        if progress['status'] == 'completed':
+            return jsonify({"success": True, "import": progress, "message": "Import already completed"})
+        service = get_calendar_service()
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+    def line(current, **extra):
+        return json.dumps({**{key: value for key, value in current.items() if key != 'user_id'}, **extra}) + '\n'
+
+    def run():
+        current = progress
+        yield line(current, resumed_from=current['processed'])
+        try:
+            vevents = itertools.islice(iter_vevents(iter_lines(request.stream)), current['processed'], None)
+            while True:
+                chunk = list(itertools.islice(vevents, MAX_BATCH_SIZE))
+                if not chunk:
+                    break
+                bodies, errors = [], []
+                for index, properties in enumerate(chunk):
+                    try:
+                        bodies.append((index, vevent_to_google(properties, TIMEZONE)))
+                    except Exception as e:
+                        errors.append({"event": current['processed'] + index, "error": str(e)})
+
+                imported, stop = [], None
+                for index, (response, exception) in sorted(import_batch(service, bodies).items()):
+                    if exception is None:
+                        imported.append(response)
+                    elif is_retryable(exception):
+                        stop = (index, exception)
+                        break
+                    else:
+                        errors.append({"event": current['processed'] + index, "error": str(exception)})
+                event_store.upsert_events(imported)
+
+                if stop:
+                    # Record progress up to the event that kept failing, so resuming starts there
+                    index, exception = stop
+                    errors = [error for error in errors if error["event"] < current['processed'] + index]
+                    current = import_log.record(import_id, index, len(imported), len(errors), errors,
+                                                status='interrupted')
+                    yield line(current, error=str(exception))
+                    return
+                current = import_log.record(import_id, len(chunk), len(imported), len(errors), errors)
+                yield line(current)
+
+            current = import_log.record(import_id, 0, 0, 0, status='completed')
+            yield line(current)
+        except Exception as e:
+            current = import_log.record(import_id, 0, 0, 0, status='interrupted')
+            yield line(current, error=str(e))
+
+    return Response(stream_with_context(run()), mimetype='application/x-ndjson')
+
+@app.route('/imports/<import_id>', methods=['GET'])
+def import_status(import_id):
+    """Reports an ICS import: status (running, interrupted, completed) and events processed, imported and failed."""
+    progress = import_log.get(import_id)
+    if progress is None or progress['user_id'] != current_user_id():
+        return jsonify({"success": False, "error": "Import not found"}), 404
+    progress.pop('user_id')
+    return jsonify({"success": True, "import": progress})
+
+@app.route('/calendar-webhook', methods=['POST'])
+def calendar_webhook():
+    """Receives events.watch notifications; the changes are pulled in the background."""
+    accepted, reason = watch_manager.handle_notification(request.headers)
+    if not accepted:
+        return jsonify({"success": False, "error": reason}), 403
+    return jsonify({"success": True, "message": reason})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Reports a queued write: status (queued, running, retrying, succeeded, failed), attempts, result and last error."""
+    job = write_queue.get(job_id)
+    if job is None or job['user_id'] != current_user_id():
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    job.pop('user_id')
+    return jsonify({"success": True, "job": job})
+
+@app.route('/client-stats', methods=['GET'])
+def client_stats():
+    """Reports service cache hits, token refresh counters and FreeBusy cache hits."""
+    return jsonify({
+        "success": True,
+        "stats": calendar_client.stats(),
+        "freebusy_cache": {"hits": freebusy_cache.hits, "misses": freebusy_cache.misses},
+        "user_pool": user_pool.stats(),
+        "write_queue": write_queue.counts(),
+        "rate_limit": rate_limiter.stats(),
+        "payloads": PAYLOAD_STATS.snapshot(),
+        "watch": watch_manager.stats()
+    })
+
+# Exported on every /metrics scrape from the counters the components already keep
+def component_metrics():
+    client = calendar_client.stats()
+    pool = user_pool.stats()
+    buckets = rate_limiter.stats()["buckets"]
+    yield from cache_samples({
+        "freebusy": (default_tenant.freebusy_cache.hits, default_tenant.freebusy_cache.misses),
+        "calendar_service": (client["service_hits"], client["service_builds"]),
+        "calendar_connection": (client["connection_hits"], client["connection_builds"]),
+        "user_pool": (pool["hits"], pool["misses"]),
+    })
+    yield ('user_pool_users', 'gauge', "Users with a warm client", [({}, pool["users"])])
+    yield ('write_queue_jobs', 'gauge', "Queued writes by status",
+           [({"status": status}, count) for status, count in write_queue.counts().items()])
+    yield ('rate_limit_wait_seconds_total', 'counter', "Time spent waiting for API quota",
+           [({"bucket": key, "priority": priority}, bucket[priority]["wait_seconds"])
+            for key, bucket in buckets.items() for priority in ('interactive', 'background')])
+    yield ('rate_limited_total', 'counter', "Rate-limit errors returned by the API",
+           [({"bucket": key}, bucket["rate_limited"]) for key, bucket in buckets.items()])
+    yield ('mirror_age_seconds', 'gauge', "Seconds since the default mirror last synced",
+           [({}, default_tenant.event_store.age)])
+    payloads = [({"route": route, "method": method}, row) for route, method, row in PAYLOAD_STATS.rows()]
+    yield ('calendar_responses_total', 'counter', "Calendar API responses decoded, by route and method",
+           [(labels, row["calls"]) for labels, row in payloads])
+    yield ('calendar_response_bytes_total', 'counter', "Decoded size of Calendar API responses",
+           [(labels, row["bytes"]) for labels, row in payloads])
+    yield ('calendar_response_decode_seconds_total', 'counter', "Time spent decoding Calendar API responses",
+           [(labels, row["decode_seconds"]) for labels, row in payloads])
+    yield ('calendar_responses_over_budget_total', 'counter', "Calendar API responses larger than their route's budget",
+           [(labels, row["over_budget"]) for labels, row in payloads])
+
+REGISTRY.add_collector(component_metrics)
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,525 @@
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import urllib.parse
+import contextlib
+import datetime
+import httpx
+import pytz
+from email.parser import BytesParser
+from email.policy import HTTP
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.middleware import Middleware
+from calendar_client import CalendarClientManager
+from scheduling import (SCOPES, TIMEZONE, WORKING_HOURS, is_within_working_hours,
+                        parse_local_datetime, event_time_fields, format_event)
+from slots import find_free_slots, format_slots
+from busy_index import BusyIndex
+from batch import MAX_BATCH_SIZE
+from event_record import Event, parse_timestamp
+from payloads import PAYLOAD_STATS, current_route, field_mask, route_override
+
+# Configuration
+CALENDAR_API_URL = os.getenv('CALENDAR_API_URL', 'https://www.googleapis.com/calendar/v3')
+# Batch endpoint; Google serves it as /batch/calendar/v3 next to the API itself
+CALENDAR_BATCH_URL = os.getenv('CALENDAR_BATCH_URL', re.sub(r'/calendar/v3/?$', '/batch/calendar/v3', CALENDAR_API_URL))
+MAX_UPSTREAM_CONCURRENCY = int(os.getenv('MAX_UPSTREAM_CONCURRENCY', '20'))
+UPSTREAM_TIMEOUT = float(os.getenv('UPSTREAM_TIMEOUT', '15'))
+PAGE_SIZE = 250
+
+
+class AsyncCalendarAPI:
+    """
+    Minimal async client for the Calendar v3 REST API.
+
+    Every upstream request waits on one semaphore, so a burst of incoming
+    requests cannot open more than MAX_UPSTREAM_CONCURRENCY calls to Google.
+    The OAuth token comes from the process-wide CalendarClientManager, whose
+    background thread keeps it fresh.
+    """
+
+    def __init__(self, base_url=CALENDAR_API_URL, max_concurrency=MAX_UPSTREAM_CONCURRENCY):
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._client = None
+        self.in_flight = 0
+        self.calls = 0
+
+    async def start(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._client = httpx.AsyncClient(base_url=self.base_url, timeout=UPSTREAM_TIMEOUT)
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def _headers(self, headers=None):
+        token = await asyncio.to_thread(calendar_client.get_access_token)
+        # httpx already sends Accept-Encoding: gzip; Google also wants "gzip" in the user agent
+        request_headers = {"Authorization": f"Bearer {token}", "User-Agent": "calendar-bot (gzip)"}
+        request_headers.update(headers or {})
+        return request_headers
+
+    async def _send(self, method, url, **kwargs):
+        async with self._semaphore:
+            self.in_flight += 1
+            self.calls += 1
+            try:
+                response = await self._client.request(method, url, **kwargs)
+            finally:
+                self.in_flight -= 1
+        response.raise_for_status()
+        return response
+
+    async def request(self, method, path, method_id, headers=None, **kwargs):
+        """Calls the API asking only for method_id's fields (see payloads.py) and records the response size."""
+        request_headers = await self._headers(headers)
+        route = current_route()
+        mask = field_mask(route, method_id)
+        if mask:
+            kwargs['params'] = {**kwargs.get('params', {}), "fields": mask}
+        response = await self._send(method, path, headers=request_headers, **kwargs)
+        start = time.perf_counter()
+        result = response.json() if response.content else {}
+        PAYLOAD_STATS.record(route, method_id, len(response.content), time.perf_counter() - start,
+                             'gzip' in response.headers.get('content-encoding', ''))
+        return result
+
+    async def batch(self, calls):
+        """
+        Sends (method, path, method_id, body) calls as multipart batch requests of up
+        to MAX_BATCH_SIZE calls each. Returns (result, exception) per call, in order,
+        with exception None for calls that succeeded.
+        """
+        results = []
+        for start in range(0, len(calls), MAX_BATCH_SIZE):
+            results.extend(await self._batch(calls[start:start + MAX_BATCH_SIZE]))
+        return results
+
+    async def _batch(self, calls):
+        route = current_route()
+        prefix = urllib.parse.urlparse(self.base_url).path
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for index, (method, path, method_id, body) in enumerate(calls):
+            mask = field_mask(route, method_id)
+            target = prefix + path + (f"?{urllib.parse.urlencode({'fields': mask})}" if mask else '')
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-Transfer-Encoding: binary\r\n"
+                f"Content-ID: <{index}>\r\n\r\n{method} {target} HTTP/1.1\r\n"
+                f"Content-Type: application/json\r\n\r\n{json.dumps(body) if body is not None else ''}\r\n")
+        headers = await self._headers({"Content-Type": f"multipart/mixed; boundary={boundary}"})
+        response = await self._send("POST", CALENDAR_BATCH_URL, headers=headers,
+                                    content=''.join(parts) + f"--{boundary}--\r\n")
+
+        # One application/http part per call, matched back by Content-ID <response-N>
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + response.headers['content-type'].encode() + b'\r\n\r\n' + response.content)
+        results = [(None, RuntimeError("No response in batch"))] * len(calls)
+        for part in message.iter_parts():
+            index = int((part['Content-ID'] or '').strip('<>').rpartition('-')[2])
+            head, _, content = part.get_payload(decode=True).partition(b'\r\n\r\n')
+            status = int(head.split(b' ', 2)[1])
+            start = time.perf_counter()
+            result = json.loads(content) if content.strip() else {}
+            PAYLOAD_STATS.record(route, calls[index][2], len(content), time.perf_counter() - start, False)
+            if status >= 400:
+                error = result.get('error', {}).get('message') or f"HTTP {status}"
+                results[index] = (None, RuntimeError(f"{status} {error}"))
+            else:
+                results[index] = (result, None)
+        return results
+
+    async def iter_events(self, calendar_id='primary', **params):
+        """Async generator over events.list, following nextPageToken lazily."""
+        params = {"maxResults": PAGE_SIZE, **params}
+        while True:
+            page = await self.request("GET", f"/calendars/{calendar_id}/events", 'calendar.events.list', params=params)
+            for event in page.get('items', []):
+                yield event
+            if not page.get('nextPageToken'):
+                return
+            params["pageToken"] = page['nextPageToken']
+
+    async def list_events(self, time_min, time_max, calendar_id='primary'):
+        """Returns the events in [time_min, time_max) decoded to Event records."""
+        timezone = pytz.timezone(TIMEZONE)
+        return [Event.from_google(event, timezone) async for event in self.iter_events(
+            calendar_id, timeMin=time_min.isoformat(), timeMax=time_max.isoformat(),
+            singleEvents="true", orderBy="startTime")]
+
+    async def get_event(self, event_id, calendar_id='primary'):
+        return await self.request("GET", f"/calendars/{calendar_id}/events/{event_id}", 'calendar.events.get')
+
+    async def insert_event(self, body, calendar_id='primary'):
+        return await self.request("POST", f"/calendars/{calendar_id}/events", 'calendar.events.insert', json=body)
+
+    async def quick_add(self, text, calendar_id='primary'):
+        return await self.request("POST", f"/calendars/{calendar_id}/events/quickAdd", 'calendar.events.quickAdd',
+                                  params={"text": text})
+
+    async def patch_event(self, event_id, body, etag=None, calendar_id='primary'):
+        headers = {"If-Match": etag} if etag else None
+        return await self.request("PATCH", f"/calendars/{calendar_id}/events/{event_id}", 'calendar.events.patch',
+                                  headers=headers, json=body)
+
+    async def delete_event(self, event_id, calendar_id='primary'):
+        return await self.request("DELETE", f"/calendars/{calendar_id}/events/{event_id}", 'calendar.events.delete')
+
+    async def busy_intervals(self, calendar_ids, time_min, time_max):
+        """Returns sorted (start_ts, end_ts) busy intervals across calendars from one freeBusy call."""
+        response = await self.request("POST", "/freeBusy", 'calendar.freebusy.query', json={
+            "timeMin": time_min.isoformat(),
+            "timeMax": time_max.isoformat(),
+            "timeZone": TIMEZONE,
+            "items": [{"id": calendar_id} for calendar_id in calendar_ids],
+        })
+        busy = []
+        for calendar_id, entry in response.get('calendars', {}).items():
+            if entry.get('errors'):
+                raise ValueError(f"FreeBusy lookup failed for {calendar_id}: {entry['errors'][0].get('reason', 'unknown')}")
+            busy.extend((parse_timestamp(interval['start']), parse_timestamp(interval['end']))
+                        for interval in entry.get('busy', []))
+        return sorted(busy)
+
+
+# Only the OAuth token is used here; its background thread keeps it fresh
+calendar_client = CalendarClientManager(SCOPES)
+calendar_api = AsyncCalendarAPI()
+
+
+# Shared request helpers
+def error_response(e):
+    return JSONResponse({"success": False, "error": str(e)})
+
+def parse_duration(value):
+    duration_match = re.search(r'\d+', str(value or ''))
+    if not duration_match:
+        raise ValueError("Invalid duration format")
+    return int(duration_match.group())
+
+def get_calendar_ids(query_params):
+    calendars = query_params.get('calendars', '')
+    return [calendar_id.strip() for calendar_id in calendars.split(',') if calendar_id.strip()] or ['primary']
+
+def working_window(day, timezone):
+    start = timezone.localize(datetime.datetime.combine(day, datetime.time(WORKING_HOURS[0], 0)))
+    end = timezone.localize(datetime.datetime.combine(day, datetime.time(WORKING_HOURS[1], 0)))
+    return start, end
+
+async def conflicting_events(start_time, end_time, exclude_event_id=None):
+    events = await calendar_api.list_events(start_time, end_time)
+    return [event for event in events if event.id != exclude_event_id]
+
+async def check_availability(start_time, end_time, exclude_event_id=None, calendar_ids=('primary',)):
+    within_hours, reason = is_within_working_hours(start_time, end_time)
+    if not within_hours:
+        return False, reason
+    if exclude_event_id:
+        # FreeBusy cannot leave out the event being moved
+        if await conflicting_events(start_time, end_time, exclude_event_id):
+            return False, "Time slot conflicts with an existing event"
+        return True, "Time slot is available"
+    busy = await calendar_api.busy_intervals(list(calendar_ids), start_time, end_time)
+    if any(start < end_time.timestamp() and end > start_time.timestamp() for start, end in busy):
+        return False, "Time slot conflicts with an existing event"
+    return True, "Time slot is available"
+
+
+# Routes
+async def available_slots(request):
+    """Same contract as the Flask /available-slots, answered from one freeBusy call."""
+    try:
+        params = request.query_params
+        duration = parse_duration(params.get('duration'))
+        timezone = pytz.timezone(TIMEZONE)
+        calendar_ids = get_calendar_ids(params)
+
+        if params.get('start_date'):
+            start_date = datetime.datetime.strptime(params['start_date'], "%Y-%m-%d").date()
+            end_date = datetime.datetime.strptime(params.get('end_date', params['start_date']), "%Y-%m-%d").date()
+            granularity = int(params.get('granularity', 30))
+            limit = int(params['limit']) if params.get('limit') else None
+            windows = []
+            day = start_date
+            while day <= end_date:
+                open_time, close_time = working_window(day, timezone)
+                windows.append((open_time.timestamp(), close_time.timestamp()))
+                day += datetime.timedelta(days=1)
+            busy = await calendar_api.busy_intervals(
+                calendar_ids, working_window(start_date, timezone)[0], working_window(end_date, timezone)[1])
+            free_slots = format_slots(find_free_slots(busy, windows, duration, granularity, limit), timezone)
+            message = f"Found {len(free_slots)} available time slots between {start_date} and {end_date}"
+        else:
+            date = datetime.datetime.strptime(params['date'], "%Y-%m-%d").date()
+            start_of_day, end_of_day = working_window(date, timezone)
+            busy = await calendar_api.busy_intervals(calendar_ids, start_of_day, end_of_day)
+            windows = [(start_of_day.timestamp(), end_of_day.timestamp())]
+            free_slots = format_slots(find_free_slots(busy, windows, duration), timezone)
+            message = f"Found {len(free_slots)} available time slots for the requested date and duration"
+
+        return JSONResponse({"success": True, "slots": free_slots, "message": message})
+    except Exception as e:
+        return error_response(e)
+
+async def check_specific_availability(request):
+    try:
+        params = request.query_params
+        start_time = parse_local_datetime(params['datetime'])
+        end_time = start_time + datetime.timedelta(minutes=parse_duration(params.get('duration', '60')))
+        available, reason = await check_availability(start_time, end_time, calendar_ids=get_calendar_ids(params))
+        return JSONResponse({"success": True, "available": available, "reason": reason})
+    except Exception as e:
+        return error_response(e)
+
+async def get_events_by_date(request):
+    date_str = request.query_params.get('date')
+    try:
+        date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
+        timezone = pytz.timezone(TIMEZONE)
+        start_of_day = timezone.localize(datetime.datetime.combine(date, datetime.time(0, 0)))
+        end_of_day = timezone.localize(datetime.datetime.combine(date, datetime.time(23, 59, 59)))
+
+        events_list = [format_event(event) for event in await calendar_api.list_events(start_of_day, end_of_day)]
+        return JSONResponse({
+            "success": True,
+            "slots": events_list,
+            "message": f"Found {len(events_list)} events for {date_str}"
+        })
+    except Exception as e:
+        return error_response(e)
+
+async def get_events_by_datetime(request):
+    try:
+        event_datetime = pytz.timezone(TIMEZONE).localize(
+            datetime.datetime.strptime(request.query_params.get('datetime'), "%Y-%m-%dT%H:%M"))
+        event_ts = int(event_datetime.timestamp())
+        events = await calendar_api.list_events(
+            event_datetime - datetime.timedelta(minutes=1), event_datetime + datetime.timedelta(minutes=1))
+
+        events_list = []
+        for event in events:
+            if event.start <= event_ts <= event.end:
+                events_list.append(format_event(event))
+
+        message = (f"Found {len(events_list)} event(s) at the specified time" if events_list
+                   else "No events found at the specified time")
+        return JSONResponse({"success": True, "slots": events_list, "message": message})
+    except Exception as e:
+        return error_response(e)
+
+async def update_event(request):
+    """Fetches the event and checks conflicts concurrently, then patches with If-Match."""
+    try:
+        data = await request.json()
+        event_id = data['event_id']
+        new_start_time = parse_local_datetime(data['new_start_time'])
+        new_end_time = new_start_time + datetime.timedelta(minutes=int(data['duration']))
+
+        within_hours, reason = is_within_working_hours(new_start_time, new_end_time)
+        if not within_hours:
+            return JSONResponse({"success": False, "error": reason})
+
+        event, conflicts = await asyncio.gather(
+            calendar_api.get_event(event_id),
+            conflicting_events(new_start_time, new_end_time, exclude_event_id=event_id))
+        if conflicts:
+            return JSONResponse({"success": False, "error": "Time slot conflicts with an existing event"})
+
+        body = event_time_fields(new_start_time, new_end_time)
+        if 'description' in data:
+            body['description'] = data['description']
+            body['summary'] = data['description']
+        try:
+            updated_event = await calendar_api.patch_event(event_id, body, etag=event.get('etag'))
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 412:
+                raise
+            return JSONResponse({"success": False, "error": "Event was modified by someone else, please retry"})
+
+        return JSONResponse({"success": True, "message": "Event updated successfully", "event_id": updated_event['id']})
+    except Exception as e:
+        return error_response(e)
+
+async def add_event(request):
+    try:
+        data = await request.json()
+        if data.get('start_time'):
+            start_time = parse_local_datetime(data['start_time'])
+            end_time = start_time + datetime.timedelta(minutes=parse_duration(data.get('duration', '60')))
+            is_available, reason = await check_availability(start_time, end_time)
+            if not is_available:
+                return JSONResponse({"success": False, "error": reason})
+            body = event_time_fields(start_time, end_time)
+            body['summary'] = data.get('description', 'No description')
+            created_event = await calendar_api.insert_event(body)
+        else:
+            created_event = await calendar_api.quick_add(data['description'])
+            timezone = pytz.timezone(TIMEZONE)
+            record = Event.from_google(created_event, timezone)
+            is_available, reason = await check_availability(
+                record.start_datetime().astimezone(timezone), record.end_datetime().astimezone(timezone),
+                exclude_event_id=record.id)
+            if not is_available:
+                await calendar_api.delete_event(created_event['id'])
+                return JSONResponse({"success": False, "error": reason})
+
+        return JSONResponse({
+            "success": True,
+            "message": "Event created successfully",
+            "event_id": created_event['id'],
+            "event_details": {
+                "summary": created_event.get('summary', 'No title'),
+                "start": created_event['start'].get('dateTime', created_event['start'].get('date')),
+                "end": created_event['end'].get('dateTime', created_event['end'].get('date'))
+            }
+        })
+    except Exception as e:
+        return error_response(e)
+
+async def delete_event(request):
+    try:
+        data = await request.json()
+        await calendar_api.delete_event(data['event_id'])
+        return JSONResponse({"success": True, "message": "Event deleted successfully"})
+    except Exception as e:
+        return JSONResponse({"success": False, "error": f"Error deleting event: {str(e)}"})
+
+# Check one /batch operation and turn it into a batch call
+async def check_batch_operation(operation):
+    """
+    Validates an operation against the calendar and returns (start_time, end_time),
+    or None for deletes. Raises ValueError with a user-facing reason if rejected.
+    """
+    op = operation.get('op')
+    if op == 'delete':
+        return None
+    if op not in ('create', 'update'):
+        raise ValueError(f"Unknown op: {op}")
+
+    start_key = 'start_time' if op == 'create' else 'new_start_time'
+    start_time = parse_local_datetime(operation[start_key])
+    end_time = start_time + datetime.timedelta(minutes=int(operation.get('duration', 60)))
+    is_available, reason = await check_availability(start_time, end_time, exclude_event_id=operation.get('event_id'))
+    if not is_available:
+        raise ValueError(reason)
+    return start_time, end_time
+
+def batch_call(operation, bounds):
+    if operation['op'] == 'delete':
+        return "DELETE", f"/calendars/primary/events/{operation['event_id']}", 'calendar.events.delete', None
+    body = event_time_fields(*bounds)
+    if operation['op'] == 'create':
+        body['summary'] = operation.get('description', 'No description')
+        return "POST", "/calendars/primary/events", 'calendar.events.insert', body
+    if 'description' in operation:
+        body['description'] = operation['description']
+        body['summary'] = operation['description']
+    return "PATCH", f"/calendars/primary/events/{operation['event_id']}", 'calendar.events.patch', body
+
+async def batch_events(request):
+    """
+    Same contract as the Flask /batch. Operations are checked against the
+    calendar concurrently, then accepted in order: `pending` holds the
+    intervals already accepted, so two operations cannot claim the same slot.
+    Accepted ones go upstream in batch requests of up to 50.
+    """
+    try:
+        operations = (await request.json())['operations']
+        checks = await asyncio.gather(*(check_batch_operation(operation) for operation in operations),
+                                      return_exceptions=True)
+
+        results = [None] * len(operations)
+        accepted, calls = [], []
+        pending = BusyIndex()
+        for index, (operation, bounds) in enumerate(zip(operations, checks)):
+            try:
+                if isinstance(bounds, Exception):
+                    raise bounds
+                if bounds is not None:
+                    start_ts, end_ts = bounds[0].timestamp(), bounds[1].timestamp()
+                    if not pending.is_free(start_ts, end_ts):
+                        raise ValueError("Time slot conflicts with another operation in this batch")
+                    pending.add(operation.get('event_id') or index, start_ts, end_ts)
+                calls.append(batch_call(operation, bounds))
+                accepted.append(index)
+            except Exception as e:
+                results[index] = {"index": index, "op": operation.get('op'), "success": False, "error": str(e)}
+
+        for index, (response, exception) in zip(accepted, await calendar_api.batch(calls)):
+            operation = operations[index]
+            if exception is not None:
+                results[index] = {"index": index, "op": operation['op'], "success": False, "error": str(exception)}
+            else:
+                event_id = operation['event_id'] if operation['op'] == 'delete' else response['id']
+                results[index] = {"index": index, "op": operation['op'], "success": True, "event_id": event_id}
+
+        succeeded = sum(1 for result in results if result["success"])
+        return JSONResponse({
+            "success": True,
+            "results": results,
+            "message": f"{succeeded} of {len(operations)} operations succeeded "
+                       f"in {-(-len(calls) // MAX_BATCH_SIZE)} batch request(s)"
+        })
+    except Exception as e:
+        return error_response(e)
+
+async def client_stats(request):
+    return JSONResponse({
+        "success": True,
+        "stats": calendar_client.stats(),
+        "upstream": {
+            "in_flight": calendar_api.in_flight,
+            "calls": calendar_api.calls,
+            "max_concurrency": calendar_api.max_concurrency,
+        },
+        "payloads": PAYLOAD_STATS.snapshot()
+    })
+
+
+# Names the route of upstream calls for payload stats; every route here is a fixed path
+class PayloadRouteMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        token = route_override.set(scope['path'])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route_override.reset(token)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await calendar_api.start()
+    yield
+    await calendar_api.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/available-slots', available_slots, methods=['GET']),
+        Route('/check-specific-availability', check_specific_availability, methods=['GET']),
+        Route('/get-events-by-date', get_events_by_date, methods=['GET']),
+        Route('/get-events-by-datetime', get_events_by_datetime, methods=['GET']),
+        Route('/update-event', update_event, methods=['PUT']),
+        Route('/add', add_event, methods=['POST']),
+        Route('/delete', delete_event, methods=['DELETE']),
+        Route('/batch', batch_events, methods=['POST']),
+        Route('/client-stats', client_stats, methods=['GET']),
+    ],
+    middleware=[Middleware(PayloadRouteMiddleware)],
+    lifespan=lifespan,
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='127.0.0.1', port=int(os.getenv('PORT', '5000')))
@@ -0,0 +1,31 @@
+import rate_limit
+from metrics import track_upstream
+
+# Configuration
+MAX_BATCH_SIZE = 50  # Calendar API limit on requests per batch
+
+
+# Send many Calendar API requests in as few HTTP round trips as possible
+def execute_batch(service, requests):
+    """
+    Executes (key, HttpRequest) pairs through new_batch_http_request, at most
+    MAX_BATCH_SIZE per batch. Returns {key: (response, exception)} where
+    exception is None for items that succeeded.
+    """
+    results = {}
+
+    def callback(request_id, response, exception):
+        results[request_id] = (response, exception)
+
+    for start in range(0, len(requests), MAX_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=callback)
+        chunk = requests[start:start + MAX_BATCH_SIZE]
+        for key, api_request in chunk:
+            batch.add(api_request, request_id=str(key))
+        # Each request in a batch counts against the quota separately
+        rate_limit.acquire_for(api_request for _, api_request in chunk)
+        with track_upstream('google_calendar', 'batch'):
+            batch.execute()
+
+    return {key: results.get(str(key), (None, RuntimeError("No response in batch")))
+            for key, _ in requests}
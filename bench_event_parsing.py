@@ -0,0 +1,95 @@
+import json
+import time
+import argparse
+import datetime
+import tracemalloc
+import pytz
+from dateutil import parser
+from event_record import Event
+
+TIMEZONE = "Asia/Kolkata"
+
+
+# Generate events shaped like events.list items
+def make_events(count):
+    timezone = pytz.timezone(TIMEZONE)
+    base = timezone.localize(datetime.datetime(2025, 3, 10, 9, 0))
+    events = []
+    for index in range(count):
+        start = base + datetime.timedelta(minutes=30 * index)
+        if index % 20 == 0:
+            day = start.date()
+            times = {'start': {'date': day.isoformat()},
+                     'end': {'date': (day + datetime.timedelta(days=1)).isoformat()}}
+        else:
+            times = {'start': {'dateTime': start.isoformat(), 'timeZone': TIMEZONE},
+                     'end': {'dateTime': (start + datetime.timedelta(minutes=30)).isoformat(), 'timeZone': TIMEZONE}}
+        events.append({
+            'kind': 'calendar#event',
+            'etag': f'"{3000000000000000 + index}"',
+            'id': f'event{index:06d}',
+            'status': 'confirmed',
+            'htmlLink': f'https://www.google.com/calendar/event?eid=event{index:06d}',
+            'created': '2025-03-01T10:00:00.000Z',
+            'updated': '2025-03-01T10:00:00.000Z',
+            'summary': f'Meeting {index}',
+            'creator': {'email': 'me@example.com', 'self': True},
+            'organizer': {'email': 'me@example.com', 'self': True},
+            'iCalUID': f'event{index:06d}@google.com',
+            'sequence': 0,
+            'reminders': {'useDefault': True},
+            'eventType': 'default',
+            **times,
+        })
+    return events
+
+
+# The per-event decoding the routes did before Event records
+def dateutil_bounds(event):
+    start = parser.parse(event['start'].get('dateTime', event['start'].get('date')))
+    end = parser.parse(event['end'].get('dateTime', event['end'].get('date')))
+    return start, end
+
+
+def time_it(fn, events, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for event in events:
+            fn(event)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def measure_memory(build):
+    """Returns (result, bytes still allocated by build())."""
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Compare dict + dateutil events with compact Event records.")
+    arg_parser.add_argument('--events', type=int, default=10000)
+    arg_parser.add_argument('--rounds', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    events = make_events(args.events)
+    payload = json.dumps(events)
+    timezone = pytz.timezone(TIMEZONE)
+
+    dateutil_time = time_it(dateutil_bounds, events, args.rounds)
+    record_time = time_it(lambda event: Event.from_google(event, timezone), events, args.rounds)
+
+    dicts, dict_bytes = measure_memory(lambda: json.loads(payload))
+    del dicts
+    records, record_bytes = measure_memory(lambda: [Event.from_google(event, timezone) for event in events])
+    del records
+
+    print(f"{args.events} events, best of {args.rounds} rounds")
+    print(f"  parse   dateutil: {dateutil_time * 1000:8.1f} ms   Event.from_google: {record_time * 1000:8.1f} ms"
+          f"   ({dateutil_time / record_time:.1f}x)")
+    print(f"  memory  dicts:    {dict_bytes / 1024:8.1f} KiB  Event records:     {record_bytes / 1024:8.1f} KiB"
+          f"   ({dict_bytes / record_bytes:.1f}x)")
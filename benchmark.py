@@ -0,0 +1,164 @@
+import os
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import threading
+import requests
+from load_test import drive, summarize
+
+# Load benchmark for app.py routes against fake_calendar_server.py.
+# Either point --target at a running app.py that uses the fake, or pass --spawn
+# to run the fake server and app.py in this process (--asgi: async_app.py instead).
+
+DEFAULT_MIX = "available-slots=3,get-events-by-date=3,update-event=1,add=1,delete=1"
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(','):
+        route, _, weight = item.partition('=')
+        weights[route.strip()] = int(weight or 1)
+    return weights
+
+
+def serve_in_thread(wsgi_app, port):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', port, wsgi_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def spawn(fake_port, app_port, asgi=False):
+    """Starts the fake Calendar API and app.py, or async_app.py with asgi, wired to it on local ports."""
+    import fake_calendar_server
+    serve_in_thread(fake_calendar_server.app, fake_port)
+
+    os.environ['CALENDAR_API_ROOT'] = f"http://127.0.0.1:{fake_port}/"
+    os.environ['CALENDAR_API_URL'] = f"http://127.0.0.1:{fake_port}/calendar/v3"
+    os.environ['CALENDAR_FAKE_AUTH'] = '1'
+    os.environ.setdefault('EVENT_STORE_PATH', ':memory:')
+    # The fake has no quota; measure the app rather than the rate limiter unless asked to
+    os.environ.setdefault('RATE_LIMIT_QPS', '0')
+    if not asgi:
+        import app
+        serve_in_thread(app.app, app_port)
+        return
+
+    import uvicorn
+    import async_app
+    threading.Thread(target=uvicorn.run, args=(async_app.app,),
+                     kwargs={"host": '127.0.0.1', "port": app_port, "log_level": 'warning'}, daemon=True).start()
+    # uvicorn binds its port from its own thread; wait until it answers
+    for _ in range(100):
+        try:
+            requests.get(f"http://127.0.0.1:{app_port}/client-stats", timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError("async_app.py did not start")
+
+
+def prepare(fake_url, args, deletes_needed):
+    """Resets the fake, sets latency/errors and seeds events for reads, updates and deletes."""
+    requests.post(f"{fake_url}/_fake/reset").raise_for_status()
+    requests.post(f"{fake_url}/_fake/config", json={"latency_ms": 0, "jitter_ms": 0, "error_rate": 0}).raise_for_status()
+
+    seeded = requests.post(f"{fake_url}/_fake/seed", json={
+        "start_date": args.start_date, "days": args.days, "per_day": args.per_day, "duration": 30,
+    }).json()["events"]
+
+    # Deletes consume their own events, on days the other routes never touch
+    delete_start = datetime.date.fromisoformat(args.start_date) + datetime.timedelta(days=args.days + 400)
+    delete_pool = requests.post(f"{fake_url}/_fake/seed", json={
+        "start_date": delete_start.isoformat(), "days": deletes_needed // 8 + 1, "per_day": 8, "duration": 30,
+    }).json()["events"] if deletes_needed else []
+
+    requests.post(f"{fake_url}/_fake/config", json={
+        "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate,
+    }).raise_for_status()
+    return seeded, [event["id"] for event in delete_pool]
+
+
+def make_request_factory(args, seeded, delete_ids):
+    weights = parse_mix(args.mix)
+    routes = [route for route, weight in weights.items() for _ in range(weight)]
+    start_date = datetime.date.fromisoformat(args.start_date)
+    add_start = start_date + datetime.timedelta(days=args.days + 1)
+    rng = random.Random(args.seed)
+    moves = {}
+
+    def make_request(index):
+        route = routes[index % len(routes)]
+        day = start_date + datetime.timedelta(days=rng.randrange(args.days))
+        if route == 'available-slots':
+            return route, 'GET', '/available-slots', {"date": day.isoformat(), "duration": "30"}, None
+        if route == 'get-events-by-date':
+            return route, 'GET', '/get-events-by-date', {"date": day.isoformat()}, None
+        if route == 'update-event':
+            event = seeded[index % len(seeded)]
+            # Alternate each event between its seeded start and 30 minutes later
+            shift = 30 if moves.get(event["id"], 0) % 2 == 0 else 0
+            moves[event["id"]] = moves.get(event["id"], 0) + 1
+            new_start = datetime.datetime.fromisoformat(event["start"]) + datetime.timedelta(minutes=shift)
+            return route, 'PUT', '/update-event', None, {
+                "event_id": event["id"], "new_start_time": new_start.strftime("%Y-%m-%dT%H:%M"), "duration": 30}
+        if route == 'add':
+            # Every add gets its own free half hour
+            slot = index // len(routes)
+            start = datetime.datetime.combine(add_start + datetime.timedelta(days=slot // 14), datetime.time(10, 0)) \
+                + datetime.timedelta(minutes=30 * (slot % 14))
+            return route, 'POST', '/add', None, {
+                "start_time": start.strftime("%Y-%m-%dT%H:%M"), "duration": "30", "description": f"Benchmark {index}"}
+        if route == 'delete':
+            return route, 'DELETE', '/delete', None, {"event_id": delete_ids.pop() if delete_ids else "missing"}
+        raise ValueError(f"Unknown route in mix: {route}")
+
+    return make_request
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark app.py routes against the fake Calendar API.")
+    arg_parser.add_argument('--target', default="http://127.0.0.1:5050", help="Base URL of app.py")
+    arg_parser.add_argument('--fake-url', default="http://127.0.0.1:8085", help="Base URL of fake_calendar_server.py")
+    arg_parser.add_argument('--spawn', action='store_true', help="Run the fake server and app.py in this process")
+    arg_parser.add_argument('--asgi', action='store_true', help="With --spawn, run async_app.py instead of app.py")
+    arg_parser.add_argument('--mix', default=DEFAULT_MIX, help="route=weight pairs")
+    arg_parser.add_argument('--concurrency', type=int, default=20)
+    arg_parser.add_argument('--requests', type=int, default=1000)
+    arg_parser.add_argument('--latency-ms', type=float, default=50, help="Injected upstream latency")
+    arg_parser.add_argument('--jitter-ms', type=float, default=10)
+    arg_parser.add_argument('--error-rate', type=float, default=0.0, help="Injected upstream error rate")
+    arg_parser.add_argument('--start-date', default=(datetime.date.today() + datetime.timedelta(days=1)).isoformat())
+    arg_parser.add_argument('--days', type=int, default=20)
+    arg_parser.add_argument('--per-day', type=int, default=4)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    if args.spawn:
+        spawn(int(args.fake_url.rsplit(':', 1)[1]), int(args.target.rsplit(':', 1)[1]), asgi=args.asgi)
+
+    weights = parse_mix(args.mix)
+    deletes_needed = args.requests * weights.get('delete', 0) // sum(weights.values()) + 1
+    seeded, delete_ids = prepare(args.fake_url, args, deletes_needed)
+
+    latencies, errors, elapsed = asyncio.run(drive(
+        args.target, make_request_factory(args, seeded, delete_ids), args.concurrency, args.requests))
+
+    print(f"{'route':<20}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    all_latencies = []
+    for route in weights:
+        if route not in latencies:
+            continue
+        all_latencies.extend(latencies[route])
+        result = summarize(latencies[route], errors.get(route, 0), elapsed)
+        print(f"{route:<20}{result['requests']:>9}{result['errors']:>8}{result['throughput_rps']:>9}"
+              f"{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}")
+    result = summarize(all_latencies, sum(errors.values()), elapsed)
+    print(f"{'total':<20}{result['requests']:>9}{result['errors']:>8}{result['throughput_rps']:>9}"
+          f"{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}")
+
+
+if __name__ == '__main__':
+    main()
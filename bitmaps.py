@@ -0,0 +1,83 @@
+import numpy as np
+
+MINUTES_PER_DAY = 1440
+BYTES_PER_DAY = MINUTES_PER_DAY // 8  # One packed bit per minute
+
+
+# Pack busy intervals into one 1440-bit bitmap per (calendar, day)
+def busy_bitmaps(busy_by_calendar, day_starts):
+    """
+    busy_by_calendar: list, one entry per calendar, of (start_ts, end_ts) intervals
+    day_starts: epoch seconds of each local midnight, in order
+    Returns uint8 array of shape (calendars, days, 180); bit m of a day is set
+    when any interval touches minute m (bounds rounded outwards).
+    """
+    calendars, days = len(busy_by_calendar), len(day_starts)
+    width = MINUTES_PER_DAY + 1  # Spare column absorbs ends at midnight
+    owners = np.repeat(np.arange(calendars), [len(busy) for busy in busy_by_calendar])
+    if not len(owners) or not days:
+        return np.zeros((calendars, days, BYTES_PER_DAY), dtype=np.uint8)
+
+    intervals = np.array([interval for busy in busy_by_calendar for interval in busy], dtype=np.float64)
+    day_starts = np.asarray(day_starts, dtype=np.float64)
+    range_end = day_starts[-1] + MINUTES_PER_DAY * 60
+    inside = (intervals[:, 1] > day_starts[0]) & (intervals[:, 0] < range_end)
+    owners, intervals = owners[inside], intervals[inside]
+
+    # One (interval, day) pair per day an interval touches; most touch only one
+    first = np.maximum(np.searchsorted(day_starts, intervals[:, 0], side='right') - 1, 0)
+    last = np.searchsorted(day_starts, intervals[:, 1], side='left') - 1
+    counts = last - first + 1
+    pair = np.repeat(np.arange(len(intervals)), counts)
+    day = first[pair] + np.arange(len(pair)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    # Minute bounds within each day, rounded outwards and clipped to the day
+    starts = np.clip(np.floor((intervals[pair, 0] - day_starts[day]) / 60), 0, MINUTES_PER_DAY).astype(np.int64)
+    ends = np.clip(np.ceil((intervals[pair, 1] - day_starts[day]) / 60), 0, MINUTES_PER_DAY).astype(np.int64)
+    row = (owners[pair] * days + day) * width
+
+    # Difference array: +1 at each start, -1 at each end, summed along the day
+    size = calendars * days * width
+    diff = np.bincount(row + starts, minlength=size) - np.bincount(row + ends, minlength=size)
+    busy = np.cumsum(diff.reshape(calendars, days, width), axis=2)[:, :, :MINUTES_PER_DAY] > 0
+    return np.packbits(busy, axis=2)
+
+
+def minute_mask(open_minute, close_minute):
+    """Packed bitmap with minutes [open_minute, close_minute) set, e.g. working hours."""
+    mask = np.zeros(MINUTES_PER_DAY, dtype=bool)
+    mask[open_minute:close_minute] = True
+    return np.packbits(mask)
+
+
+# Minutes free for everyone: OR the attendees' busy bits, AND with the allowed window
+def free_bitmaps(bitmaps, window_mask):
+    """Returns packed (days, 180) bitmaps of minutes that are inside the window and busy for nobody."""
+    busy = np.bitwise_or.reduce(bitmaps, axis=0)
+    return np.bitwise_and(np.bitwise_not(busy), window_mask)
+
+
+def free_runs(free, min_length):
+    """
+    Finds runs of at least min_length consecutive free minutes.
+    Returns (day_index, start_minute, end_minute) arrays, ordered by day and start.
+    """
+    minutes = np.unpackbits(free, axis=1).astype(np.int8)
+    # +1 where a run starts, -1 just past where it ends
+    edges = np.diff(np.pad(minutes, ((0, 0), (1, 1))), axis=1)
+    start_days, start_minutes = np.nonzero(edges == 1)
+    _, end_minutes = np.nonzero(edges == -1)
+    long_enough = end_minutes - start_minutes >= min_length
+    return start_days[long_enough], start_minutes[long_enough], end_minutes[long_enough]
+
+
+def slots_in_runs(runs, duration, granularity, limit=None):
+    """Yields (day_index, start_minute) for every `duration` slot starting on a `granularity` grid inside the runs."""
+    produced = 0
+    for day, start, end in zip(*runs):
+        first = -(-int(start) // granularity) * granularity  # Round up onto the grid
+        for minute in range(first, int(end) - duration + 1, granularity):
+            if limit is not None and produced >= limit:
+                return
+            produced += 1
+            yield int(day), minute
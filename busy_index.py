@@ -0,0 +1,119 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+
+class BusyIndex:
+    """
+    Sorted-array index of busy intervals for one calendar.
+
+    Intervals are kept ordered by start time next to the longest duration
+    seen. An interval overlapping [start, end) must begin inside
+    (start - longest, end), so one bisect bounds the scan and a query costs
+    O(log n + k) where k is the number of intervals starting in that window.
+    Recurring occurrences are not stored; `recurring(start, end)`, when set,
+    supplies them per query as (start, end, event_id) from cached expansions.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._starts = []     # Sorted start timestamps
+        self._entries = []    # (start, end, event_id), parallel to _starts
+        self._by_id = {}      # event_id -> (start, end)
+        self._longest = 0.0   # Only grows between rebuilds, which keeps queries correct
+        self.recurring = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def rebuild(self, intervals):
+        """Replaces the index with (event_id, start, end) tuples."""
+        entries = sorted((start, end, event_id) for event_id, start, end in intervals)
+        with self._lock:
+            self._entries = entries
+            self._starts = [entry[0] for entry in entries]
+            self._by_id = {event_id: (start, end) for start, end, event_id in entries}
+            self._longest = max((end - start for start, end, _ in entries), default=0.0)
+
+    def add(self, event_id, start, end):
+        """Adds or moves an interval."""
+        with self._lock:
+            self._discard(event_id)
+            entry = (start, end, event_id)
+            position = bisect_right(self._entries, entry)
+            self._entries.insert(position, entry)
+            self._starts.insert(position, start)
+            self._by_id[event_id] = (start, end)
+            self._longest = max(self._longest, end - start)
+
+    def remove(self, event_id):
+        """Removes an interval if present."""
+        with self._lock:
+            self._discard(event_id)
+
+    def _discard(self, event_id):
+        bounds = self._by_id.pop(event_id, None)
+        if bounds is None:
+            return
+        entry = (bounds[0], bounds[1], event_id)
+        position = bisect_left(self._entries, entry)
+        del self._entries[position]
+        del self._starts[position]
+
+    def overlapping(self, start, end, exclude_id=None):
+        """Returns (start, end, event_id) for every interval overlapping [start, end)."""
+        with self._lock:
+            low = bisect_right(self._starts, start - self._longest)
+            high = bisect_left(self._starts, end)
+            found = [
+                entry for entry in self._entries[low:high]
+                if entry[1] > start and entry[2] != exclude_id
+            ]
+        if self.recurring is not None:
+            found.extend(entry for entry in self.recurring(start, end) if entry[2] != exclude_id)
+            found.sort()
+        return found
+
+    def is_free(self, start, end, exclude_id=None):
+        """True if nothing overlaps [start, end)."""
+        with self._lock:
+            low = bisect_right(self._starts, start - self._longest)
+            high = bisect_left(self._starts, end)
+            for entry_start, entry_end, event_id in self._entries[low:high]:
+                if entry_end > start and event_id != exclude_id:
+                    return False
+        if self.recurring is not None:
+            return not any(event_id != exclude_id for _, _, event_id in self.recurring(start, end))
+        return True
+
+
+class BusyIndexRegistry:
+    """One BusyIndex per calendar id, fed by EventStore change notifications."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+
+    def get(self, calendar_id):
+        with self._lock:
+            index = self._indexes.get(calendar_id)
+            if index is None:
+                index = self._indexes[calendar_id] = BusyIndex()
+            return index
+
+    def attach(self, store):
+        """Builds the calendar's index from the store and keeps it updated."""
+        index = self.get(store.calendar_id)
+        index.rebuild(store.iter_bounds())
+        index.recurring = store.recurring_bounds
+
+        def on_change(changed, removed, full):
+            if full:
+                index.rebuild(store.iter_bounds())
+                return
+            for event_id, start, end in changed:
+                index.add(event_id, start, end)
+            for event_id in removed:
+                index.remove(event_id)
+
+        store.add_listener(on_change)
+        return index
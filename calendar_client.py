@@ -0,0 +1,274 @@
+import os
+import json
+import queue
+import datetime
+import threading
+import requests
+from google.auth.credentials import AnonymousCredentials
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest
+from googleapiclient._auth import authorized_http
+
+# Configuration
+TOKEN_FILE = 'token.json'
+CREDENTIALS_FILE = 'credentials.json'
+DISCOVERY_CACHE_FILE = os.getenv('CALENDAR_DISCOVERY_CACHE', 'calendar_v3_discovery.json')
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/calendar/v3/rest"
+REFRESH_MARGIN = datetime.timedelta(minutes=5)  # Refresh this long before the token expires
+REFRESH_RETRY_SECONDS = 30
+# Point the client at another Calendar v3 server, e.g. fake_calendar_server.py
+API_ROOT = os.getenv('CALENDAR_API_ROOT')
+# Skip OAuth entirely; only useful together with a fake API_ROOT
+FAKE_AUTH = os.getenv('CALENDAR_FAKE_AUTH', '') == '1'
+FAKE_ACCESS_TOKEN = 'fake-access-token'  # What raw REST clients send in fake-auth mode
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '16'))  # Idle authorized connections kept per account
+
+
+class PooledHttp:
+    """
+    Thread-safe stand-in for httplib2.Http, shared by every thread using a service.
+
+    httplib2.Http is what makes googleapiclient services unsafe to share, so
+    each call checks an authorized Http out of a queue and returns it after,
+    keeping its open connection for the next caller. A new one is made only
+    when every pooled one is busy; at most `size` idle ones are kept.
+    """
+
+    def __init__(self, credentials, size=HTTP_POOL_SIZE):
+        self.credentials = credentials  # Read by BatchHttpRequest to authorize its parts
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+
+    def request(self, *args, **kwargs):
+        try:
+            http = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            http = authorized_http(self.credentials)
+            reused = False
+        with self._lock:
+            if reused:
+                self.hits += 1
+            else:
+                self.builds += 1
+        try:
+            return http.request(*args, **kwargs)
+        finally:
+            try:
+                self._idle.put_nowait(http)
+            except queue.Full:
+                http.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class CalendarClientManager:
+    """
+    Process-wide owner of the Google Calendar credentials and service objects.
+
+    Credentials are loaded once and refreshed by a background thread before
+    they expire. The discovery document is cached on disk so building a
+    service needs no network. The service is built once and shared by all
+    threads; its PooledHttp hands each call its own connection.
+    """
+
+    def __init__(self, scopes, token_file=TOKEN_FILE, credentials_file=CREDENTIALS_FILE,
+                 discovery_cache_file=DISCOVERY_CACHE_FILE, api_root=API_ROOT, fake_auth=FAKE_AUTH,
+                 request_builder=HttpRequest):
+        self.scopes = scopes
+        self.token_file = token_file
+        self.credentials_file = credentials_file
+        self.discovery_cache_file = discovery_cache_file
+        self.api_root = api_root
+        self.fake_auth = fake_auth
+        self.request_builder = request_builder  # e.g. a RateLimiter builder
+        self._lock = threading.RLock()
+        self._service = None
+        self._http = None
+        self._creds = None
+        self._discovery_doc = None
+        self._refresher = None
+        self._stop = threading.Event()
+        self._counters = {
+            "service_hits": 0,
+            "service_builds": 0,
+            "token_refreshes": 0,
+            "refresh_failures": 0,
+        }
+
+    def get_service(self):
+        """Returns the shared Calendar service, building it on first use."""
+        with self._lock:
+            if self._service is not None:
+                self._counters["service_hits"] += 1
+                return self._service
+            creds = self._get_credentials()
+            self._http = PooledHttp(creds)
+            self._service = build_from_document(self._get_discovery_document(), http=self._http,
+                                                requestBuilder=self.request_builder)
+            self._counters["service_builds"] += 1
+            service = self._service
+        self._start_refresher()
+        return service
+
+    def get_credentials(self):
+        """Returns the shared credentials, loading them if needed."""
+        with self._lock:
+            return self._get_credentials()
+
+    def get_discovery_document(self):
+        """Returns the cached Calendar discovery document, e.g. to build services for other accounts."""
+        with self._lock:
+            return self._get_discovery_document()
+
+    def get_access_token(self):
+        """Returns a valid OAuth access token for raw REST clients."""
+        if self.fake_auth:
+            # Anonymous credentials have no token, and "Bearer " alone is not a valid header
+            return FAKE_ACCESS_TOKEN
+        with self._lock:
+            creds = self._get_credentials()
+            if not creds.valid:
+                creds.refresh(Request())
+                self._save_credentials(creds)
+                self._counters["token_refreshes"] += 1
+            token = creds.token or ''
+        self._start_refresher()
+        return token
+
+    def stats(self):
+        """Returns a snapshot of the service, connection and token counters."""
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["connection_hits"] = self._http.hits if self._http else 0
+            snapshot["connection_builds"] = self._http.builds if self._http else 0
+            expiry = self._creds.expiry if self._creds else None
+        snapshot["token_expiry"] = expiry.isoformat() + "Z" if expiry else None
+        return snapshot
+
+    def shutdown(self):
+        """Stops the background refresh thread."""
+        self._stop.set()
+
+    def _get_credentials(self):
+        # Caller must hold self._lock
+        if self._creds is not None:
+            return self._creds
+
+        if self.fake_auth:
+            self._creds = AnonymousCredentials()
+            return self._creds
+
+        creds = None
+        # The token file stores the user's access and refresh tokens
+        if os.path.exists(self.token_file):
+            creds = Credentials.from_authorized_user_file(self.token_file, self.scopes)
+        # If there are no (valid) credentials available, let the user log in
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+                self._counters["token_refreshes"] += 1
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    self.credentials_file, self.scopes)
+                creds = flow.run_local_server(port=0)
+            self._save_credentials(creds)
+
+        self._creds = creds
+        return creds
+
+    def _save_credentials(self, creds):
+        # Write to a temporary file first so readers never see a partial token
+        tmp_path = f"{self.token_file}.tmp"
+        with open(tmp_path, 'w') as token:
+            token.write(creds.to_json())
+        os.replace(tmp_path, self.token_file)
+
+    def _get_discovery_document(self):
+        # Caller must hold self._lock
+        if self._discovery_doc is not None:
+            return self._discovery_doc
+
+        if os.path.exists(self.discovery_cache_file):
+            with open(self.discovery_cache_file) as f:
+                self._discovery_doc = self._apply_api_root(f.read())
+            return self._discovery_doc
+
+        # googleapiclient >= 2.0 ships static discovery documents
+        try:
+            from googleapiclient.discovery_cache import get_static_doc
+            discovery_doc = get_static_doc('calendar', 'v3')
+        except ImportError:
+            discovery_doc = None
+
+        if not discovery_doc:
+            response = requests.get(DISCOVERY_URL, timeout=10)
+            response.raise_for_status()
+            discovery_doc = response.text
+
+        # Validate before caching so a bad download is never persisted
+        json.loads(discovery_doc)
+        with open(self.discovery_cache_file, 'w') as f:
+            f.write(discovery_doc)
+
+        self._discovery_doc = self._apply_api_root(discovery_doc)
+        return self._discovery_doc
+
+    def _apply_api_root(self, discovery_doc):
+        # rootUrl drives both method URLs and the batch endpoint
+        if not self.api_root:
+            return discovery_doc
+        document = json.loads(discovery_doc)
+        document['rootUrl'] = self.api_root
+        document['baseUrl'] = self.api_root + document['servicePath']
+        return json.dumps(document)
+
+    def _start_refresher(self):
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="calendar-token-refresher", daemon=True)
+            self._refresher.start()
+
+    def _seconds_until_refresh(self):
+        with self._lock:
+            expiry = self._creds.expiry if self._creds else None
+        if expiry is None:
+            return None
+        # google-auth stores expiry as a naive UTC datetime
+        refresh_at = expiry - REFRESH_MARGIN
+        return (refresh_at - datetime.datetime.utcnow()).total_seconds()
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            wait = self._seconds_until_refresh()
+            if wait is None:
+                # Token without expiry never needs a proactive refresh
+                return
+            if wait > 0 and self._stop.wait(wait):
+                return
+
+            with self._lock:
+                try:
+                    self._creds.refresh(Request())
+                    self._save_credentials(self._creds)
+                    self._counters["token_refreshes"] += 1
+                except Exception as e:
+                    self._counters["refresh_failures"] += 1
+                    print(f"Token refresh failed: {str(e)}")
+                    failed = True
+                else:
+                    failed = False
+            if failed and self._stop.wait(REFRESH_RETRY_SECONDS):
+                return
@@ -12,6 +12,13 @@ from crewai import Agent, Crew, Task, Process, LLM
 from crewai.tools import tool
 import ast
 from langchain_google_genai import ChatGoogleGenerativeAI
+from metrics import REGISTRY, UPSTREAM_SECONDS, UPSTREAM_ERRORS, instrument_app, track_upstream, timed, cache_samples
+
+# CrewAI sends its LLM calls through litellm, whose callbacks report each one
+try:
+    import litellm
+except ImportError:
+    litellm = None
 
 # Load environment variables
 load_dotenv()
@@ -19,6 +26,7 @@ load_dotenv()
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+instrument_app(app)  # Per-route latency, in-flight and error metrics, served at /metrics
 
 # API Configuration
 API_BASE_URL = "http://127.0.0.1:5000"
@@ -35,6 +43,28 @@ llm = LLM(model="gemini/gemini-2.0-flash")
 # Conversation history storage
 conversation_history = []
 
+# Last response per read request, revalidated with If-None-Match
+RESPONSE_CACHE_SIZE = 256
+response_cache = {}
+response_cache_stats = {"hits": 0, "misses": 0}
+
+# Time every LLM call made inside a crew, per model
+def record_llm_success(kwargs, completion_response, start_time, end_time):
+    UPSTREAM_SECONDS.labels('llm', kwargs.get('model', 'unknown')).observe((end_time - start_time).total_seconds())
+
+def record_llm_failure(kwargs, completion_response, start_time, end_time):
+    model = kwargs.get('model', 'unknown')
+    UPSTREAM_SECONDS.labels('llm', model).observe((end_time - start_time).total_seconds())
+    UPSTREAM_ERRORS.labels('llm', model, type(kwargs.get('exception')).__name__).inc()
+
+if litellm is not None:
+    litellm.success_callback.append(record_llm_success)
+    litellm.failure_callback.append(record_llm_failure)
+
+REGISTRY.add_collector(lambda: cache_samples({
+    "api_responses": (response_cache_stats["hits"], response_cache_stats["misses"]),
+}))
+
 # 🛠 Utility: Extract JSON using Regex
 def extract_json(text: str) -> Dict[str, Any]:
     """Extracts and fixes JSON format if needed."""
@@ -112,6 +142,7 @@ def classify_user_intent(user_input: str) -> Dict[str, Any]:
     - "duration" (in minutes, default 60 if unspecified)
     - "description" (Short summary of the event)
     - "old_date_time" (ISO format: YYYY-MM-DDTHH:MM) - Only for update_event intent
+    - "end_date" (ISO format: YYYY-MM-DD) - Only for get_events when the user asks about several days (e.g. "this week", "next 3 days"): the last day of that span, with "date_time" on its first day
     - "reference_context" (any event or information referenced from previous conversation)
 
     If the user is just chatting (e.g., "Hey, how are you?"), return:
@@ -134,7 +165,8 @@ def classify_user_intent(user_input: str) -> Dict[str, Any]:
     User Query: {user_input}
     """
 
-    response = llm_2.invoke(prompt)
+    with track_upstream('llm', llm_2.model):
+        response = llm_2.invoke(prompt)
     raw_text = response.content if hasattr(response, "content") else str(response)
 
     # Extract and validate JSON
@@ -157,6 +189,10 @@ def classify_user_intent(user_input: str) -> Dict[str, Any]:
     # Add old_date_time for update events if it exists
     if parsed_json.get("old_date_time"):
         fixed_json["old_date_time"] = parsed_json.get("old_date_time")
+
+    # Last day of a multi-day span, for reads like "what do I have this week"
+    if parsed_json.get("end_date"):
+        fixed_json["end_date"] = parsed_json.get("end_date").split("T")[0]
     
     # Check for required fields for event creation/updates
     if fixed_json["intent"] in ["create_event", "update_event"]:
@@ -170,6 +206,28 @@ def classify_user_intent(user_input: str) -> Dict[str, Any]:
     
     return fixed_json if fixed_json["intent"] != "unknown" else {"error": "Could not understand the request."}
 
+# GET a read endpoint, reusing the cached answer when the server replies 304
+def cached_get(path: str, params: Dict) -> Dict:
+    """Sends the stored ETag as If-None-Match; unchanged answers cost an empty 304."""
+    key = (path, tuple(sorted(params.items())))
+    cached = response_cache.get(key)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    response = requests.get(f"{API_BASE_URL}{path}", params=params, headers=headers)
+    if response.status_code == 304 and cached:
+        response_cache_stats["hits"] += 1
+        return cached[1]
+    response_cache_stats["misses"] += 1
+
+    response_data = response.json()
+    etag = response.headers.get("ETag")
+    if etag:
+        response_cache.pop(key, None)
+        if len(response_cache) >= RESPONSE_CACHE_SIZE:
+            # Drop the least recently stored entry
+            response_cache.pop(next(iter(response_cache)))
+        response_cache[key] = (etag, response_data)
+    return response_data
+
 # Find referenced event in history
 def find_referenced_event() -> Dict:
     """
@@ -185,6 +243,7 @@ def find_referenced_event() -> Dict:
     return {}
 
 @tool('create_event_tool')
+@timed('tool', 'create_event_tool')
 def create_event_tool(date_time: str, duration: str, description: str) -> Dict:
     """Create a calendar event."""
     try:
@@ -204,14 +263,21 @@ def create_event_tool(date_time: str, duration: str, description: str) -> Dict:
         return {"success": False, "error": f"Failed to create event: {str(e)}"}
 
 @tool('get_events_tool')
-def get_events_tool(date: str) -> Dict:
-    """Retrieve events for a given date. Format the date to YYYY-MM-DD if it contains a time component."""
+@timed('tool', 'get_events_tool')
+def get_events_tool(date: str, end_date: str = "") -> Dict:
+    """Retrieve events for a given date. Format the date to YYYY-MM-DD if it contains a time component. For a span of days (e.g. "this week") pass its last day as end_date to get every day in one call."""
     try:
         if "T" in date:
             date = date.split("T")[0]
-            
-        response = requests.get(f"{API_BASE_URL}/get-events-by-date", params={"date": date})
-        response_data = response.json()
+        if "T" in end_date:
+            end_date = end_date.split("T")[0]
+
+        if end_date and end_date != date:
+            # One read for the whole span, without the ids the agent does not show
+            response_data = cached_get("/get-events-by-range", {
+                "start": date, "end": end_date, "fields": "start_time,end_time,description"})
+        else:
+            response_data = cached_get("/get-events-by-date", {"date": date})
         if response_data.get("success") == True:
             return {"success": True, "slots": response_data}
         else:
@@ -220,14 +286,14 @@ def get_events_tool(date: str) -> Dict:
         return {"success": False, "error": f"Failed to fetch events: {str(e)}"}
 
 @tool('check_availability_tool')
-def check_availability_tool(date_time: str, duration: str) -> Dict:
-    """Check if a specific time slot is available."""
+@timed('tool', 'check_availability_tool')
+def check_availability_tool(date_time: str, duration: str, calendars: str = "") -> Dict:
+    """Check if a specific time slot is available. Optionally pass calendars as comma-separated calendar ids (e.g. attendee emails) to check all of them at once."""
     try:
-        response = requests.get(
-            f"{API_BASE_URL}/check-specific-availability", 
-            params={"datetime": date_time, "duration": duration}
-        )
-        response_data = response.json()
+        params = {"datetime": date_time, "duration": duration}
+        if calendars:
+            params["calendars"] = calendars
+        response_data = cached_get("/check-specific-availability", params)
         if response_data.get("success") == True:
             return {"success": True, "available": response_data.get("available"), "reason": response_data.get("reason")}
         else:
@@ -236,18 +302,26 @@ def check_availability_tool(date_time: str, duration: str) -> Dict:
         return {"success": False, "error": f"Failed to check availability: {str(e)}"}
 
 @tool('get_available_slots_tool')
-def get_available_slots_tool(date: str, duration: str) -> Dict:
-    """Get all available time slots for a given date and duration."""
+@timed('tool', 'get_available_slots_tool')
+def get_available_slots_tool(date: str, duration: str, end_date: str = "", limit: int = 0, top: int = 3) -> Dict:
+    """Get the best available time slots for a given date and duration, best first. Pass end_date to search every day up to it (e.g. "this week") in one call. top is how many ranked options to return (default 3); set top to 0 to list every free slot instead, optionally only the first limit of them."""
     try:
         # Format the date to YYYY-MM-DD if it contains a time component
         if "T" in date:
             date = date.split("T")[0]
-            
-        response = requests.get(
-            f"{API_BASE_URL}/available-slots", 
-            params={"date": date, "duration": duration}
-        )
-        response_data = response.json()
+        if "T" in end_date:
+            end_date = end_date.split("T")[0]
+
+        if end_date:
+            params = {"start_date": date, "end_date": end_date, "duration": duration}
+            if limit:
+                params["limit"] = limit
+        else:
+            params = {"date": date, "duration": duration}
+        if top:
+            params["top"] = top
+
+        response_data = cached_get("/available-slots", params)
         if response_data.get("success") == True:
             return {"success": True, "slots": response_data}
         else:
@@ -256,6 +330,7 @@ def get_available_slots_tool(date: str, duration: str) -> Dict:
         return {"success": False, "error": f"Failed to get available slots: {str(e)}"}
 
 @tool('update_event_tool')
+@timed('tool', 'update_event_tool')
 def update_event_tool(old_date_time: str, new_date_time: str, duration: str, description: str) -> Dict:
     """Update an existing calendar event."""
     try:
@@ -275,6 +350,7 @@ def update_event_tool(old_date_time: str, new_date_time: str, duration: str, des
         return {"success": False, "error": f"Failed to update event: {str(e)}"}
 
 @tool('delete_event_tool')
+@timed('tool', 'delete_event_tool')
 def delete_event_tool(date_time: str, duration: str) -> Dict:
     """Delete a calendar event."""
     try:
@@ -291,6 +367,45 @@ def delete_event_tool(date_time: str, duration: str) -> Dict:
     except Exception as e:
         return {"success": False, "error": f"Failed to delete event: {str(e)}"}
 
+@tool('batch_events_tool')
+@timed('tool', 'batch_events_tool')
+def batch_events_tool(operations: List[Dict]) -> Dict:
+    """Create, update or delete many calendar events in one call (e.g. "clear my Friday", "move all standups 30 min later").
+    Each operation is one of:
+    {"op": "create", "start_time": "YYYY-MM-DDTHH:MM", "duration": "60", "description": "..."}
+    {"op": "update", "event_id": "...", "new_start_time": "YYYY-MM-DDTHH:MM", "duration": "30"}
+    {"op": "delete", "event_id": "..."}"""
+    try:
+        response = requests.post(f"{API_BASE_URL}/batch", json={"operations": operations})
+        response_data = response.json()
+        if response_data.get("success") == True:
+            return {"success": True, "results": response_data.get("results", []), "message": response_data.get("message")}
+        else:
+            return {"success": False, "error": response_data.get("error", "Unknown error")}
+    except Exception as e:
+        return {"success": False, "error": f"Failed to run batch operations: {str(e)}"}
+
+@tool('group_availability_tool')
+@timed('tool', 'group_availability_tool')
+def group_availability_tool(attendees: str, date: str, duration: str, end_date: str = "", limit: int = 10) -> Dict:
+    """Find times when several people are all free (e.g. "45 minutes when these 12 people are free next week"). attendees is a comma-separated list of calendar ids or emails; pass end_date to search every day up to it."""
+    try:
+        if "T" in date:
+            date = date.split("T")[0]
+        if "T" in end_date:
+            end_date = end_date.split("T")[0]
+
+        params = {"attendees": attendees, "start_date": date, "end_date": end_date or date, "duration": duration}
+        if limit:
+            params["limit"] = limit
+        response_data = cached_get("/group-availability", params)
+        if response_data.get("success") == True:
+            return {"success": True, "slots": response_data}
+        else:
+            return {"success": False, "error": response_data.get("error", "Unknown error")}
+    except Exception as e:
+        return {"success": False, "error": f"Failed to find group availability: {str(e)}"}
+
 # 📌 CrewAI Agent with tools
 calendar_agent = Agent(
     role="Calendar Assistant",
@@ -311,7 +426,8 @@ calendar_agent = Agent(
     allow_delegation=False,
     llm=llm,
     tools=[create_event_tool, get_events_tool, check_availability_tool, 
-           get_available_slots_tool, update_event_tool, delete_event_tool]
+           get_available_slots_tool, group_availability_tool, update_event_tool, delete_event_tool,
+           batch_events_tool]
 )
 
 # 📝 Dynamically Create CrewAI Tasks
@@ -457,12 +573,14 @@ def create_calendar_task(user_input):
             }]
         )
     elif intent == "get_events":
+        end_date = parsed_input.get("end_date", "")
+        span = f"{date_time} to {end_date}" if end_date else date_time
         task = Task(
-            description=f"Retrieve events for {date_time}",
+            description=f"Retrieve events for {span}",
             expected_output="List of scheduled events",
             agent=calendar_agent,
             context=[{
-                "description": f"Fetch all scheduled events for {date_time}",
+                "description": f"Fetch all scheduled events for {span}",
                 "expected_output": """Make sure that the output should be in format: {
                     "message": "Generalized response message",
                     "success": true,
@@ -475,6 +593,7 @@ def create_calendar_task(user_input):
                     }""",
                 "intent": "get_events",
                 "date": date_time,
+                "end_date": end_date,
                 "required_tool": "get_events_tool",
                 "conversation_history": get_conversation_context(),
                 "current_date": current_date.strftime("%Y-%m-%d")
@@ -561,10 +680,10 @@ def create_calendar_task(user_input):
     elif intent == "get_available_slots":
         task = Task(
             description=f"Find available slots on {date_time} for {duration} minutes",
-            expected_output="List of available time slots",
+            expected_output="The best available time slots",
             agent=calendar_agent,
             context=[{
-                "description": f"Find all available time slots on {date_time} for a {duration}-minute meeting.",
+                "description": f"Find the best available time slots on {date_time} for a {duration}-minute meeting.",
                 "expected_output": """Make sure that the output should be in format: {
                     "message": "Generalized response message",
                     "success": true,
@@ -641,7 +760,8 @@ def process_user_message(user_input: str) -> Dict[str, Any]:
             process=Process.sequential
         )
         
-        result = crew.kickoff()
+        with track_upstream('crew', 'kickoff'):
+            result = crew.kickoff()
         
         # Add assistant's response to history
         add_to_history("assistant", result, task.context[0] if task.context else {})
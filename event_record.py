@@ -0,0 +1,77 @@
+import datetime
+
+EPOCH_DATE = datetime.date(1970, 1, 1)
+
+
+def _fix_zulu(value):
+    # fromisoformat only accepts a trailing Z from Python 3.11 on
+    return value[:-1] + '+00:00' if value.endswith('Z') else value
+
+
+# Parse an RFC 3339 timestamp from the Calendar API into epoch seconds
+def parse_timestamp(value):
+    """datetime.fromisoformat is an order of magnitude faster than dateutil for API timestamps."""
+    return int(datetime.datetime.fromisoformat(_fix_zulu(value)).timestamp())
+
+
+class Event:
+    """
+    Compact, decoded view of a Google Calendar event.
+
+    start and end are epoch seconds, decoded once when the event enters the
+    process. tz_offset (seconds east of UTC) lets us format them back in the
+    event's own offset. All-day events start and end at local midnight in the
+    calendar's timezone and are formatted back as plain dates.
+    """
+
+    __slots__ = ('id', 'summary', 'start', 'end', 'all_day', 'tz_offset', 'etag')
+
+    def __init__(self, id, summary, start, end, all_day=False, tz_offset=0, etag=None):
+        self.id = id
+        self.summary = summary
+        self.start = start
+        self.end = end
+        self.all_day = all_day
+        self.tz_offset = tz_offset
+        self.etag = etag
+
+    @classmethod
+    def from_google(cls, event, timezone):
+        """Decodes an events resource; `timezone` (pytz) places all-day dates."""
+        start, end = event['start'], event['end']
+        if 'dateTime' in start:
+            start_time = datetime.datetime.fromisoformat(_fix_zulu(start['dateTime']))
+            end_time = datetime.datetime.fromisoformat(_fix_zulu(end['dateTime']))
+            return cls(event['id'], event.get('summary', 'No description'),
+                       int(start_time.timestamp()), int(end_time.timestamp()),
+                       False, int(start_time.utcoffset().total_seconds()), event.get('etag'))
+
+        start_time = timezone.localize(datetime.datetime.fromisoformat(start['date']))
+        end_time = timezone.localize(datetime.datetime.fromisoformat(end['date']))
+        return cls(event['id'], event.get('summary', 'No description'),
+                   int(start_time.timestamp()), int(end_time.timestamp()),
+                   True, int(start_time.utcoffset().total_seconds()), event.get('etag'))
+
+    def start_datetime(self):
+        return datetime.datetime.fromtimestamp(self.start, datetime.timezone(datetime.timedelta(seconds=self.tz_offset)))
+
+    def end_datetime(self):
+        return datetime.datetime.fromtimestamp(self.end, datetime.timezone(datetime.timedelta(seconds=self.tz_offset)))
+
+    def _local_date(self, timestamp):
+        # Round to the nearest local midnight so a DST change inside a multi-day event keeps its date
+        return EPOCH_DATE + datetime.timedelta(days=(timestamp + self.tz_offset + 43200) // 86400)
+
+    def start_iso(self):
+        """dateTime string, or the date for all-day events, as the API would return it."""
+        return self._local_date(self.start).isoformat() if self.all_day else self.start_datetime().isoformat()
+
+    def end_iso(self):
+        return self._local_date(self.end).isoformat() if self.all_day else self.end_datetime().isoformat()
+
+    def overlaps(self, start, end):
+        """True if the event overlaps [start, end) given in epoch seconds."""
+        return self.start < end and self.end > start
+
+    def __repr__(self):
+        return f"Event({self.id!r}, {self.summary!r}, {self.start_iso()} - {self.end_iso()})"
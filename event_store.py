@@ -0,0 +1,438 @@
+import os
+import json
+import time
+import heapq
+import sqlite3
+import threading
+import pytz
+from googleapiclient.errors import HttpError
+from paging import iter_event_pages
+from event_record import Event
+from recurrence import Series, ExpansionCache
+from scheduling import data_path
+
+# Configuration
+EVENT_STORE_PATH = os.getenv('EVENT_STORE_PATH') or data_path('event_store.db')
+DEFAULT_MAX_STALENESS = float(os.getenv('EVENT_STORE_MAX_STALENESS', '30'))  # Seconds
+SYNC_PAGE_SIZE = int(os.getenv('EVENT_STORE_SYNC_PAGE_SIZE', '2500'))  # Largest page size events.list accepts
+READ_BATCH_SIZE = 500  # Rows fetched per lock acquisition when streaming reads
+SCHEMA_VERSION = 4  # Bump to rebuild the mirror when the table layout changes
+EVENT_COLUMNS = "id, summary, start_ts, end_ts, all_day, tz_offset, etag"
+SERIES_COLUMNS = "id, summary, start_ts, end_ts, all_day, etag, timezone, recurrence"
+
+
+class EventStore:
+    """
+    Local SQLite mirror of one calendar, kept current with incremental sync.
+
+    The first sync pulls every event and stores the nextSyncToken; later syncs
+    send that token and only receive changed or cancelled events. Reads are
+    served from SQLite and only trigger a sync when the mirror is older than
+    the caller's staleness bound.
+
+    Recurring events are synced as their master event plus any modified or
+    cancelled occurrences, not as every instance. Instances are expanded
+    locally from the master's rules when a window is read, and the
+    expansions are cached per series and chunk of time.
+
+    Several processes may mirror the same calendar into one file. Every
+    write that changes rows bumps a version in sync_state; a store that
+    finds a version it did not write reloads its series from the rows and
+    tells its listeners to rebuild, before it reads, syncs or writes.
+    """
+
+    def __init__(self, service_factory, calendar_id='primary', path=EVENT_STORE_PATH,
+                 timezone="UTC", max_staleness=DEFAULT_MAX_STALENESS, store_key=None):
+        self.service_factory = service_factory
+        self.calendar_id = calendar_id
+        # Rows are keyed by store_key, so several accounts' "primary" calendars can share one file
+        self.store_key = store_key or calendar_id
+        self.timezone = pytz.timezone(timezone)
+        self.max_staleness = max_staleness
+        self._lock = threading.RLock()
+        self._synced_at = 0.0
+        self._version = 0  # Version of the rows this process's in-memory state was built from
+        self._listeners = []
+        self._series = {}  # series id -> (Series, end of its last occurrence or None)
+        self._skips = {}   # series id -> instance ids replaced by exceptions or cancelled
+        self.expansions = ExpansionCache()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # The mirror is a cache, so an old layout is simply dropped and re-synced
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._conn.executescript("DROP TABLE IF EXISTS events; DROP TABLE IF EXISTS sync_state; "
+                                     "DROP TABLE IF EXISTS series; DROP TABLE IF EXISTS cancelled_instances;")
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                calendar_id TEXT NOT NULL,
+                id TEXT NOT NULL,
+                summary TEXT,
+                start_ts INTEGER NOT NULL,
+                end_ts INTEGER NOT NULL,
+                all_day INTEGER NOT NULL,
+                tz_offset INTEGER NOT NULL,
+                etag TEXT,
+                series_id TEXT,
+                body TEXT NOT NULL,
+                PRIMARY KEY (calendar_id, id)
+            );
+            CREATE INDEX IF NOT EXISTS events_by_start ON events (calendar_id, start_ts);
+            CREATE INDEX IF NOT EXISTS events_by_series ON events (calendar_id, series_id);
+            CREATE TABLE IF NOT EXISTS series (
+                calendar_id TEXT NOT NULL,
+                id TEXT NOT NULL,
+                summary TEXT,
+                start_ts INTEGER NOT NULL,
+                end_ts INTEGER NOT NULL,
+                all_day INTEGER NOT NULL,
+                etag TEXT,
+                timezone TEXT NOT NULL,
+                recurrence TEXT NOT NULL,
+                last_end_ts INTEGER,
+                body TEXT NOT NULL,
+                PRIMARY KEY (calendar_id, id)
+            );
+            CREATE TABLE IF NOT EXISTS cancelled_instances (
+                calendar_id TEXT NOT NULL,
+                id TEXT NOT NULL,
+                series_id TEXT NOT NULL,
+                PRIMARY KEY (calendar_id, id)
+            );
+            CREATE TABLE IF NOT EXISTS sync_state (
+                calendar_id TEXT PRIMARY KEY,
+                sync_token TEXT,
+                synced_at REAL,
+                version INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        self._version, synced_at = self._stored_version()
+        self._synced_at = synced_at or 0.0
+        self._load_series()
+
+    def _load_series(self):
+        # Series and their exceptions are few, so they are kept in memory for expansion
+        self._series = {}
+        for row in self._conn.execute(
+                f"SELECT {SERIES_COLUMNS}, last_end_ts FROM series WHERE calendar_id = ?", (self.store_key,)):
+            self._series[row[0]] = (Series(*row[:7], json.loads(row[7])), row[8])
+        self._skips = {}
+        for series_id, instance_id in self._conn.execute(
+                "SELECT series_id, id FROM events WHERE calendar_id = ? AND series_id IS NOT NULL "
+                "UNION ALL SELECT series_id, id FROM cancelled_instances WHERE calendar_id = ?",
+                (self.store_key, self.store_key)):
+            self._skips.setdefault(series_id, set()).add(instance_id)
+
+    def _stored_version(self):
+        row = self._conn.execute(
+            "SELECT version, synced_at FROM sync_state WHERE calendar_id = ?", (self.store_key,)).fetchone()
+        return row if row else (0, None)
+
+    def _bump_version(self):
+        # Called inside the write's transaction, so the version moves together with the rows
+        self._conn.execute(
+            "INSERT INTO sync_state (calendar_id, version) VALUES (?, 1) "
+            "ON CONFLICT(calendar_id) DO UPDATE SET version = version + 1", (self.store_key,))
+        return self._stored_version()[0]
+
+    def follow(self):
+        """
+        Picks up changes another process wrote to the shared file: reloads series
+        and has listeners rebuild from the rows. Returns True if there were any.
+        """
+        with self._lock:
+            version, synced_at = self._stored_version()
+            self._synced_at = max(self._synced_at, synced_at or 0.0)
+            if version == self._version:
+                return False
+            self._version = version
+            self._load_series()
+            self._notify_changes([], [], full=True)
+            return True
+
+    def _committed(self, version, changed, removed, full):
+        # Another process wrote between our last follow and this write, so incremental
+        # notifications would miss its changes; rebuild from the rows instead
+        if version != self._version + 1:
+            self._load_series()
+            full = True
+        self._version = version
+        self._notify_changes(changed, removed, full=full)
+
+    def add_listener(self, callback):
+        """Registers callback(changed, removed, full) for every change to the mirror."""
+        self._listeners.append(callback)
+
+    def _notify(self, changed, removed, full=False):
+        for callback in self._listeners:
+            callback(changed, removed, full)
+
+    @property
+    def age(self):
+        """Seconds since the last successful sync."""
+        return time.time() - self._synced_at
+
+    def ensure_fresh(self, max_staleness=None, force=False):
+        """Syncs if the mirror is older than max_staleness seconds or force is set."""
+        self.follow()
+        bound = self.max_staleness if max_staleness is None else max_staleness
+        if not force and self.age <= bound:
+            return False
+        with self._lock:
+            # Another thread may have synced while we waited for the lock
+            if not force and self.age <= bound:
+                return False
+            self.sync()
+        return True
+
+    def sync(self):
+        """Pulls changes since the last sync token, falling back to a full sync."""
+        with self._lock:
+            # The token is shared, so changes pulled by another process are only in the rows
+            self.follow()
+            sync_token = self._get_sync_token()
+            try:
+                self._pull(sync_token)
+            except HttpError as e:
+                # 410 Gone means the sync token expired and a full sync is required
+                if e.resp.status != 410:
+                    raise
+                self._pull(None)
+
+    def _get_sync_token(self):
+        row = self._conn.execute(
+            "SELECT sync_token FROM sync_state WHERE calendar_id = ?", (self.store_key,)).fetchone()
+        return row[0] if row else None
+
+    def _pull(self, sync_token):
+        service = self.service_factory()
+        params = {
+            "calendarId": self.calendar_id,
+            # Recurring series arrive once, as their master, instead of instance by instance
+            "singleEvents": False,
+            "showDeleted": sync_token is not None,
+        }
+        if sync_token:
+            params["syncToken"] = sync_token
+
+        changed_bounds = []
+        removed = []
+        series_changed = False
+        # One transaction for the whole pull, written page by page
+        with self._conn:
+            if sync_token is None:
+                for table in ('events', 'series', 'cancelled_instances'):
+                    self._conn.execute(f"DELETE FROM {table} WHERE calendar_id = ?", (self.store_key,))
+                self._series, self._skips = {}, {}
+            for page in iter_event_pages(service, page_size=SYNC_PAGE_SIZE, **params):
+                page_changed, page_removed, page_series_changed = self._apply(page.get('items', []))
+                changed_bounds.extend(page_changed)
+                removed.extend(page_removed)
+                series_changed = series_changed or page_series_changed
+                next_sync_token = page.get('nextSyncToken')
+
+            full = sync_token is None or series_changed
+            # An empty delta leaves the version alone, so other processes do not rebuild for nothing
+            version = self._bump_version() if full or changed_bounds or removed else None
+            self._synced_at = time.time()
+            self._conn.execute(
+                "INSERT INTO sync_state (calendar_id, sync_token, synced_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(calendar_id) DO UPDATE SET sync_token = excluded.sync_token, synced_at = excluded.synced_at",
+                (self.store_key, next_sync_token, self._synced_at))
+        if version is not None:
+            self._committed(version, changed_bounds, removed, full)
+
+    def _notify_changes(self, changed, removed, full=False):
+        # A series change can move any number of occurrences, so listeners rebuild as after a full sync
+        if full:
+            self._notify(self.iter_bounds(), [], full=True)
+        else:
+            self._notify(changed, removed)
+
+    def _apply(self, items):
+        """
+        Writes events.list items (singleEvents=False) to the mirror.
+        Returns (changed_bounds, removed_ids, series_changed).
+        """
+        singles = []
+        removed = []
+        series_changed = False
+        for event in items:
+            series_id = event.get('recurringEventId')
+            if event.get('status') == 'cancelled':
+                if series_id:
+                    # One occurrence was cancelled, or an exception to it was deleted
+                    self._cancel_instance(event['id'], series_id)
+                    series_changed = True
+                elif self._drop_series(event['id']):
+                    series_changed = True
+                else:
+                    removed.append(event['id'])
+            elif event.get('recurrence'):
+                self._write_series(event)
+                series_changed = True
+            else:
+                if series_id:
+                    # An exception replaces the occurrence it was made from
+                    self._conn.execute("DELETE FROM cancelled_instances WHERE calendar_id = ? AND id = ?",
+                                       (self.store_key, event['id']))
+                    self._skips.setdefault(series_id, set()).add(event['id'])
+                    series_changed = True
+                singles.append(event)
+        self._conn.executemany(
+            "DELETE FROM events WHERE calendar_id = ? AND id = ?",
+            [(self.store_key, event_id) for event_id in removed])
+        return self._write_events(singles), removed, series_changed
+
+    def _write_events(self, events):
+        rows = []
+        bounds = []
+        for event in events:
+            record = Event.from_google(event, self.timezone)
+            rows.append((self.store_key, record.id, record.summary, record.start, record.end,
+                         record.all_day, record.tz_offset, record.etag, event.get('recurringEventId'),
+                         json.dumps(event)))
+            bounds.append((record.id, record.start, record.end))
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO events (calendar_id, {EVENT_COLUMNS}, series_id, body) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows)
+        return bounds
+
+    def _write_series(self, event):
+        series = Series.from_google(event, self.timezone)
+        last_end = series.last_end()
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO series (calendar_id, {SERIES_COLUMNS}, last_end_ts, body) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.store_key, series.id, series.summary, series.start, series.end, series.all_day,
+             series.etag, series.timezone, json.dumps(series.recurrence), last_end, json.dumps(event)))
+        self._series[series.id] = (series, last_end)
+
+    def _drop_series(self, series_id):
+        # Deleting a series deletes its exceptions too; returns False if it was not a series
+        if series_id not in self._series:
+            return False
+        for table, column in (('series', 'id'), ('events', 'series_id'), ('cancelled_instances', 'series_id')):
+            self._conn.execute(f"DELETE FROM {table} WHERE calendar_id = ? AND {column} = ?",
+                               (self.store_key, series_id))
+        del self._series[series_id]
+        self._skips.pop(series_id, None)
+        return True
+
+    def _cancel_instance(self, instance_id, series_id):
+        self._conn.execute("DELETE FROM events WHERE calendar_id = ? AND id = ?", (self.store_key, instance_id))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO cancelled_instances (calendar_id, id, series_id) VALUES (?, ?, ?)",
+            (self.store_key, instance_id, series_id))
+        self._skips.setdefault(series_id, set()).add(instance_id)
+
+    def _series_of_instance(self, event_id):
+        """The series an occurrence id belongs to, whether or not it has an exception stored."""
+        row = self._conn.execute(
+            "SELECT series_id FROM events WHERE calendar_id = ? AND id = ?", (self.store_key, event_id)).fetchone()
+        if row and row[0]:
+            return row[0]
+        series_id = event_id.rpartition('_')[0]
+        return series_id if series_id in self._series else None
+
+    def iter_bounds(self):
+        """Returns (event_id, start_ts, end_ts) for every stored event; recurring instances are not included."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, start_ts, end_ts FROM events WHERE calendar_id = ?",
+                (self.store_key,)).fetchall()
+
+    def recurring_between(self, time_min, time_max):
+        """Event records of recurring-series occurrences overlapping [time_min, time_max) in epoch seconds, by start."""
+        with self._lock:
+            series = [entry for entry, last_end in self._series.values()
+                      if entry.start < time_max and (last_end is None or last_end > time_min)]
+            skips = {entry.id: frozenset(self._skips.get(entry.id, ())) for entry in series}
+        events = []
+        for entry in series:
+            events.extend(self.expansions.events(entry, time_min, time_max, skips[entry.id]))
+        events.sort(key=lambda event: (event.start, event.id))
+        return events
+
+    def recurring_bounds(self, time_min, time_max):
+        """(start, end, instance_id) of recurring occurrences overlapping the window, for the busy index."""
+        return [(event.start, event.end, event.id) for event in self.recurring_between(time_min, time_max)]
+
+    def events_between(self, time_min, time_max, batch_size=READ_BATCH_SIZE):
+        """
+        Yields Event records overlapping [time_min, time_max) ordered by start time,
+        matching events.list(timeMin, timeMax, singleEvents=True, orderBy='startTime').
+        Stored events stream from SQLite and are merged with the window's
+        expanded recurring occurrences.
+        """
+        recurring = self.recurring_between(time_min.timestamp(), time_max.timestamp())
+        stored = self._stored_between(time_min, time_max, batch_size)
+        if not recurring:
+            return stored
+        return heapq.merge(stored, recurring, key=lambda event: (event.start, event.id))
+
+    def _stored_between(self, time_min, time_max, batch_size):
+        # Rows are fetched in batches keyed on (start_ts, id), so a caller that
+        # stops early never decodes the rest and the lock is not held between batches
+        last_start, last_id = float('-inf'), ''
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {EVENT_COLUMNS} FROM events "
+                    "WHERE calendar_id = ? AND start_ts < ? AND end_ts > ? "
+                    "AND (start_ts > ? OR (start_ts = ? AND id > ?)) "
+                    "ORDER BY start_ts, id LIMIT ?",
+                    (self.store_key, time_max.timestamp(), time_min.timestamp(),
+                     last_start, last_start, last_id, batch_size)).fetchall()
+            for row in rows:
+                yield Event(*row)
+            if len(rows) < batch_size:
+                return
+            last_start, last_id = rows[-1][2], rows[-1][0]
+
+    def get_event(self, event_id):
+        """Returns the mirrored Event with this id, including expanded recurring instances, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {EVENT_COLUMNS} FROM events WHERE calendar_id = ? AND id = ?",
+                (self.store_key, event_id)).fetchone()
+            if row:
+                return Event(*row)
+            series_id = self._series_of_instance(event_id)
+            if series_id is None or event_id in self._skips.get(series_id, ()):
+                return None
+            series = self._series[series_id][0]
+        start = series.instance_start(event_id)
+        if start is None:
+            return None
+        return next((event for event in self.expansions.events(series, start, start + 1)
+                     if event.id == event_id), None)
+
+    def upsert_event(self, event):
+        """Writes through an event we just created or updated."""
+        self.upsert_events([event])
+
+    def upsert_events(self, events):
+        """Writes through many events in one transaction, e.g. the results of a batch."""
+        with self._lock:
+            self.follow()
+            with self._conn:
+                changed_bounds, removed, series_changed = self._apply(events)
+                version = self._bump_version()
+            self._committed(version, changed_bounds, removed, series_changed)
+
+    def remove_event(self, event_id):
+        """Drops an event we just deleted; deleting one occurrence of a series cancels just that occurrence."""
+        with self._lock:
+            self.follow()
+            with self._conn:
+                series_id = self._series_of_instance(event_id)
+                series_changed = self._drop_series(event_id)
+                if series_id:
+                    self._cancel_instance(event_id, series_id)
+                    series_changed = True
+                else:
+                    self._conn.execute(
+                        "DELETE FROM events WHERE calendar_id = ? AND id = ?", (self.store_key, event_id))
+                version = self._bump_version()
+            self._committed(version, [], [event_id], series_changed)
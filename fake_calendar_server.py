@@ -0,0 +1,510 @@
+import os
+import re
+import json
+import gzip
+import time
+import uuid
+import random
+import argparse
+import datetime
+import threading
+import pytz
+import requests
+from email.parser import BytesParser
+from email.policy import HTTP
+from flask import Flask, request, jsonify, Response
+from recurrence import Series, instance_id
+
+# Local stand-in for the Google Calendar v3 REST API, for benchmarks and offline tests.
+# Point app.py at it with CALENDAR_API_ROOT=http://127.0.0.1:8085/ and CALENDAR_FAKE_AUTH=1,
+# and async_app.py with CALENDAR_API_URL=http://127.0.0.1:8085/calendar/v3.
+
+app = Flask(__name__)
+
+API_PREFIX = '/calendar/v3'
+DEFAULT_PAGE_SIZE = 250
+EXPANSION_HORIZON = datetime.timedelta(days=365)  # How far singleEvents expands series without a timeMax
+
+# Injected behaviour, changeable at runtime through /_fake/config
+config = {
+    "latency_ms": float(os.getenv('FAKE_LATENCY_MS', '0')),  # Mean added latency per HTTP request
+    "jitter_ms": float(os.getenv('FAKE_JITTER_MS', '0')),  # Uniform +/- jitter around the mean
+    "error_rate": float(os.getenv('FAKE_ERROR_RATE', '0')),  # Fraction of API calls failing with 503/429
+}
+
+# Calendar state: calendar id -> event id -> event, plus a global change sequence
+state_lock = threading.Lock()
+calendars = {}
+ical_uids = {}  # (calendar id, iCalUID) -> id of the event events.import created for it
+sequence = 0
+stats = {"requests": 0, "injected_errors": 0, "notifications": 0}
+
+# Open watch channels: channel id -> {"calendar_id", "resource_id", "address", "token", "expiration", "messages"}
+channels = {}
+changed_calendars = set()  # Calendars changed since the notifier last ran
+notify_wakeup = threading.Condition(state_lock)
+
+
+# Helpers
+def api_error(code, reason, message):
+    return jsonify({"error": {"code": code, "message": message, "errors": [{"reason": reason, "message": message}]}}), code
+
+def next_sequence():
+    global sequence
+    sequence += 1
+    return sequence
+
+def parse_time(value):
+    """Parses an RFC 3339 dateTime or an all-day date (taken as UTC midnight)."""
+    if 'T' not in value:
+        value += 'T00:00:00+00:00'
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def event_bounds(event):
+    return (parse_time(event['start'].get('dateTime', event['start'].get('date'))),
+            parse_time(event['end'].get('dateTime', event['end'].get('date'))))
+
+def public(event):
+    return {key: value for key, value in event.items() if not key.startswith('_')}
+
+def store_event(calendar_id, event):
+    """Stamps an event with a new sequence/etag/updated time and saves it."""
+    seq = next_sequence()
+    event['_seq'] = seq
+    event['etag'] = f'"{seq}"'
+    event['updated'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    event.setdefault('status', 'confirmed')
+    event.setdefault('kind', 'calendar#event')
+    calendars.setdefault(calendar_id, {})[event['id']] = event
+    changed_calendars.add(calendar_id)
+    notify_wakeup.notify()
+    return public(event)
+
+# Recurring series, expanded the way singleEvents=true does
+def format_time(timestamp, all_day, zone):
+    moment = datetime.datetime.fromtimestamp(timestamp, pytz.timezone(zone))
+    return {"date": moment.date().isoformat()} if all_day else {"dateTime": moment.isoformat(), "timeZone": zone}
+
+def instance_from(master, series, start, end, instance_id):
+    instance = {key: value for key, value in master.items() if key != 'recurrence'}
+    instance.update(id=instance_id, recurringEventId=master['id'],
+                    start=format_time(start, series.all_day, series.timezone),
+                    end=format_time(end, series.all_day, series.timezone))
+    instance['originalStartTime'] = instance['start']
+    return instance
+
+def expand_events(events, time_min, time_max):
+    """Replaces series masters by their occurrences in the window, minus stored exceptions."""
+    stored_ids = {event['id'] for event in events}
+    expanded = []
+    for event in events:
+        if not event.get('recurrence') or event.get('status') == 'cancelled':
+            expanded.append(event)
+            continue
+        series = Series.from_google(event, pytz.utc)
+        window_min = time_min.timestamp() if time_min else series.start
+        window_max = time_max.timestamp() if time_max else window_min + EXPANSION_HORIZON.total_seconds()
+        for start, end, _, instance_id in series.occurrences(window_min - series.duration, window_max):
+            if instance_id not in stored_ids and end > window_min:
+                expanded.append(instance_from(event, series, start, end, instance_id))
+    return expanded
+
+def find_instance(calendar_id, event_id):
+    """Builds the occurrence `event_id` of a stored series, or returns None."""
+    master = calendars.get(calendar_id, {}).get(event_id.rpartition('_')[0])
+    if master is None or not master.get('recurrence') or master.get('status') == 'cancelled':
+        return None
+    series = Series.from_google(master, pytz.utc)
+    start = series.instance_start(event_id)
+    if start is None:
+        return None
+    for start, end, _, instance_id in series.occurrences(start, start + 1):
+        if instance_id == event_id:
+            return instance_from(master, series, start, end, instance_id)
+    return None
+
+def new_event(body):
+    event = dict(body)
+    event['id'] = body.get('id') or uuid.uuid4().hex
+    event.setdefault('iCalUID', f"{event['id']}@google.com")
+    return event
+
+
+# Latency and error injection
+@app.before_request
+def inject_faults():
+    if request.path.startswith('/_fake'):
+        return None
+    with state_lock:
+        stats["requests"] += 1
+
+    # Parts of a batch share the outer request's latency
+    if not request.headers.get('X-Fake-Batch-Part'):
+        delay = config["latency_ms"] + random.uniform(-config["jitter_ms"], config["jitter_ms"])
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    if request.path.startswith('/batch'):
+        return None
+    if config["error_rate"] and random.random() < config["error_rate"]:
+        with state_lock:
+            stats["injected_errors"] += 1
+        if random.random() < 0.5:
+            return api_error(429, "rateLimitExceeded", "Rate Limit Exceeded")
+        return api_error(503, "backendError", "Backend Error")
+    return None
+
+
+# Partial responses (fields=...) and gzip, as Google applies them
+def parse_fields(text):
+    """Parses a fields mask such as "nextPageToken,items(id,start/dateTime)" into a nested dict."""
+    tokens = re.findall(r'[^,()/\s]+|[,()/]', text)
+
+    def parse(position):
+        mask = {}
+        while position < len(tokens) and tokens[position] != ')':
+            node = mask.setdefault(tokens[position], {})
+            position += 1
+            while position < len(tokens) and tokens[position] == '/':
+                node = node.setdefault(tokens[position + 1], {})
+                position += 2
+            if position < len(tokens) and tokens[position] == '(':
+                sub, position = parse(position + 1)
+                node.update(sub)
+                position += 1
+            if position < len(tokens) and tokens[position] == ',':
+                position += 1
+        return mask, position
+
+    return parse(0)[0]
+
+
+def apply_fields(value, mask):
+    if isinstance(value, list):
+        return [apply_fields(item, mask) for item in value]
+    if not isinstance(value, dict) or not mask:
+        return value
+    return {key: apply_fields(value[key], sub) for key, sub in mask.items() if key in value}
+
+
+@app.after_request
+def shape_response(response):
+    if request.path.startswith('/_fake') or response.mimetype != 'application/json' or response.status_code >= 400:
+        return response
+    if request.args.get('fields'):
+        response.set_data(json.dumps(apply_fields(response.get_json(), parse_fields(request.args['fields']))))
+    # Like Google, only gzip for clients that also say "gzip" in their user agent
+    if (not request.headers.get('X-Fake-Batch-Part') and 'gzip' in request.headers.get('Accept-Encoding', '')
+            and 'gzip' in request.headers.get('User-Agent', '')):
+        response.set_data(gzip.compress(response.get_data()))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+# events.list
+@app.route(f'{API_PREFIX}/calendars/<calendar_id>/events', methods=['GET'])
+def list_events(calendar_id):
+    args = request.args
+    with state_lock:
+        events = list(calendars.get(calendar_id, {}).values())
+        current_sequence = sequence
+
+    sync_token = args.get('syncToken')
+    if sync_token:
+        if not sync_token.isdigit() or int(sync_token) > current_sequence:
+            return api_error(410, "fullSyncRequired", "Sync token is no longer valid, a full sync is required.")
+        events = [event for event in events if event['_seq'] > int(sync_token)]
+    else:
+        time_min = parse_time(args['timeMin']) if args.get('timeMin') else None
+        time_max = parse_time(args['timeMax']) if args.get('timeMax') else None
+        if args.get('singleEvents') == 'true':
+            # Cancelled exceptions still hide their occurrence, so expand before dropping them
+            events = expand_events(events, time_min, time_max)
+        if args.get('showDeleted') != 'true':
+            events = [event for event in events if event.get('status') != 'cancelled']
+        if time_min or time_max:
+            events = [event for event in events if event.get('status') == 'cancelled' or (
+                (time_min is None or event_bounds(event)[1] > time_min) and
+                (time_max is None or event_bounds(event)[0] < time_max))]
+        if args.get('orderBy') == 'startTime':
+            events.sort(key=lambda event: event_bounds(event)[0])
+
+    offset = int(args.get('pageToken') or 0)
+    page_size = int(args.get('maxResults') or DEFAULT_PAGE_SIZE)
+    page = {"kind": "calendar#events", "items": [public(event) for event in events[offset:offset + page_size]]}
+    if offset + page_size < len(events):
+        page['nextPageToken'] = str(offset + page_size)
+    else:
+        page['nextSyncToken'] = str(current_sequence)
+    return jsonify(page)
+
+# events.insert
+@app.route(f'{API_PREFIX}/calendars/<calendar_id>/events', methods=['POST'])
+def insert_event(calendar_id):
+    body = request.get_json()
+    with state_lock:
+        # Client-chosen ids must be unique, which makes retried inserts safe
+        if body.get('id') and body['id'] in calendars.get(calendar_id, {}):
+            return api_error(409, "duplicate", "The requested identifier already exists.")
+        return jsonify(store_event(calendar_id, new_event(body)))
+
+# events.import: matched on iCalUID (and originalStartTime for exceptions), so importing again updates
+@app.route(f'{API_PREFIX}/calendars/<calendar_id>/events/import', methods=['POST'])
+def import_event(calendar_id):
+    body = request.get_json()
+    uid = body.get('iCalUID')
+    if not uid:
+        return api_error(400, "required", "Missing iCalUID.")
+    with state_lock:
+        master_id = ical_uids.get((calendar_id, uid))
+        event = dict(body)
+        original = body.get('originalStartTime')
+        if original:
+            master = calendars.get(calendar_id, {}).get(master_id)
+            if master is None or not master.get('recurrence'):
+                return api_error(400, "invalid", "Invalid originalStartTime.")
+            start = parse_time(original.get('dateTime', original.get('date')))
+            event['id'] = instance_id(master_id, start, 'date' in original)
+            event['recurringEventId'] = master_id
+        else:
+            event['id'] = master_id or uuid.uuid4().hex
+            ical_uids[(calendar_id, uid)] = event['id']
+        return jsonify(store_event(calendar_id, event))
+
+# events.quickAdd
+@app.route(f'{API_PREFIX}/calendars/<calendar_id>/events/quickAdd', methods=['POST'])
+def quick_add(calendar_id):
+    """Understands "<text> YYYY-MM-DD HH:MM" and "<text> at 3pm"; anything else starts in an hour."""
+    text = request.args.get('text', '')
+    now = datetime.datetime.now(datetime.timezone.utc).replace(second=0, microsecond=0)
+    start = now + datetime.timedelta(hours=1)
+    iso_match = re.search(r'(\d{4}-\d{2}-\d{2})[ T](\d{1,2}:\d{2})', text)
+    hour_match = re.search(r'at (\d{1,2})(?::(\d{2}))?\s*(am|pm)?', text, re.IGNORECASE)
+    if iso_match:
+        start = datetime.datetime.fromisoformat(f"{iso_match.group(1)}T{iso_match.group(2).zfill(5)}+00:00")
+    elif hour_match:
+        hour = int(hour_match.group(1)) % 12 if hour_match.group(3) else int(hour_match.group(1))
+        if (hour_match.group(3) or '').lower() == 'pm':
+            hour += 12
+        start = now.replace(hour=hour, minute=int(hour_match.group(2) or 0))
+    body = {
+        "summary": text,
+        "start": {"dateTime": start.isoformat()},
+        "end": {"dateTime": (start + datetime.timedelta(hours=1)).isoformat()},
+    }
+    with state_lock:
+        return jsonify(store_event(calendar_id, new_event(body)))
+
+# events.get / update / patch / delete
+@app.route(f'{API_PREFIX}/calendars/<calendar_id>/events/<event_id>', methods=['GET', 'PUT', 'PATCH', 'DELETE'])
+def event_resource(calendar_id, event_id):
+    with state_lock:
+        event = calendars.get(calendar_id, {}).get(event_id) or find_instance(calendar_id, event_id)
+        if event is None or (event.get('status') == 'cancelled' and request.method != 'GET'):
+            return api_error(404, "notFound", "Not Found")
+
+        if_match = request.headers.get('If-Match')
+        if if_match and if_match != event['etag']:
+            return api_error(412, "conditionNotMet", "Precondition Failed")
+
+        if request.method == 'GET':
+            return jsonify(public(event))
+        if request.method == 'DELETE':
+            event['status'] = 'cancelled'
+            store_event(calendar_id, event)
+            return Response(status=204)
+
+        body = request.get_json()
+        updated = dict(body) if request.method == 'PUT' else {**event, **body}
+        updated['id'] = event_id
+        return jsonify(store_event(calendar_id, updated))
+
+# freebusy.query
+@app.route(f'{API_PREFIX}/freeBusy', methods=['POST'])
+def free_busy():
+    body = request.get_json()
+    time_min, time_max = parse_time(body['timeMin']), parse_time(body['timeMax'])
+    result = {}
+    with state_lock:
+        for item in body.get('items', []):
+            busy = []
+            for event in expand_events(list(calendars.get(item['id'], {}).values()), time_min, time_max):
+                if event.get('status') == 'cancelled' or event.get('transparency') == 'transparent':
+                    continue
+                start, end = event_bounds(event)
+                if start < time_max and end > time_min:
+                    busy.append((max(start, time_min), min(end, time_max)))
+            result[item['id']] = {"busy": [{"start": start.isoformat(), "end": end.isoformat()}
+                                           for start, end in sorted(busy)]}
+    return jsonify({"kind": "calendar#freeBusy", "timeMin": body['timeMin'], "timeMax": body['timeMax'],
+                    "calendars": result})
+
+# Batch requests (multipart/mixed), as sent by new_batch_http_request
+@app.route('/batch/calendar/v3', methods=['POST'])
+def batch():
+    message = BytesParser(policy=HTTP).parsebytes(
+        b'Content-Type: ' + request.headers['Content-Type'].encode() + b'\r\n\r\n' + request.get_data())
+    boundary = f"batch_{uuid.uuid4().hex}"
+    client = app.test_client()
+    parts = []
+    for part in message.iter_parts():
+        raw = part.get_payload(decode=True)
+        head, _, body = raw.partition(b'\r\n\r\n') if b'\r\n\r\n' in raw else raw.partition(b'\n\n')
+        lines = head.decode().splitlines()
+        method, path, _ = lines[0].split(' ', 2)
+        headers = dict(line.split(': ', 1) for line in lines[1:] if ': ' in line)
+        headers['X-Fake-Batch-Part'] = '1'
+        response = client.open(path, method=method, headers=headers, data=body)
+        content_id = part['Content-ID'] or ''
+        parts.append(
+            f"--{boundary}\r\nContent-Type: application/http\r\n"
+            f"Content-ID: <response-{content_id.strip('<>')}>\r\n\r\n"
+            f"HTTP/1.1 {response.status}\r\nContent-Type: application/json\r\n\r\n"
+            f"{response.get_data(as_text=True)}\r\n")
+    return Response(''.join(parts) + f"--{boundary}--\r\n",
+                    content_type=f"multipart/mixed; boundary={boundary}")
+
+
+# events.watch
+@app.route(f'{API_PREFIX}/calendars/<calendar_id>/events/watch', methods=['POST'])
+def watch_events(calendar_id):
+    body = request.get_json()
+    if body.get('type') != 'web_hook' or not body.get('address'):
+        return api_error(400, "invalid", "A web_hook address is required")
+    ttl = int(body.get('params', {}).get('ttl', 7 * 24 * 3600))
+    channel = {
+        "calendar_id": calendar_id,
+        "resource_id": f"resource-{calendar_id}",
+        "address": body['address'],
+        "token": body.get('token'),
+        "expiration": int((time.time() + ttl) * 1000),
+        "messages": 0,
+    }
+    with state_lock:
+        channels[body['id']] = channel
+    # Google confirms a new channel with a "sync" message
+    threading.Thread(target=send_notification, args=(body['id'], channel, 'sync'), daemon=True).start()
+    return jsonify({"kind": "api#channel", "id": body['id'], "resourceId": channel["resource_id"],
+                    "resourceUri": f"{request.host_url.rstrip('/')}{API_PREFIX}/calendars/{calendar_id}/events",
+                    "expiration": str(channel["expiration"])})
+
+# channels.stop
+@app.route(f'{API_PREFIX}/channels/stop', methods=['POST'])
+def stop_channel():
+    body = request.get_json()
+    with state_lock:
+        channel = channels.get(body.get('id'))
+        if channel is None or channel["resource_id"] != body.get('resourceId'):
+            return api_error(404, "notFound", "Channel not found")
+        del channels[body['id']]
+    return Response(status=204)
+
+
+# Push notifications, sent like Google's from a background thread
+def send_notification(channel_id, channel, state='exists'):
+    with state_lock:
+        channel["messages"] += 1
+        stats["notifications"] += 1
+        message_number = channel["messages"]
+    headers = {
+        "X-Goog-Channel-ID": channel_id,
+        "X-Goog-Channel-Token": channel["token"] or '',
+        "X-Goog-Channel-Expiration": time.strftime(
+            '%a, %d %b %Y %H:%M:%S GMT', time.gmtime(channel["expiration"] / 1000)),
+        "X-Goog-Resource-ID": channel["resource_id"],
+        "X-Goog-Resource-State": state,
+        "X-Goog-Message-Number": str(message_number),
+    }
+    try:
+        requests.post(channel["address"], headers=headers, timeout=10)
+    except requests.RequestException:
+        pass  # Google does not retry indefinitely either; the receiver catches up on its next pull
+
+def notifier_loop():
+    """Sends one notification per channel for every burst of changes to its calendar."""
+    while True:
+        with state_lock:
+            while not changed_calendars:
+                notify_wakeup.wait()
+            now = time.time() * 1000
+            targets = [(channel_id, channel) for channel_id, channel in channels.items()
+                       if channel["calendar_id"] in changed_calendars and channel["expiration"] > now]
+            changed_calendars.clear()
+        for channel_id, channel in targets:
+            send_notification(channel_id, channel)
+
+threading.Thread(target=notifier_loop, name="fake-notifier", daemon=True).start()
+
+
+# Fake-only control endpoints
+@app.route('/_fake/config', methods=['GET', 'POST'])
+def fake_config():
+    """Reads or updates latency_ms, jitter_ms and error_rate."""
+    if request.method == 'POST':
+        config.update({key: float(value) for key, value in request.get_json().items() if key in config})
+    return jsonify({"config": config, "stats": stats})
+
+@app.route('/_fake/reset', methods=['POST'])
+def fake_reset():
+    with state_lock:
+        calendars.clear()
+        ical_uids.clear()
+        channels.clear()
+        stats.update(requests=0, injected_errors=0, notifications=0)
+    return jsonify({"success": True})
+
+@app.route('/_fake/seed', methods=['POST'])
+def fake_seed():
+    """
+    Fills a calendar with events. Body: {"calendar_id", "start_date", "days",
+    "per_day", "duration", "timezone_offset"}; events are spread over 9:00-17:00 local time.
+    Returns the created events' ids and start times.
+    """
+    body = request.get_json() or {}
+    calendar_id = body.get('calendar_id', 'primary')
+    start_date = datetime.date.fromisoformat(body.get('start_date', datetime.date.today().isoformat()))
+    days, per_day = int(body.get('days', 5)), int(body.get('per_day', 4))
+    duration = int(body.get('duration', 30))
+    tz = datetime.timezone(datetime.timedelta(minutes=int(body.get('timezone_offset', 330))))
+    step = max(duration, (8 * 60) // max(per_day, 1))
+    created = []
+    with state_lock:
+        for day in range(days):
+            date = start_date + datetime.timedelta(days=day)
+            for index in range(per_day):
+                start = datetime.datetime.combine(date, datetime.time(9, 0), tz) + datetime.timedelta(minutes=index * step)
+                event = new_event({
+                    "summary": f"Seeded event {day}-{index}",
+                    "start": {"dateTime": start.isoformat()},
+                    "end": {"dateTime": (start + datetime.timedelta(minutes=duration)).isoformat()},
+                })
+                created.append({"id": store_event(calendar_id, event)['id'], "start": start.isoformat()})
+    return jsonify({"success": True, "events": created})
+
+
+@app.route('/_fake/notify', methods=['POST'])
+def fake_notify():
+    """Sends an "exists" notification to every channel on a calendar without changing it."""
+    calendar_id = (request.get_json(silent=True) or {}).get('calendar_id', 'primary')
+    with state_lock:
+        targets = [(channel_id, channel) for channel_id, channel in channels.items()
+                   if channel["calendar_id"] == calendar_id]
+    for channel_id, channel in targets:
+        send_notification(channel_id, channel)
+    return jsonify({"success": True, "notified": len(targets)})
+
+@app.route('/_fake/channels', methods=['GET'])
+def fake_channels():
+    with state_lock:
+        return jsonify({"channels": {channel_id: dict(channel) for channel_id, channel in channels.items()}})
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Local fake of the Google Calendar v3 API.")
+    arg_parser.add_argument('--port', type=int, default=8085)
+    arg_parser.add_argument('--latency-ms', type=float, default=config["latency_ms"])
+    arg_parser.add_argument('--jitter-ms', type=float, default=config["jitter_ms"])
+    arg_parser.add_argument('--error-rate', type=float, default=config["error_rate"])
+    args = arg_parser.parse_args()
+    config.update(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    app.run(port=args.port, threaded=True)
@@ -0,0 +1,137 @@
+import os
+import time
+import datetime
+import threading
+import pytz
+from event_record import parse_timestamp
+
+# Configuration
+FREEBUSY_TTL = float(os.getenv('FREEBUSY_TTL', '60'))  # Seconds a cached day stays valid
+MAX_CALENDARS_PER_QUERY = 50  # freebusy.query limit on items
+MAX_DAYS_PER_QUERY = 60  # Keep each query well inside the API's time range limit
+
+
+class FreeBusyCache:
+    """
+    Busy intervals from freebusy().query, cached per (calendar, day).
+
+    FreeBusy returns only start/end pairs, so availability checks move a
+    fraction of the bytes of events.list and cover many calendars in one
+    call. Missing or expired days are fetched together in a single query.
+    """
+
+    def __init__(self, service_factory, timezone="UTC", ttl=FREEBUSY_TTL):
+        self.service_factory = service_factory
+        self.timezone = pytz.timezone(timezone)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._days = {}  # (calendar_id, date) -> (fetched_at, [(start_ts, end_ts), ...])
+        self.hits = 0
+        self.misses = 0
+
+    def busy_between(self, calendar_ids, time_min, time_max):
+        """Returns {calendar_id: [(start_ts, end_ts), ...]} of busy time overlapping [time_min, time_max)."""
+        days = self._days_covering(time_min, time_max)
+        now = time.time()
+        with self._lock:
+            stale = [
+                (calendar_id, day) for calendar_id in calendar_ids for day in days
+                if now - self._days.get((calendar_id, day), (float('-inf'),))[0] > self.ttl
+            ]
+            self.hits += len(calendar_ids) * len(days) - len(stale)
+            self.misses += len(stale)
+
+        if stale:
+            self._fetch(sorted({calendar_id for calendar_id, _ in stale}),
+                        min(day for _, day in stale), max(day for _, day in stale))
+
+        start_ts, end_ts = time_min.timestamp(), time_max.timestamp()
+        result = {}
+        with self._lock:
+            for calendar_id in calendar_ids:
+                intervals = []
+                for day in days:
+                    for busy_start, busy_end in self._days.get((calendar_id, day), (0, []))[1]:
+                        if busy_start < end_ts and busy_end > start_ts:
+                            intervals.append((busy_start, busy_end))
+                result[calendar_id] = intervals
+        return result
+
+    def is_free(self, calendar_ids, time_min, time_max):
+        """True if none of the calendars is busy during [time_min, time_max)."""
+        busy = self.busy_between(calendar_ids, time_min, time_max)
+        return not any(busy.values())
+
+    def __len__(self):
+        """Cached busy intervals, across every calendar and day."""
+        with self._lock:
+            return sum(len(intervals) for _, intervals in self._days.values())
+
+    def invalidate(self, calendar_id, day=None):
+        """Drops one cached day, or every day of a calendar."""
+        with self._lock:
+            if day is not None:
+                self._days.pop((calendar_id, day), None)
+                return
+            for key in [key for key in self._days if key[0] == calendar_id]:
+                del self._days[key]
+
+    def invalidate_between(self, calendar_id, start_ts, end_ts):
+        """Drops the cached days touched by an interval."""
+        start = datetime.datetime.fromtimestamp(start_ts, self.timezone)
+        end = datetime.datetime.fromtimestamp(end_ts, self.timezone)
+        for day in self._days_covering(start, end):
+            self.invalidate(calendar_id, day)
+
+    def _days_covering(self, time_min, time_max):
+        first = time_min.astimezone(self.timezone).date()
+        last = (time_max - datetime.timedelta(microseconds=1)).astimezone(self.timezone).date()
+        return [first + datetime.timedelta(days=offset) for offset in range((last - first).days + 1)]
+
+    def _day_bounds(self, day):
+        start = self.timezone.localize(datetime.datetime.combine(day, datetime.time(0, 0)))
+        end = self.timezone.localize(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(0, 0)))
+        return start, end
+
+    def _fetch(self, calendar_ids, first_day, last_day):
+        service = self.service_factory()
+        day = first_day
+        while day <= last_day:
+            chunk_last = min(last_day, day + datetime.timedelta(days=MAX_DAYS_PER_QUERY - 1))
+            time_min = self._day_bounds(day)[0]
+            time_max = self._day_bounds(chunk_last)[1]
+
+            for offset in range(0, len(calendar_ids), MAX_CALENDARS_PER_QUERY):
+                chunk = calendar_ids[offset:offset + MAX_CALENDARS_PER_QUERY]
+                fetched_at = time.time()
+                response = service.freebusy().query(body={
+                    "timeMin": time_min.isoformat(),
+                    "timeMax": time_max.isoformat(),
+                    "timeZone": self.timezone.zone,
+                    "items": [{"id": calendar_id} for calendar_id in chunk],
+                }).execute()
+                self._store(response, chunk, day, chunk_last, fetched_at)
+
+            day = chunk_last + datetime.timedelta(days=1)
+
+    def _store(self, response, calendar_ids, first_day, last_day, fetched_at):
+        calendars = response.get('calendars', {})
+        for calendar_id in calendar_ids:
+            entry = calendars.get(calendar_id, {})
+            if entry.get('errors'):
+                reason = entry['errors'][0].get('reason', 'unknown')
+                raise ValueError(f"FreeBusy lookup failed for {calendar_id}: {reason}")
+
+            busy = [(parse_timestamp(interval['start']), parse_timestamp(interval['end']))
+                    for interval in entry.get('busy', [])]
+
+            day = first_day
+            with self._lock:
+                while day <= last_day:
+                    day_start, day_end = (bound.timestamp() for bound in self._day_bounds(day))
+                    # Clip intervals to the day so each cache entry stands alone
+                    self._days[(calendar_id, day)] = (fetched_at, [
+                        (max(start, day_start), min(end, day_end))
+                        for start, end in busy if start < day_end and end > day_start
+                    ])
+                    day += datetime.timedelta(days=1)
@@ -0,0 +1,332 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import datetime
+import threading
+from dateutil import tz
+from scheduling import data_path
+
+# Configuration
+IMPORT_LOG_PATH = os.getenv('IMPORT_LOG_PATH') or data_path('imports.db')
+MAX_LINE_OCTETS = 75  # RFC 5545 folds content lines longer than this
+READ_CHUNK_SIZE = 64 * 1024
+MAX_RECORDED_ERRORS = 20  # Per import; later errors are only counted
+PRODID = '-//crewai-text-calendar-bot//EN'
+TEXT_PROPERTIES = {'SUMMARY', 'DESCRIPTION', 'LOCATION'}
+RECURRENCE_PROPERTIES = {'RRULE', 'EXRULE', 'RDATE', 'EXDATE'}
+DURATION_VALUE = re.compile(r'([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+IMPORT_COLUMNS = "id, user_id, status, processed, imported, failed, errors, created_at, updated_at"
+
+
+# Writing
+def escape_text(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold(line):
+    """Splits a content line into CRLF-terminated pieces of at most 75 octets, never inside a character."""
+    pieces = []
+    current, size = [], 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        limit = MAX_LINE_OCTETS if not pieces else MAX_LINE_OCTETS - 1  # Continuations start with a space
+        if size + width > limit:
+            pieces.append(''.join(current))
+            current, size = [], 0
+        current.append(char)
+        size += width
+    pieces.append(''.join(current))
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+def _format_time(name, value, default_zone, local):
+    # Dates stay dates; timed values are written in UTC, or as TZID wall time when
+    # `local` is set, which recurring events need to keep their hour across DST
+    if 'date' in value:
+        return f"{name};VALUE=DATE:{value['date'].replace('-', '')}"
+    moment = datetime.datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+    if local:
+        zone_name = value.get('timeZone') or default_zone
+        zone = tz.gettz(zone_name)
+        if zone is not None:
+            if moment.tzinfo is not None:
+                moment = moment.astimezone(zone)
+            return f"{name};TZID={zone_name}:{moment.strftime('%Y%m%dT%H%M%S')}"
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=tz.gettz(value.get('timeZone') or default_zone))
+    return f"{name}:{moment.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')}"
+
+
+def calendar_header(timezone):
+    return ''.join(fold(line) for line in (
+        'BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH', f'X-WR-TIMEZONE:{timezone}'))
+
+
+def calendar_footer():
+    return fold('END:VCALENDAR')
+
+
+def event_to_ics(event, timezone):
+    """
+    One Calendar API event resource as a VEVENT. Modified or cancelled
+    occurrences share their series' UID and carry a RECURRENCE-ID.
+    """
+    recurring = bool(event.get('recurrence') or event.get('recurringEventId'))
+    stamp = event.get('updated') or datetime.datetime.now(datetime.timezone.utc).isoformat()
+    stamp = datetime.datetime.fromisoformat(stamp.replace('Z', '+00:00')).astimezone(datetime.timezone.utc)
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:{event.get('iCalUID') or event['id'] + '@google.com'}",
+        f"DTSTAMP:{stamp.strftime('%Y%m%dT%H%M%SZ')}",
+    ]
+    if event.get('originalStartTime'):
+        lines.append(_format_time('RECURRENCE-ID', event['originalStartTime'], timezone, recurring))
+    if event.get('status') == 'cancelled':
+        lines.append('STATUS:CANCELLED')
+    if event.get('start'):
+        lines.append(_format_time('DTSTART', event['start'], timezone, recurring))
+        lines.append(_format_time('DTEND', event['end'], timezone, recurring))
+    lines.extend(event.get('recurrence', []))
+    for name, key in (('SUMMARY', 'summary'), ('DESCRIPTION', 'description'), ('LOCATION', 'location')):
+        if event.get(key):
+            lines.append(f"{name}:{escape_text(event[key])}")
+    if event.get('transparency') == 'transparent':
+        lines.append('TRANSP:TRANSPARENT')
+    if event.get('status') == 'tentative':
+        lines.append('STATUS:TENTATIVE')
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def export_calendar(events, timezone):
+    """Yields an iCalendar document piece by piece, one VEVENT per event, as events arrive."""
+    yield calendar_header(timezone)
+    for event in events:
+        yield event_to_ics(event, timezone)
+    yield calendar_footer()
+
+
+# Reading
+def iter_lines(stream, chunk_size=READ_CHUNK_SIZE):
+    """Reads a byte stream in chunks and yields unfolded content lines."""
+    pending = b''
+    current = None
+    while True:
+        chunk = stream.read(chunk_size)
+        if chunk:
+            pending += chunk
+            *raw_lines, pending = pending.split(b'\n')
+        else:
+            raw_lines, pending = ([pending] if pending else []), b''
+        for raw in raw_lines:
+            line = raw.rstrip(b'\r').decode('utf-8', errors='replace')
+            if line[:1] in (' ', '\t') and current is not None:
+                current += line[1:]
+                continue
+            if current:
+                yield current
+            current = line
+        if not chunk:
+            if current:
+                yield current
+            return
+
+
+def parse_line(line):
+    """Splits "NAME;PARAM=value:VALUE" into (NAME, {PARAM: value}, VALUE); quoted parameters may hold ':' and ';'."""
+    parts, quoted, start = [], False, 0
+    for index, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char in ';:':
+            parts.append(line[start:index])
+            start = index + 1
+            if char == ':':
+                break
+    else:
+        raise ValueError(f"Invalid content line: {line[:40]}")
+    name, params = parts[0].upper(), {}
+    for part in parts[1:]:
+        key, _, value = part.partition('=')
+        params[key.upper()] = value.strip('"')
+    return name, params, line[start:]
+
+
+def unescape_text(value):
+    return re.sub(r'\\([\\;,nN])', lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def iter_vevents(lines):
+    """
+    Yields each top-level VEVENT as a list of (name, params, value, line)
+    tuples. Everything outside VEVENTs (VTIMEZONE, VTODO, ...) and
+    components nested inside them (VALARM) is skipped.
+    """
+    depth = 0  # Components open inside the current VEVENT
+    properties = None
+    for line in lines:
+        if not line:
+            continue
+        upper = line.upper()
+        if upper.startswith('BEGIN:'):
+            if properties is not None:
+                depth += 1
+            elif upper == 'BEGIN:VEVENT':
+                properties = []
+            continue
+        if upper.startswith('END:'):
+            if properties is not None:
+                if depth:
+                    depth -= 1
+                elif upper == 'END:VEVENT':
+                    yield properties
+                    properties = None
+            continue
+        if properties is not None and not depth:
+            name, params, value = parse_line(line)
+            properties.append((name, params, value, line))
+
+
+def _parse_duration(value):
+    match = DURATION_VALUE.match(value.strip().upper())
+    if not match:
+        raise ValueError(f"Invalid DURATION: {value}")
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    delta = datetime.timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                               minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -delta if sign == '-' else delta
+
+
+def _parse_time(params, value, default_zone):
+    # (Calendar API time dict, date or aware datetime); floating times and unknown TZIDs use default_zone
+    value = value.strip()
+    if params.get('VALUE', '').upper() == 'DATE' or len(value) == 8:
+        day = datetime.datetime.strptime(value[:8], '%Y%m%d').date()
+        return {'date': day.isoformat()}, day
+    moment = datetime.datetime.strptime(value.rstrip('Zz'), '%Y%m%dT%H%M%S')
+    zone_name = params.get('TZID') if params.get('TZID') and tz.gettz(params['TZID']) else default_zone
+    if value[-1:] in 'Zz':
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    else:
+        moment = moment.replace(tzinfo=tz.gettz(zone_name))
+    return {'dateTime': moment.isoformat(), 'timeZone': zone_name}, moment
+
+
+def vevent_to_google(properties, default_zone):
+    """
+    Builds an events.import body from iter_vevents() output. A missing UID is
+    derived from the event's content, so importing the same file twice
+    updates its events instead of duplicating them.
+    """
+    values = {}
+    body = {}
+    recurrence = []
+    for name, params, value, line in properties:
+        if name in RECURRENCE_PROPERTIES:
+            recurrence.append(line)
+        elif name not in values:
+            values[name] = (params, value)
+
+    if 'DTSTART' not in values:
+        raise ValueError("VEVENT without DTSTART")
+    body['start'], start = _parse_time(*values['DTSTART'], default_zone)
+    if 'DTEND' in values:
+        body['end'], _ = _parse_time(*values['DTEND'], default_zone)
+    else:
+        length = _parse_duration(values['DURATION'][1]) if 'DURATION' in values else \
+            datetime.timedelta(days=1 if 'date' in body['start'] else 0)
+        end = start + length
+        body['end'] = {'date': end.isoformat()} if 'date' in body['start'] else \
+            {'dateTime': end.isoformat(), 'timeZone': body['start']['timeZone']}
+
+    uid = values.get('UID', (None, ''))[1].strip()
+    if not uid:
+        digest = hashlib.sha1('\n'.join(line for *_, line in properties).encode()).hexdigest()
+        uid = f"{digest}@import"
+    body['iCalUID'] = uid
+    if 'RECURRENCE-ID' in values:
+        body['originalStartTime'], _ = _parse_time(*values['RECURRENCE-ID'], default_zone)
+    if recurrence:
+        body['recurrence'] = recurrence
+    for name, key in (('SUMMARY', 'summary'), ('DESCRIPTION', 'description'), ('LOCATION', 'location')):
+        if name in values:
+            body[key] = unescape_text(values[name][1])
+    status = values.get('STATUS', (None, ''))[1].strip().upper()
+    if status in ('CANCELLED', 'TENTATIVE'):
+        body['status'] = status.lower()
+    if values.get('TRANSP', (None, ''))[1].strip().upper() == 'TRANSPARENT':
+        body['transparency'] = 'transparent'
+    return body
+
+
+class ImportLog:
+    """
+    Progress of ICS imports, persisted so an interrupted import can resume.
+
+    `processed` counts the VEVENTs of the file, in order, that were sent
+    and answered; resuming skips that many before sending again.
+    """
+
+    def __init__(self, path=IMPORT_LOG_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS imports (
+                id TEXT PRIMARY KEY,
+                user_id TEXT,
+                status TEXT NOT NULL,
+                processed INTEGER NOT NULL DEFAULT 0,
+                imported INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                errors TEXT NOT NULL DEFAULT '[]',
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+        """)
+
+    def start(self, import_id, user_id=None):
+        """
+        Returns the import, created if new; an existing one of the same user is
+        marked running again. Another user's import is returned unchanged.
+        """
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO imports (id, user_id, status, created_at, updated_at) "
+                    "VALUES (?, ?, 'running', ?, ?)", (import_id, user_id, now, now))
+                self._conn.execute(
+                    "UPDATE imports SET status = 'running', updated_at = ? "
+                    "WHERE id = ? AND user_id IS ? AND status != 'completed'", (now, import_id, user_id))
+            return self._get(import_id)
+
+    def record(self, import_id, processed, imported, failed, errors=(), status='running'):
+        """Adds a batch's outcome and returns the updated import."""
+        now = time.time()
+        with self._lock:
+            current = self._get(import_id)
+            recorded = (current["errors"] + list(errors))[:MAX_RECORDED_ERRORS]
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE imports SET status = ?, processed = processed + ?, imported = imported + ?, "
+                    "failed = failed + ?, errors = ?, updated_at = ? WHERE id = ?",
+                    (status, processed, imported, failed, json.dumps(recorded), now, import_id))
+            return self._get(import_id)
+
+    def get(self, import_id):
+        with self._lock:
+            return self._get(import_id)
+
+    def _get(self, import_id):
+        # Caller must hold self._lock
+        row = self._conn.execute(f"SELECT {IMPORT_COLUMNS} FROM imports WHERE id = ?", (import_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(zip([column.strip() for column in IMPORT_COLUMNS.split(',')], row))
+        record["errors"] = json.loads(record["errors"])
+        return record
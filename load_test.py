@@ -0,0 +1,83 @@
+import time
+import asyncio
+import argparse
+import statistics
+import httpx
+
+
+# Fire concurrent requests built by make_request and record latencies per label
+async def drive(base_url, make_request, concurrency=50, total_requests=500):
+    """
+    make_request(i) returns (label, method, path, params, json_body) for the
+    i-th request. At most `concurrency` requests are in flight.
+    Returns ({label: [latency_seconds]}, {label: error_count}, elapsed_seconds).
+    """
+    latencies = {}
+    errors = {}
+    counter = iter(range(total_requests))
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        async def worker():
+            for index in counter:
+                label, method, path, params, json_body = make_request(index)
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, params=params, json=json_body)
+                    failed = response.status_code >= 400 or not response.json().get("success", False)
+                except (httpx.HTTPError, ValueError):
+                    failed = True
+                latencies.setdefault(label, []).append(time.perf_counter() - started)
+                if failed:
+                    errors[label] = errors.get(label, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return latencies, errors, elapsed
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    """Returns throughput and p50/p95/p99 latency (ms) for one set of samples."""
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+    }
+
+
+# Fire concurrent requests at one route and measure throughput
+async def run_load(base_url, path, params=None, concurrency=50, total_requests=500, method="GET", json_body=None):
+    """Sends total_requests identical requests and summarizes them."""
+    latencies, errors, elapsed = await drive(
+        base_url, lambda index: (path, method, path, params, json_body), concurrency, total_requests)
+    return summarize(latencies.get(path, []), errors.get(path, 0), elapsed)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Compare throughput of the Flask and ASGI calendar servers.")
+    arg_parser.add_argument('--flask-url', default="http://127.0.0.1:5000")
+    arg_parser.add_argument('--asgi-url', default="http://127.0.0.1:5002")
+    arg_parser.add_argument('--path', default="/get-events-by-date")
+    arg_parser.add_argument('--param', action='append', default=["date=2025-03-10"],
+                            help="Query parameter as key=value, may be repeated")
+    arg_parser.add_argument('--concurrency', type=int, default=50)
+    arg_parser.add_argument('--requests', type=int, default=500)
+    args = arg_parser.parse_args()
+
+    query = dict(param.split('=', 1) for param in args.param)
+    for name, url in (("flask", args.flask_url), ("asgi", args.asgi_url)):
+        result = asyncio.run(run_load(url, args.path, query, args.concurrency, args.requests))
+        print(f"{name:>5}: {result}")
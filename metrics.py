@@ -0,0 +1,314 @@
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from flask import Response, g, request
+from googleapiclient.http import HttpRequest
+from googleapiclient.errors import HttpError
+
+# Configuration
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Seconds; LLM calls need the tail
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """
+    Metrics of one process in the Prometheus text format.
+
+    Besides the metrics registered here, collectors are called on every
+    scrape and return (name, type, help, [(labels, value)]) tuples, so
+    counters that already exist elsewhere (cache stats, pool stats) are
+    exported without being counted twice.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        for collector in collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    """A named family of samples, one child per combination of label values."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values, **kwargs):
+        key = tuple(str(value) for value in values) or tuple(str(kwargs[name]) for name in self.labelnames)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _unlabelled(self):
+        return self.labels()
+
+    def samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            yield from child.samples(self.name, dict(zip(self.labelnames, key)))
+
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+    def dec(self, amount=1):
+        self._unlabelled().dec(amount)
+
+    def set(self, value):
+        self._unlabelled().set(value)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        with self._lock:
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            yield f"{name}_bucket", dict(labels, le=format_value(bound)), cumulative
+        yield f"{name}_bucket", dict(labels, le='+Inf'), count
+        yield f"{name}_sum", labels, total
+        yield f"{name}_count", labels, count
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _Histogram(self.buckets)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+    def time(self):
+        return self._unlabelled().time()
+
+
+# Calls leaving the process: Google API methods, LLM requests, agent tools, ...
+UPSTREAM_SECONDS = Histogram('upstream_request_seconds', "Latency of calls to other services",
+                             ('service', 'operation'))
+UPSTREAM_ERRORS = Counter('upstream_errors_total', "Failed calls to other services",
+                          ('service', 'operation', 'reason'))
+UPSTREAM_IN_FLIGHT = Gauge('upstream_requests_in_flight', "Calls to other services awaiting a response",
+                           ('service',))
+
+
+def error_reason(error):
+    """Short label for a failure: the HTTP status when there is one, else the exception type."""
+    if isinstance(error, HttpError):
+        return str(error.resp.status)
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return str(status) if status else type(error).__name__
+
+
+@contextmanager
+def track_upstream(service, operation):
+    """Times a call to another service and counts it as an error if it raises."""
+    UPSTREAM_IN_FLIGHT.labels(service).inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        UPSTREAM_ERRORS.labels(service, operation, error_reason(e)).inc()
+        raise
+    finally:
+        UPSTREAM_SECONDS.labels(service, operation).observe(time.perf_counter() - start)
+        UPSTREAM_IN_FLIGHT.labels(service).dec()
+
+
+def timed(service, operation):
+    """
+    Decorator form of track_upstream; keeps the wrapped signature for tool frameworks.
+    A returned {"success": False, ...} dict also counts as an error.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with track_upstream(service, operation):
+                result = func(*args, **kwargs)
+            if isinstance(result, dict) and result.get('success') is False:
+                UPSTREAM_ERRORS.labels(service, operation, 'unsuccessful').inc()
+            return result
+        return wrapper
+    return decorator
+
+
+class InstrumentedRequest(HttpRequest):
+    """HttpRequest timed per API method, e.g. calendar.events.list."""
+
+    def execute(self, http=None, num_retries=0):
+        with track_upstream('google_calendar', self.methodId or 'unknown'):
+            return super().execute(http=http, num_retries=num_retries)
+
+
+# Inbound HTTP, per route template so path parameters do not multiply series
+HTTP_SECONDS = Histogram('http_request_duration_seconds', "Latency of requests served, by route",
+                         ('route', 'method', 'status'))
+HTTP_IN_FLIGHT = Gauge('http_requests_in_flight', "Requests being served, by route", ('route',))
+HTTP_ERRORS = Counter('http_request_errors_total', "Requests answered with a 5xx status", ('route', 'status'))
+
+
+def instrument_app(app, registry=REGISTRY):
+    """Records per-route latency, in-flight requests and errors, and serves them at /metrics."""
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.metrics_start = time.perf_counter()
+        HTTP_IN_FLIGHT.labels(g.metrics_route).inc()
+
+    @app.after_request
+    def observe_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = g.metrics_route
+            HTTP_SECONDS.labels(route, request.method, response.status_code).observe(time.perf_counter() - start)
+            if response.status_code >= 500:
+                HTTP_ERRORS.labels(route, response.status_code).inc()
+        return response
+
+    @app.teardown_request
+    def finish_request(error=None):
+        route = g.pop('metrics_route', None)
+        if route is not None:
+            HTTP_IN_FLIGHT.labels(route).dec()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+    return app
+
+
+def cache_samples(caches):
+    """Collector output for {cache name: (hits, misses)}: hit and miss counters plus a hit ratio."""
+    requests_total = []
+    ratios = []
+    for cache, (hits, misses) in caches.items():
+        requests_total.append(({"cache": cache, "result": "hit"}, hits))
+        requests_total.append(({"cache": cache, "result": "miss"}, misses))
+        ratios.append(({"cache": cache}, hits / (hits + misses) if hits + misses else 0.0))
+    return [
+        ('cache_requests_total', 'counter', "Cache lookups by result", requests_total),
+        ('cache_hit_ratio', 'gauge', "Share of cache lookups answered from the cache", ratios),
+    ]
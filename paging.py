@@ -0,0 +1,29 @@
+import os
+
+# Configuration
+DEFAULT_PAGE_SIZE = int(os.getenv('EVENTS_PAGE_SIZE', '250'))  # events.list maxResults, up to 2500
+
+
+# Lazily page through events.list
+def iter_event_pages(service, page_size=DEFAULT_PAGE_SIZE, **params):
+    """
+    Yields events.list responses one page at a time, following nextPageToken.
+    The next page is only requested once the caller asks for it, so stopping
+    early saves the remaining round trips. The last page carries nextSyncToken.
+    """
+    page_token = None
+    while True:
+        if page_token:
+            params['pageToken'] = page_token
+        page = service.events().list(maxResults=page_size, **params).execute()
+        yield page
+
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def iter_events(service, page_size=DEFAULT_PAGE_SIZE, **params):
+    """Yields events across all pages of an events.list query."""
+    for page in iter_event_pages(service, page_size=page_size, **params):
+        yield from page.get('items', [])
@@ -0,0 +1,162 @@
+import os
+import time
+import threading
+import contextvars
+import urllib.parse
+from googleapiclient.http import HttpRequest
+
+# Flask is only needed to name the route a call was made for
+try:
+    from flask import has_request_context, request
+except ImportError:
+    has_request_context = None
+
+# Configuration
+PAYLOAD_BUDGET_BYTES = int(os.getenv('PAYLOAD_BUDGET_BYTES', str(512 * 1024)))  # Per decoded response; 0 disables
+# Per-route overrides, e.g. "/export.ics=0,/available-slots=65536"
+PAYLOAD_BUDGETS = os.getenv('PAYLOAD_BUDGETS', '')
+PAYLOAD_BUDGET_ENFORCE = os.getenv('PAYLOAD_BUDGET_ENFORCE', '0') == '1'  # Raise instead of only counting
+BACKGROUND_ROUTE = 'background'  # Calls made outside a request: pushes, queued writes, ...
+route_override = contextvars.ContextVar('payload_route', default=None)  # Set by servers that are not Flask
+
+# What the routes read from an event: Event.from_google, the mirror and the write-through paths
+EVENT_MASK = 'id,etag,status,summary,start,end,recurrence,recurringEventId,originalStartTime'
+EXPORT_EVENT_MASK = EVENT_MASK + ',iCalUID,updated,description,location,transparency'
+
+# Partial-response masks per API method; methods not listed get full responses
+FIELD_MASKS = {
+    'calendar.events.list': f'nextPageToken,nextSyncToken,items({EVENT_MASK})',
+    'calendar.events.instances': f'nextPageToken,items({EVENT_MASK})',
+    'calendar.events.get': EVENT_MASK,
+    'calendar.events.insert': EVENT_MASK,
+    'calendar.events.import': EVENT_MASK,
+    'calendar.events.quickAdd': EVENT_MASK,
+    'calendar.events.patch': EVENT_MASK,
+    'calendar.events.update': EVENT_MASK,
+    'calendar.events.watch': 'id,resourceId,expiration',
+    'calendar.freebusy.query': 'calendars',
+}
+
+# Routes that need more (or less) than the method's default mask
+ROUTE_FIELD_MASKS = {
+    '/export.ics': {
+        'calendar.events.list': f'nextPageToken,items({EXPORT_EVENT_MASK})',
+    },
+}
+
+
+class PayloadBudgetExceeded(ValueError):
+    pass
+
+
+def current_route():
+    """The URL rule of the request being served, or BACKGROUND_ROUTE."""
+    if route_override.get():
+        return route_override.get()
+    if has_request_context is not None and has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return BACKGROUND_ROUTE
+
+
+def field_mask(route, method_id):
+    return ROUTE_FIELD_MASKS.get(route, {}).get(method_id, FIELD_MASKS.get(method_id))
+
+
+def parse_budgets(text):
+    budgets = {}
+    for part in filter(None, (part.strip() for part in text.split(','))):
+        route, _, size = part.rpartition('=')
+        budgets[route] = int(size)
+    return budgets
+
+
+class PayloadStats:
+    """
+    Response sizes and JSON decode times of API calls, per (route, method).
+
+    Sizes are of the decoded body, after gzip: that is what the fields mask
+    shrinks and what the process has to parse. Responses larger than their
+    route's budget are counted, or raise PayloadBudgetExceeded if enforced.
+    """
+
+    def __init__(self, budget=PAYLOAD_BUDGET_BYTES, budgets=None, enforce=PAYLOAD_BUDGET_ENFORCE):
+        self.budget = budget
+        self.budgets = parse_budgets(PAYLOAD_BUDGETS) if budgets is None else budgets
+        self.enforce = enforce
+        self._lock = threading.Lock()
+        self._table = {}  # (route, method) -> counters
+
+    def budget_for(self, route):
+        return self.budgets.get(route, self.budget)
+
+    def record(self, route, method, size, seconds, gzipped):
+        budget = self.budget_for(route)
+        over = bool(budget) and size > budget
+        with self._lock:
+            row = self._table.get((route, method))
+            if row is None:
+                row = self._table[(route, method)] = {
+                    "calls": 0, "bytes": 0, "max_bytes": 0, "decode_seconds": 0.0,
+                    "max_decode_seconds": 0.0, "gzipped": 0, "over_budget": 0}
+            row["calls"] += 1
+            row["bytes"] += size
+            row["max_bytes"] = max(row["max_bytes"], size)
+            row["decode_seconds"] += seconds
+            row["max_decode_seconds"] = max(row["max_decode_seconds"], seconds)
+            row["gzipped"] += int(gzipped)
+            row["over_budget"] += int(over)
+        if over and self.enforce:
+            raise PayloadBudgetExceeded(f"{method} returned {size} bytes for {route}, over its budget of {budget}")
+
+    def rows(self):
+        """(route, method, counters) for every pair seen so far."""
+        with self._lock:
+            return [(route, method, dict(row)) for (route, method), row in sorted(self._table.items())]
+
+    def snapshot(self):
+        table = {}
+        for route, method, row in self.rows():
+            table.setdefault(route, {})[method] = dict(
+                row, avg_bytes=row["bytes"] // row["calls"],
+                decode_ms=round(row["decode_seconds"] * 1000, 2),
+                max_decode_ms=round(row["max_decode_seconds"] * 1000, 2),
+                budget=self.budget_for(route))
+            for key in ("decode_seconds", "max_decode_seconds"):
+                table[route][method].pop(key)
+        return table
+
+
+PAYLOAD_STATS = PayloadStats()
+
+
+class PayloadRequest(HttpRequest):
+    """
+    HttpRequest that asks only for the fields its route uses and records the
+    size and decode time of the response, including inside batch requests.
+    A fields parameter passed at the call site is left as it is.
+    """
+
+    stats = PAYLOAD_STATS
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.route = current_route()
+        mask = field_mask(self.route, self.methodId)
+        query = urllib.parse.urlparse(self.uri).query
+        if mask and 'fields' not in urllib.parse.parse_qs(query):
+            self.uri += ('&' if query else '?') + urllib.parse.urlencode({'fields': mask})
+        # JsonModel already asks for gzip; Google also wants "gzip" in the user agent
+        self.headers.setdefault('accept-encoding', 'gzip, deflate')
+        if 'gzip' not in self.headers.get('user-agent', ''):
+            self.headers['user-agent'] = (self.headers.get('user-agent', '') + ' (gzip)').strip()
+        decode = self.postproc
+        self.postproc = lambda resp, content: self._decode(decode, resp, content)
+
+    def _decode(self, decode, resp, content):
+        start = time.perf_counter()
+        result = decode(resp, content)
+        # httplib2 unzips transparently and keeps the original encoding under -content-encoding
+        gzipped = 'gzip' in resp.get('-content-encoding', '') or 'gzip' in resp.get('content-encoding', '')
+        self.stats.record(self.route, self.methodId or 'unknown', len(content or b''),
+                          time.perf_counter() - start, gzipped)
+        return result
@@ -0,0 +1,264 @@
+import os
+import re
+import json
+import time
+import hashlib
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+from googleapiclient.http import HttpRequest
+from googleapiclient.errors import HttpError
+from calendar_client import CREDENTIALS_FILE
+
+# fcntl is POSIX only; without it buckets are shared between threads but not processes
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Configuration
+RATE_LIMIT_QPS = float(os.getenv('RATE_LIMIT_QPS', '10'))  # Sustained requests per second per account; 0 disables
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', '20'))  # Bucket size
+RATE_LIMIT_RESERVE = float(os.getenv('RATE_LIMIT_RESERVE', '0.25'))  # Share of the bucket background work may not use
+RATE_LIMIT_PENALTY = float(os.getenv('RATE_LIMIT_PENALTY', '2'))  # Seconds every caller pauses after a rate-limit error
+# Buckets are only shared by processes using the same directory; see default_directory()
+RATE_LIMIT_DIR = os.getenv('RATE_LIMIT_DIR')
+RATE_LIMIT_NAMESPACE = os.getenv('RATE_LIMIT_NAMESPACE')  # Defaults to the OAuth client id in credentials.json
+BUCKET_FORMAT = struct.Struct('<ddd')  # tokens, updated_at, interactive_until
+RATE_LIMIT_REASON = re.compile(rb'rateLimitExceeded', re.IGNORECASE)  # Also matches userRateLimitExceeded
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+_priority = threading.local()
+
+
+@contextmanager
+def background():
+    """Marks API calls made by this thread inside the block as background work."""
+    previous = getattr(_priority, 'value', INTERACTIVE)
+    _priority.value = BACKGROUND
+    try:
+        yield
+    finally:
+        _priority.value = previous
+
+
+def current_priority():
+    return getattr(_priority, 'value', INTERACTIVE)
+
+
+def default_directory(credentials_file=CREDENTIALS_FILE):
+    """
+    Calendar quotas belong to a Google Cloud project, so by default buckets
+    live under the temp dir in a folder named after the OAuth client, and
+    other deployments on the host never draw from them. Without a client
+    file (e.g. fake auth) the working directory names the deployment instead.
+    """
+    namespace = RATE_LIMIT_NAMESPACE
+    if not namespace:
+        try:
+            with open(credentials_file) as f:
+                config = json.load(f)
+            namespace = (config.get('installed') or config.get('web') or {}).get('client_id')
+        except (OSError, ValueError, AttributeError):
+            namespace = None
+        namespace = f"client:{namespace}" if namespace else f"cwd:{os.getcwd()}"
+    digest = hashlib.sha1(namespace.encode()).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), 'calendar-rate-limits', digest)
+
+
+def is_rate_limited(error):
+    """True for 429s and for the 403s Calendar sends when a quota is exhausted."""
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    return status == 429 or (status == 403 and bool(RATE_LIMIT_REASON.search(error.content or b'')))
+
+
+class TokenBucket:
+    """
+    One account's request budget, stored in a small file so every process on
+    the host draws from the same bucket.
+
+    The file holds the token count, when it was last refilled and until when
+    an interactive caller is waiting. Interactive calls take a token even if
+    that leaves the bucket negative, then sleep until the debt is repaid, so
+    they are served in order. Background calls wait instead: they only take
+    a token while no interactive caller is queued and the bucket is fuller
+    than the reserve kept for interactive calls.
+    """
+
+    def __init__(self, key, rate, burst, reserve, directory):
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve * burst
+        self.path = os.path.join(directory, f"{key}.bucket") if fcntl else None
+        self._lock = threading.Lock()  # flock does not exclude threads sharing the descriptor
+        self._fd = None
+        self._state = (burst, time.time(), 0.0)  # Used when there is no file
+        self._stats_lock = threading.Lock()
+        self.stats = {priority: {"calls": 0, "waited": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+                      for priority in (INTERACTIVE, BACKGROUND)}
+        self.rate_limited = 0
+
+    @contextmanager
+    def _locked_state(self):
+        # Yields a one-item list holding (tokens, updated_at, interactive_until), written back on exit
+        with self._lock:
+            if self.path is None:
+                state = [self._state]
+                yield state
+                self._state = state[0]
+                return
+            if self._fd is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                data = os.pread(self._fd, BUCKET_FORMAT.size, 0)
+                state = [BUCKET_FORMAT.unpack(data) if len(data) == BUCKET_FORMAT.size
+                         else (self.burst, time.time(), 0.0)]
+                yield state
+                os.pwrite(self._fd, BUCKET_FORMAT.pack(*state[0]), 0)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _refill(self, tokens, updated_at, now):
+        return min(self.burst, tokens + max(0.0, now - updated_at) * self.rate)
+
+    def acquire(self, cost=1, priority=None):
+        """Blocks until `cost` requests may be sent; returns the seconds spent waiting."""
+        priority = priority or current_priority()
+        waited = 0.0
+        while True:
+            with self._locked_state() as state:
+                tokens, updated_at, interactive_until = state[0]
+                now = time.time()
+                tokens = self._refill(tokens, updated_at, now)
+                if priority == INTERACTIVE:
+                    tokens -= cost
+                    delay = max(0.0, -tokens / self.rate)
+                    state[0] = (tokens, now, max(interactive_until, now + delay) if delay else interactive_until)
+                elif tokens - cost >= self.reserve and now >= interactive_until:
+                    state[0] = (tokens - cost, now, interactive_until)
+                    delay = 0.0
+                else:
+                    state[0] = (tokens, now, interactive_until)
+                    delay = None
+                    retry_in = max((self.reserve + cost - tokens) / self.rate, interactive_until - now, 0.01)
+
+            if delay is not None:
+                if delay:
+                    time.sleep(delay)
+                self._record(priority, waited + delay)
+                return waited + delay
+            time.sleep(retry_in)
+            waited += retry_in
+
+    def penalize(self, seconds=RATE_LIMIT_PENALTY):
+        """Empties the bucket so every process pauses after the API reports a rate limit."""
+        with self._locked_state() as state:
+            tokens, updated_at, interactive_until = state[0]
+            now = time.time()
+            state[0] = (min(self._refill(tokens, updated_at, now), -seconds * self.rate), now, interactive_until)
+        with self._stats_lock:
+            self.rate_limited += 1
+
+    def _record(self, priority, waited):
+        with self._stats_lock:
+            stats = self.stats[priority]
+            stats["calls"] += 1
+            if waited:
+                stats["waited"] += 1
+                stats["wait_seconds"] += waited
+                stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+
+    def snapshot(self):
+        with self._stats_lock:
+            stats = {priority: dict(values, wait_seconds=round(values["wait_seconds"], 3),
+                                    max_wait_seconds=round(values["max_wait_seconds"], 3))
+                     for priority, values in self.stats.items()}
+            stats["rate_limited"] = self.rate_limited
+        return stats
+
+
+class RateLimitedRequest(HttpRequest):
+    """HttpRequest that takes a token from its bucket before every execute()."""
+
+    bucket = None
+    limiter = None
+
+    def execute(self, http=None, num_retries=0):
+        self.limiter.note_wait(self.bucket.acquire())
+        try:
+            return super().execute(http=http, num_retries=num_retries)
+        except HttpError as e:
+            if is_rate_limited(e):
+                self.bucket.penalize()
+            raise
+
+
+def acquire_for(api_requests):
+    """Takes tokens for requests sent without their own execute(), e.g. inside a batch."""
+    costs = {}
+    for api_request in api_requests:
+        if isinstance(api_request, RateLimitedRequest):
+            costs[type(api_request)] = costs.get(type(api_request), 0) + 1
+    for builder, cost in costs.items():
+        builder.limiter.note_wait(builder.bucket.acquire(cost))
+
+
+class RateLimiter:
+    """
+    Token buckets per account, handed to googleapiclient as its requestBuilder
+    so that every request built from a service is rate limited.
+    """
+
+    def __init__(self, rate=RATE_LIMIT_QPS, burst=RATE_LIMIT_BURST, reserve=RATE_LIMIT_RESERVE,
+                 directory=RATE_LIMIT_DIR):
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self.directory = directory or default_directory()
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> TokenBucket
+        self._builders = {}  # (key, base) -> RateLimitedRequest subclass bound to that key's bucket
+        self._local = threading.local()
+
+    def request_builder(self, key, base=HttpRequest):
+        """
+        Returns the requestBuilder for build_from_document, layered over another
+        HttpRequest subclass if given; just that base when limiting is disabled.
+        """
+        if self.rate <= 0:
+            return base
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(key, self.rate, self.burst, self.reserve, self.directory)
+            builder = self._builders.get((key, base))
+            if builder is None:
+                bases = (RateLimitedRequest,) if base is HttpRequest else (RateLimitedRequest, base)
+                builder = self._builders[(key, base)] = type('RateLimitedRequest', bases,
+                                                             {"bucket": bucket, "limiter": self})
+            return builder
+
+    def note_wait(self, seconds):
+        self._local.wait = getattr(self._local, 'wait', 0.0) + seconds
+
+    def take_wait(self):
+        """Returns and resets the seconds this thread has spent waiting for tokens."""
+        seconds = getattr(self._local, 'wait', 0.0)
+        self._local.wait = 0.0
+        return seconds
+
+    def stats(self):
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "buckets": {key: bucket.snapshot() for key, bucket in buckets.items()},
+        }
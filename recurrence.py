@@ -0,0 +1,224 @@
+import re
+import datetime
+import threading
+from collections import OrderedDict
+from dateutil import tz
+from dateutil.rrule import rrulestr, rruleset
+from event_record import Event
+
+# Configuration
+CHUNK_SECONDS = 28 * 86400  # Expansions are cached per series and per 28-day chunk of time
+MAX_CACHED_CHUNKS = 4096
+ONE_DAY = datetime.timedelta(days=1)
+UNTIL_VALUE = re.compile(r'UNTIL=(\d{8})(T\d{6}Z?)?(?=;|$)')
+
+
+def instance_id(series_id, start, all_day):
+    """Google's id for one occurrence: <series id>_<original start>, in UTC or as a date."""
+    stamp = start.strftime('%Y%m%d') if all_day else \
+        start.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    return f"{series_id}_{stamp}"
+
+
+def _to_wall_time(moment, zone):
+    # Aware values become naive wall time in the series' zone; naive ones already are
+    return moment.astimezone(zone).replace(tzinfo=None) if moment.tzinfo else moment
+
+
+def _parse_dates(line, zone):
+    # RDATE/EXDATE value lists; dateutil's parser rejects TZID on RDATE, so they are read here
+    head, _, values = line.partition(':')
+    params = dict(part.split('=', 1) for part in head.split(';')[1:] if '=' in part)
+    value_zone = tz.gettz(params['TZID']) if 'TZID' in params else None
+    dates = []
+    for value in filter(None, (value.strip() for value in values.split(','))):
+        if len(value) == 8:
+            moment = datetime.datetime.strptime(value, '%Y%m%d')
+        else:
+            moment = datetime.datetime.strptime(value.rstrip('Z'), '%Y%m%dT%H%M%S')
+        if value.endswith('Z'):
+            moment = moment.replace(tzinfo=datetime.timezone.utc)
+        elif value_zone is not None:
+            moment = moment.replace(tzinfo=value_zone)
+        dates.append(_to_wall_time(moment, zone))
+    return dates
+
+
+def _until_to_wall_time(line, zone):
+    # UNTIL in UTC is rewritten as wall time, since the rules run on naive datetimes
+    def convert(match):
+        if not (match.group(2) or '').endswith('Z'):
+            return match.group(0)
+        moment = datetime.datetime.strptime(match.group(1) + match.group(2)[:-1], '%Y%m%dT%H%M%S')
+        local = _to_wall_time(moment.replace(tzinfo=datetime.timezone.utc), zone)
+        return f"UNTIL={local.strftime('%Y%m%dT%H%M%S')}"
+    return UNTIL_VALUE.sub(convert, line)
+
+
+def build_ruleset(recurrence, dtstart, zone):
+    """
+    Turns the RRULE/EXRULE/RDATE/EXDATE lines of a Calendar event into a
+    dateutil rruleset over naive wall-clock times in `zone`. Comparing naive
+    datetimes stays in C, which makes expansion several times faster than
+    with zone-aware ones.
+    """
+    rules = rruleset(cache=True)  # Later windows resume from occurrences already generated
+    # DTSTART is always the first occurrence, even when the rule itself would skip it
+    rules.rdate(dtstart)
+    for line in recurrence:
+        name = line.split(':', 1)[0].split(';', 1)[0].upper()
+        if name in ('RRULE', 'EXRULE'):
+            rule = rrulestr(_until_to_wall_time(line, zone), dtstart=dtstart)
+            if name == 'RRULE':
+                rules.rrule(rule)
+            else:
+                rules.exrule(rule)
+        elif name == 'RDATE':
+            for moment in _parse_dates(line, zone):
+                rules.rdate(moment)
+        elif name == 'EXDATE':
+            for moment in _parse_dates(line, zone):
+                rules.exdate(moment)
+    return rules
+
+
+class Series:
+    """
+    A recurring master event: its first occurrence, duration and rules.
+
+    Occurrences are produced in the series' own timezone, so a 09:00
+    meeting stays at 09:00 across DST changes. All-day series run on dates
+    placed at midnight in the calendar's timezone, like Event does.
+    """
+
+    __slots__ = ('id', 'summary', 'start', 'end', 'all_day', 'etag', 'timezone', 'recurrence', '_rules', '_zone')
+
+    def __init__(self, id, summary, start, end, all_day, etag, timezone, recurrence):
+        self.id = id
+        self.summary = summary
+        self.start = start
+        self.end = end
+        self.all_day = bool(all_day)
+        self.etag = etag
+        self.timezone = timezone
+        self.recurrence = recurrence
+        self._rules = None
+        self._zone = None
+
+    @classmethod
+    def from_google(cls, event, timezone):
+        """Decodes a master event; `timezone` (pytz) is the calendar's, used for all-day dates."""
+        record = Event.from_google(event, timezone)
+        zone_name = timezone.zone if record.all_day else event['start'].get('timeZone') or 'UTC'
+        return cls(record.id, record.summary, record.start, record.end, record.all_day,
+                   record.etag, zone_name, list(event.get('recurrence', [])))
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def _rules_and_zone(self):
+        if self._rules is None:
+            self._zone = tz.gettz(self.timezone) or tz.UTC
+            dtstart = _to_wall_time(datetime.datetime.fromtimestamp(self.start, datetime.timezone.utc), self._zone)
+            self._rules = build_ruleset(self.recurrence, dtstart, self._zone)
+        return self._rules, self._zone
+
+    def last_end(self):
+        """End of the final occurrence in epoch seconds, or None for a series that never ends."""
+        for line in self.recurrence:
+            upper = line.upper()
+            if upper.startswith('RRULE') and 'UNTIL=' not in upper and 'COUNT=' not in upper:
+                return None
+        rules, zone = self._rules_and_zone()
+        try:
+            last = rules[-1]
+        except IndexError:
+            # Every occurrence was excluded
+            return self.end
+        if self.all_day:
+            return int((last + datetime.timedelta(days=round(self.duration / 86400))).replace(tzinfo=zone).timestamp())
+        return int(last.replace(tzinfo=zone).timestamp()) + self.duration
+
+    def instance_start(self, instance_id):
+        """Start in epoch seconds encoded in an occurrence id, or None if it is not one of ours."""
+        series_id, _, stamp = instance_id.rpartition('_')
+        if series_id != self.id:
+            return None
+        try:
+            if self.all_day:
+                _, zone = self._rules_and_zone()
+                return int(datetime.datetime.strptime(stamp, '%Y%m%d').replace(tzinfo=zone).timestamp())
+            moment = datetime.datetime.strptime(stamp, '%Y%m%dT%H%M%SZ')
+        except ValueError:
+            return None
+        return int(moment.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+    def occurrences(self, time_min, time_max):
+        """Yields (start_ts, end_ts, tz_offset, instance_id) for occurrences starting in [time_min, time_max)."""
+        rules, zone = self._rules_and_zone()
+        # Wall-time bounds, widened by a day so offset changes cannot drop an occurrence
+        after = _to_wall_time(datetime.datetime.fromtimestamp(time_min, datetime.timezone.utc), zone) - ONE_DAY
+        before = _to_wall_time(datetime.datetime.fromtimestamp(time_max, datetime.timezone.utc), zone) + ONE_DAY
+        days = datetime.timedelta(days=round(self.duration / 86400))
+        for moment in rules.between(after, before, inc=True):
+            start = moment.replace(tzinfo=zone)
+            start_ts = int(start.timestamp())
+            if not time_min <= start_ts < time_max:
+                continue
+            # All-day occurrences end at local midnight, which DST can move; timed ones keep their length
+            end_ts = int((moment + days).replace(tzinfo=zone).timestamp()) if self.all_day else start_ts + self.duration
+            yield start_ts, end_ts, int(start.utcoffset().total_seconds()), instance_id(self.id, start, self.all_day)
+
+
+class ExpansionCache:
+    """
+    Occurrences of recurring series, cached per (series, etag, chunk).
+
+    Chunks are fixed CHUNK_SECONDS slices of time, so any query window maps
+    onto a few reusable entries, and editing a series (a new etag) simply
+    stops hitting its old entries until they age out of the LRU.
+    """
+
+    def __init__(self, max_chunks=MAX_CACHED_CHUNKS):
+        self.max_chunks = max_chunks
+        self._lock = threading.Lock()
+        self._chunks = OrderedDict()  # (series_id, etag, chunk) -> [(start, end, tz_offset, instance_id)]
+        self.hits = 0
+        self.misses = 0
+
+    def _chunk(self, series, chunk):
+        key = (series.id, series.etag, chunk)
+        with self._lock:
+            occurrences = self._chunks.get(key)
+            if occurrences is not None:
+                self._chunks.move_to_end(key)
+                self.hits += 1
+                return occurrences
+        occurrences = list(series.occurrences(chunk * CHUNK_SECONDS, (chunk + 1) * CHUNK_SECONDS))
+        with self._lock:
+            self.misses += 1
+            self._chunks[key] = occurrences
+            while len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+        return occurrences
+
+    def occurrences(self, series, time_min, time_max):
+        """(start, end, tz_offset, instance_id) of occurrences overlapping [time_min, time_max), by start."""
+        first = int(time_min - series.duration) // CHUNK_SECONDS
+        last = int(time_max) // CHUNK_SECONDS
+        found = []
+        for chunk in range(first, last + 1):
+            found.extend(occurrence for occurrence in self._chunk(series, chunk)
+                         if occurrence[0] < time_max and occurrence[1] > time_min)
+        return found
+
+    def events(self, series, time_min, time_max, skip=()):
+        """
+        Event records for occurrences overlapping the window, except instance ids in `skip`.
+        Google gives each instance its own ETag, which a local expansion cannot know,
+        so these records carry none rather than the series' (which would never match).
+        """
+        return [Event(occurrence_id, series.summary, start, end, series.all_day, tz_offset)
+                for start, end, tz_offset, occurrence_id in self.occurrences(series, time_min, time_max)
+                if occurrence_id not in skip]
@@ -0,0 +1,79 @@
+import os
+import datetime
+import pytz
+from dateutil.parser import parse
+
+# Settings and helpers shared by app.py and async_app.py. Importing this
+# module builds nothing: no Flask app, mirror, queue or rate limiter.
+
+# Configuration
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+TIMEZONE = "Asia/Kolkata"
+WORKING_HOURS = (9, 17)  # Office hours (9 AM - 5 PM)
+# SQLite files (mirror, write queue, import log, watch channels) default to here, not the working directory
+DATA_DIR = os.getenv('CALENDAR_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
+
+# Default location of a data file
+def data_path(name):
+    """Returns DATA_DIR/name, creating DATA_DIR if needed."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
+
+
+# Check if time is within working hours
+def is_within_working_hours(start_time, end_time):
+    # Check if both start and end times are within working hours on their respective days
+    
+    if isinstance(start_time, str):
+        start_time = parse(start_time)
+    if isinstance(end_time, str):
+        end_time = parse(end_time)
+    
+    start_hour = start_time.hour
+    end_hour = end_time.hour
+    
+    # Check day boundary crossing
+    if start_time.date() != end_time.date():
+        return False, "Event cannot cross day boundaries"
+    
+    if start_hour < WORKING_HOURS[0]:
+        return False, f"Start time must be after {WORKING_HOURS[0]}:00 AM"
+    
+    if end_hour > WORKING_HOURS[1]:
+        return False, f"End time must be before {WORKING_HOURS[1]}:00 PM"
+    
+    if start_hour >= WORKING_HOURS[1]:
+        return False, f"Start time must be before {WORKING_HOURS[1]}:00 PM"
+        
+    if end_hour <= WORKING_HOURS[0]:
+        return False, f"End time must be after {WORKING_HOURS[0]}:00 AM"
+    
+    return True, "Within working hours"
+
+# Parse a client-supplied ISO datetime in the calendar's timezone
+def parse_local_datetime(value):
+    """Parses "YYYY-MM-DDTHH:MM[:SS]", localizing naive values to TIMEZONE."""
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = pytz.timezone(TIMEZONE).localize(parsed)
+    return parsed
+
+# Keys of format_event() output, selectable with fields=
+EVENT_FIELDS = ("id", "start_time", "end_time", "description")
+
+# Format an Event record for API responses
+def format_event(event):
+    return {
+        "id": event.id,
+        "start_time": event.start_iso(),
+        "end_time": event.end_iso(),
+        "description": event.summary
+    }
+
+# Build the start/end fields of an event body
+def event_time_fields(start_time, end_time):
+    return {
+        'start': {'dateTime': start_time.isoformat(), 'timeZone': TIMEZONE},
+        'end': {'dateTime': end_time.isoformat(), 'timeZone': TIMEZONE},
+    }
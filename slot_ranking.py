@@ -0,0 +1,136 @@
+import os
+import heapq
+import datetime
+
+# Configuration
+BUFFER_BEFORE = int(os.getenv('SLOT_BUFFER_BEFORE', '0'))  # Minutes kept free before a new meeting
+BUFFER_AFTER = int(os.getenv('SLOT_BUFFER_AFTER', '0'))  # Minutes kept free after it
+PREFERRED_HOURS = os.getenv('SLOT_PREFERRED_HOURS', '')  # e.g. "10:00-12:00,14:00-16:00"; empty means no preference
+FOCUS_HOURS = os.getenv('SLOT_FOCUS_HOURS', '')  # Protected blocks, e.g. "09:00-11:00"
+FOCUS_MIN_MINUTES = int(os.getenv('SLOT_FOCUS_MIN_MINUTES', '90'))  # Free stretches this long count as focus time
+MIN_USEFUL_GAP = int(os.getenv('SLOT_MIN_USEFUL_GAP', '30'))  # Free time shorter than this beside a meeting is wasted
+# Penalty points; lower scores rank first
+OUTSIDE_PREFERRED_WEIGHT = 1.0  # Per minute outside preferred hours
+FOCUS_HOURS_WEIGHT = 3.0  # Per minute inside focus hours
+FOCUS_BREAK_PENALTY = 60.0  # For leaving no focus-length stretch of a gap that had one
+FRAGMENT_PENALTY = 30.0  # Per wasted sliver of free time left beside the meeting
+
+
+def parse_hours(text):
+    """Parses "HH:MM-HH:MM,..." into [(start_minute, end_minute)] of the local day."""
+    ranges = []
+    for part in filter(None, (part.strip() for part in (text or '').split(','))):
+        start, _, end = part.partition('-')
+        try:
+            start = datetime.datetime.strptime(start.strip(), '%H:%M')
+            end = datetime.datetime.strptime(end.strip(), '%H:%M')
+        except ValueError:
+            raise ValueError(f"Invalid hours '{part}', expected HH:MM-HH:MM")
+        start_minute, end_minute = start.hour * 60 + start.minute, end.hour * 60 + end.minute
+        if end_minute <= start_minute:
+            raise ValueError(f"Invalid hours '{part}': end must be after start")
+        ranges.append((start_minute, end_minute))
+    return ranges
+
+
+def _overlap(start, end, ranges):
+    # Minutes of [start, end) inside any of the ranges
+    return sum(max(0, min(end, range_end) - max(start, range_start)) for range_start, range_end in ranges)
+
+
+class SlotPreferences:
+    """How to rank free slots; buffers and minutes are in minutes, hours as parse_hours() ranges."""
+
+    def __init__(self, buffer_before=BUFFER_BEFORE, buffer_after=BUFFER_AFTER,
+                 preferred_hours=None, focus_hours=None,
+                 focus_min_minutes=FOCUS_MIN_MINUTES, min_useful_gap=MIN_USEFUL_GAP):
+        self.buffer_before = buffer_before
+        self.buffer_after = buffer_after
+        self.preferred_hours = parse_hours(PREFERRED_HOURS) if preferred_hours is None else preferred_hours
+        self.focus_hours = parse_hours(FOCUS_HOURS) if focus_hours is None else focus_hours
+        self.focus_min_minutes = focus_min_minutes
+        self.min_useful_gap = min_useful_gap
+
+    def penalty(self, start_minute, end_minute, before, after, gap):
+        """
+        Score of a meeting at local minutes [start_minute, end_minute) of its
+        day, leaving `before` and `after` free minutes of a usable `gap`.
+        """
+        score = 0.0
+        if self.preferred_hours:
+            inside = _overlap(start_minute, end_minute, self.preferred_hours)
+            score += (end_minute - start_minute - inside) * OUTSIDE_PREFERRED_WEIGHT
+        if self.focus_hours:
+            score += _overlap(start_minute, end_minute, self.focus_hours) * FOCUS_HOURS_WEIGHT
+        # Fragmentation: slivers too short to use for anything else
+        score += FRAGMENT_PENALTY * sum(1 for piece in (before, after) if 0 < piece < self.min_useful_gap)
+        # Focus time: a long free stretch should survive on one side of the meeting
+        if gap >= self.focus_min_minutes and max(before, after) < self.focus_min_minutes:
+            score += FOCUS_BREAK_PENALTY
+        return score
+
+
+def _free_gaps(busy, open_ts, close_ts, before, after):
+    # Usable (first_start, last_end) per free stretch of [open_ts, close_ts): buffers apply
+    # only next to meetings, which may lie just outside the window
+    edge, after_meeting = open_ts - before, False
+    usable = []
+    for busy_start, busy_end in busy:
+        if busy_end <= edge:
+            continue
+        if busy_start >= close_ts + after:
+            break
+        if busy_start > edge:
+            usable.append((edge + before if after_meeting else open_ts, busy_start - after))
+        edge, after_meeting = max(edge, busy_end), True
+    usable.append((edge + before if after_meeting else open_ts, close_ts))
+    return [(max(first, open_ts), min(last, close_ts)) for first, last in usable]
+
+
+def score_slots(busy, windows, duration, timezone, preferences=None, granularity=30):
+    """
+    Yields (score, start_ts, end_ts) for every feasible slot.
+
+    busy: sorted (start_ts, end_ts) intervals, including any that end or start
+    within a buffer of the windows; windows: (open_ts, close_ts) per day.
+    Candidates start every `granularity` minutes from the window opening, plus
+    right at both ends of each free stretch, where a meeting packs against
+    its neighbours.
+    """
+    preferences = preferences or SlotPreferences()
+    before, after = preferences.buffer_before * 60, preferences.buffer_after * 60
+    length, step = duration * 60, granularity * 60
+    for open_ts, close_ts in windows:
+        opening = datetime.datetime.fromtimestamp(open_ts, timezone)
+        open_minute = opening.hour * 60 + opening.minute
+        for first, last in _free_gaps(busy, open_ts, close_ts, before, after):
+            latest = last - length
+            if latest < first:
+                continue
+            grid = open_ts + -(-(first - open_ts) // step) * step
+            starts = {first, latest}
+            starts.update(range(int(grid), int(latest) + 1, step))
+            gap = (last - first) / 60
+            for start in sorted(starts):
+                start_minute = open_minute + (start - open_ts) / 60
+                score = preferences.penalty(start_minute, start_minute + duration,
+                                            (start - first) / 60, (last - start - length) / 60, gap)
+                yield score, start, start + length
+
+
+def top_slots(scored, k=3, allow_overlap=False):
+    """
+    Lazily yields the k best (score, start_ts, end_ts), lowest score first and
+    earliest on ties. The candidates are heapified once and popped one at a
+    time, so only k pops are paid for. Unless allow_overlap is set, slots
+    overlapping one already yielded are skipped, so the options differ.
+    """
+    heap = list(scored)
+    heapq.heapify(heap)
+    taken = []
+    while heap and len(taken) < k:
+        score, start, end = heapq.heappop(heap)
+        if not allow_overlap and any(start < taken_end and end > taken_start for taken_start, taken_end in taken):
+            continue
+        taken.append((start, end))
+        yield score, start, end
@@ -0,0 +1,58 @@
+import datetime
+import numpy as np
+
+
+# Find free slots across many days with NumPy arrays
+def find_free_slots(busy, windows, duration, granularity=30, limit=None):
+    """
+    Returns (start_ts, end_ts) epoch-second pairs for every free slot.
+
+    busy: iterable of (start_ts, end_ts) busy intervals in epoch seconds
+    windows: (open_ts, close_ts) per day, e.g. working hours, in order
+    duration, granularity: minutes; candidates start every `granularity`
+    minutes from the start of each free gap (the window opening or the end
+    of a meeting), so slots follow meetings rather than a fixed grid
+    limit: return only the first `limit` slots
+    """
+    if not windows:
+        return []
+    length, step = duration * 60, granularity * 60
+
+    # Merge overlapping busy intervals, so what lies between them is free
+    busy = np.array(sorted(busy), dtype=np.float64).reshape(-1, 2)
+    latest_end = np.maximum.accumulate(busy[:, 1]) if len(busy) else busy[:, 1]
+    first = np.ones(len(busy), dtype=bool)
+    first[1:] = busy[1:, 0] > latest_end[:-1]
+    merged_starts = busy[first, 0]
+    merged_ends = latest_end[np.append(np.flatnonzero(first)[1:] - 1, len(busy) - 1)] if len(busy) else latest_end
+
+    candidates = []
+    for open_ts, close_ts in windows:
+        # Merged intervals overlapping the window bound its free gaps
+        low = np.searchsorted(merged_ends, open_ts, side='right')
+        high = np.searchsorted(merged_starts, close_ts, side='left')
+        gap_starts = np.maximum(np.concatenate(([open_ts], merged_ends[low:high])), open_ts)
+        gap_ends = np.minimum(np.concatenate((merged_starts[low:high], [close_ts])), close_ts)
+
+        # Every gap gets its own grid: gap start, +step, ... while the slot still fits
+        counts = np.floor((gap_ends - gap_starts - length) / step).astype(np.int64) + 1
+        counts = np.maximum(counts, 0)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidates.append(np.repeat(gap_starts, counts) + offsets * step)
+    starts = np.concatenate(candidates)
+
+    if limit is not None:
+        starts = starts[:limit]
+
+    return [(float(start), float(start + length)) for start in starts]
+
+
+# Slots as returned by /available-slots
+def format_slots(pairs, timezone):
+    return [
+        {
+            "start": datetime.datetime.fromtimestamp(start, timezone).isoformat(),
+            "end": datetime.datetime.fromtimestamp(end, timezone).isoformat()
+        }
+        for start, end in pairs
+    ]
@@ -0,0 +1,68 @@
+import os
+import json
+import zlib
+import itertools
+
+# msgpack is optional; without it only JSON encodings are offered
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Configuration
+STREAM_PAGE_SIZE = int(os.getenv('STREAM_PAGE_SIZE', '250'))  # Records per chunk when the source is not paged
+GZIP_LEVEL = 6
+JSON = 'application/json'
+NDJSON = 'application/x-ndjson'
+MSGPACK = 'application/msgpack'
+MSGPACK_ALIASES = ('application/x-msgpack', 'application/vnd.msgpack')
+
+
+def negotiate(accept_mimetypes):
+    """
+    Picks the response type from a werkzeug Accept header: JSON (one
+    document), NDJSON or msgpack (streams); None if nothing offered fits.
+    JSON is offered first, so */* and missing headers keep getting JSON.
+    """
+    offers = [JSON, NDJSON]
+    if msgpack is not None:
+        offers += [MSGPACK, *MSGPACK_ALIASES]
+    match = accept_mimetypes.best_match(offers) if accept_mimetypes else JSON
+    return MSGPACK if match in MSGPACK_ALIASES else match
+
+
+def wants_gzip(accept_encodings):
+    return accept_encodings['gzip'] > 0
+
+
+def iter_chunks(iterable, size=STREAM_PAGE_SIZE):
+    """Groups a flat iterable into lists of up to `size` items, pulling only one list ahead."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def encode_pages(pages, media_type, compress=False):
+    """
+    Encodes pages of records as NDJSON lines or consecutive msgpack objects
+    and yields one chunk per page, so a client receives each page as soon as
+    it is ready. With compress the chunks form one gzip stream, sync-flushed
+    after every page so what has arrived can be decoded right away.
+    """
+    if media_type == MSGPACK:
+        pack = msgpack.Packer().pack
+    else:
+        def pack(record):
+            return json.dumps(record, separators=(',', ':')).encode() + b'\n'
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None  # wbits 31: gzip framing
+    for page in pages:
+        data = b''.join(pack(record) for record in page)
+        if compressor:
+            data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
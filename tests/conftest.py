@@ -0,0 +1,72 @@
+import os
+import sys
+import itertools
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeRequest:
+    def __init__(self, call):
+        self._call = call
+
+    def execute(self):
+        return self._call()
+
+
+class FakeEvents:
+    """
+    events.list with Google's sync semantics, backed by a dict: a full list
+    returns live events, a syncToken returns everything changed since
+    (cancelled events included), and expire() makes old tokens answer 410.
+    """
+
+    def __init__(self):
+        self.items = {}      # event id -> (change number, resource)
+        self._changes = itertools.count(1)
+        self.change = 0
+        self.expired_before = 0
+
+    def put(self, event):
+        self.change = next(self._changes)
+        self.items[event['id']] = (self.change, dict(event))
+
+    def cancel(self, event_id, **fields):
+        self.put({"id": event_id, "status": "cancelled", **fields})
+
+    def expire(self):
+        self.expired_before = self.change + 1
+
+    def list(self, calendarId, syncToken=None, maxResults=None, pageToken=None, **params):
+        def call():
+            if syncToken is not None:
+                since = int(syncToken)
+                if since < self.expired_before:
+                    raise HttpError(httplib2.Response({'status': 410}), b'{"error": {"code": 410}}')
+                items = [event for change, event in self.items.values() if change > since]
+            else:
+                items = [event for _, event in self.items.values() if event.get('status') != 'cancelled']
+            return {"items": items, "nextSyncToken": str(self.change)}
+        return FakeRequest(call)
+
+
+class FakeService:
+    def __init__(self):
+        self._events = FakeEvents()
+
+    def events(self):
+        return self._events
+
+
+@pytest.fixture
+def calendar():
+    """A fake Calendar API service; calendar.events() is the FakeEvents to edit."""
+    return FakeService()
+
+
+def timed_event(event_id, start, end, **fields):
+    return {"id": event_id, "summary": event_id, "start": {"dateTime": start}, "end": {"dateTime": end}, **fields}
@@ -0,0 +1,108 @@
+import datetime
+
+from busy_index import BusyIndexRegistry
+from event_store import EventStore
+from window_versions import WindowVersions
+import pytz
+
+from conftest import timed_event
+
+
+def ts(value):
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def worker(calendar, path):
+    """One process's view of a shared mirror file: store, busy index and change clock."""
+    store = EventStore(lambda: calendar, path=str(path), timezone='UTC', max_staleness=3600)
+    index = BusyIndexRegistry().attach(store)
+    versions = WindowVersions(pytz.UTC).attach(store)
+    return store, index, versions
+
+
+def test_incremental_sync_and_cancel(calendar, tmp_path):
+    store, index, _ = worker(calendar, tmp_path / 'mirror.db')
+    calendar.events().put(timed_event('a', '2026-11-02T10:00:00+00:00', '2026-11-02T11:00:00+00:00'))
+    store.sync()
+    assert not index.is_free(ts('2026-11-02T10:15:00+00:00'), ts('2026-11-02T10:45:00+00:00'))
+
+    calendar.events().cancel('a')
+    store.sync()
+    assert index.is_free(ts('2026-11-02T10:15:00+00:00'), ts('2026-11-02T10:45:00+00:00'))
+    assert store.get_event('a') is None
+
+
+def test_expired_sync_token_falls_back_to_full_sync(calendar, tmp_path):
+    store, index, _ = worker(calendar, tmp_path / 'mirror.db')
+    calendar.events().put(timed_event('a', '2026-11-02T10:00:00+00:00', '2026-11-02T11:00:00+00:00'))
+    store.sync()
+    # Deleted while the token was expired: the full list simply no longer has it
+    del calendar.events().items['a']
+    calendar.events().put(timed_event('b', '2026-11-02T12:00:00+00:00', '2026-11-02T13:00:00+00:00'))
+    calendar.events().expire()
+    store.sync()
+    assert store.get_event('a') is None
+    assert store.get_event('b') is not None
+    assert len(index) == 1
+
+
+def test_other_process_sync_reaches_this_process_index(calendar, tmp_path):
+    path = tmp_path / 'mirror.db'
+    store_a, index_a, _ = worker(calendar, path)
+    store_b, index_b, versions_b = worker(calendar, path)
+    store_a.sync()
+    store_b.sync()
+    etag_before = versions_b.version(ts('2026-11-02T00:00:00+00:00'), ts('2026-11-03T00:00:00+00:00'))
+
+    calendar.events().put(timed_event('new', '2026-11-02T10:00:00+00:00', '2026-11-02T11:00:00+00:00'))
+    store_a.sync()
+    # B pulls an empty delta with the token A saved; its view must still move
+    store_b.sync()
+
+    window = ts('2026-11-02T10:15:00+00:00'), ts('2026-11-02T10:45:00+00:00')
+    assert not index_a.is_free(*window)
+    assert not index_b.is_free(*window)
+    assert versions_b.version(ts('2026-11-02T00:00:00+00:00'), ts('2026-11-03T00:00:00+00:00')) != etag_before
+
+
+def test_reads_follow_other_process_write_through(calendar, tmp_path):
+    path = tmp_path / 'mirror.db'
+    store_a, _, _ = worker(calendar, path)
+    store_b, index_b, _ = worker(calendar, path)
+    store_a.sync()
+
+    store_a.upsert_event(timed_event('x', '2026-11-02T14:00:00+00:00', '2026-11-02T15:00:00+00:00'))
+    store_b.ensure_fresh()
+    assert not index_b.is_free(ts('2026-11-02T14:00:00+00:00'), ts('2026-11-02T14:30:00+00:00'))
+
+    store_a.remove_event('x')
+    store_b.ensure_fresh()
+    assert index_b.is_free(ts('2026-11-02T14:00:00+00:00'), ts('2026-11-02T14:30:00+00:00'))
+
+
+def test_full_resync_in_other_process_drops_rows_everywhere(calendar, tmp_path):
+    path = tmp_path / 'mirror.db'
+    store_a, _, _ = worker(calendar, path)
+    store_b, index_b, _ = worker(calendar, path)
+    calendar.events().put(timed_event('a', '2026-11-02T10:00:00+00:00', '2026-11-02T11:00:00+00:00'))
+    store_a.sync()
+    store_b.ensure_fresh()
+    assert len(index_b) == 1
+
+    del calendar.events().items['a']
+    calendar.events().expire()
+    store_a.sync()
+    store_b.ensure_fresh()
+    assert len(index_b) == 0
+
+
+def test_write_racing_another_process_rebuilds(calendar, tmp_path, monkeypatch):
+    path = tmp_path / 'mirror.db'
+    store_a, index_a, _ = worker(calendar, path)
+    store_b, index_b, _ = worker(calendar, path)
+    store_a.upsert_event(timed_event('a', '2026-11-02T10:00:00+00:00', '2026-11-02T11:00:00+00:00'))
+    # A commits between B's check of the version and B's own write
+    monkeypatch.setattr(store_b, 'follow', lambda: False)
+    store_b.upsert_event(timed_event('b', '2026-11-02T12:00:00+00:00', '2026-11-02T13:00:00+00:00'))
+    assert len(index_b) == 2
+    assert store_b.get_event('a') is not None
@@ -0,0 +1,18 @@
+from ics import ImportLog
+
+
+def test_start_leaves_another_users_import_alone(tmp_path):
+    log = ImportLog(str(tmp_path / 'imports.db'))
+    log.start('import-1', 'alice')
+    log.record('import-1', 10, 8, 2, status='interrupted')
+
+    assert log.start('import-1', 'mallory')['status'] == 'interrupted'
+    resumed = log.start('import-1', 'alice')
+    assert (resumed['status'], resumed['processed']) == ('running', 10)
+
+
+def test_completed_import_is_not_restarted(tmp_path):
+    log = ImportLog(str(tmp_path / 'imports.db'))
+    log.start('import-1')
+    log.record('import-1', 3, 3, 0, status='completed')
+    assert log.start('import-1')['status'] == 'completed'
@@ -0,0 +1,23 @@
+import json
+
+import rate_limit
+
+
+def write_client(path, client_id):
+    path.write_text(json.dumps({"installed": {"client_id": client_id}}))
+    return str(path)
+
+
+def test_default_directory_is_per_oauth_client(tmp_path):
+    one = rate_limit.default_directory(write_client(tmp_path / 'one.json', 'project-one.apps.googleusercontent.com'))
+    two = rate_limit.default_directory(write_client(tmp_path / 'two.json', 'project-two.apps.googleusercontent.com'))
+    again = rate_limit.default_directory(write_client(tmp_path / 'again.json', 'project-one.apps.googleusercontent.com'))
+    assert one != two
+    assert one == again
+
+
+def test_default_directory_without_client_file_uses_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path / '..')
+    first = rate_limit.default_directory(str(tmp_path / 'missing.json'))
+    monkeypatch.chdir(tmp_path)
+    assert rate_limit.default_directory(str(tmp_path / 'missing.json')) != first
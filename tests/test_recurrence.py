@@ -0,0 +1,104 @@
+import datetime
+
+import pytz
+
+from event_store import EventStore
+from recurrence import ExpansionCache, Series
+
+from conftest import timed_event
+
+BERLIN = pytz.timezone('Europe/Berlin')
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=datetime.timezone.utc).timestamp()
+
+
+def standup(*recurrence, **fields):
+    # 09:00 Berlin, which is 08:00 UTC before the DST change on 2026-03-29 and 07:00 UTC after it
+    return {"id": 's1', "summary": 'Standup', "etag": '"1"',
+            "start": {"dateTime": '2026-03-23T09:00:00+01:00', "timeZone": 'Europe/Berlin'},
+            "end": {"dateTime": '2026-03-23T09:30:00+01:00', "timeZone": 'Europe/Berlin'},
+            "recurrence": list(recurrence), **fields}
+
+
+def occurrence_ids(series, time_min, time_max):
+    return [occurrence[3] for occurrence in series.occurrences(time_min, time_max)]
+
+
+def test_exdate_and_wall_time_across_dst():
+    series = Series.from_google(standup('RRULE:FREQ=DAILY;COUNT=10',
+                                        'EXDATE;TZID=Europe/Berlin:20260325T090000'), BERLIN)
+    ids = occurrence_ids(series, utc(2026, 3, 1), utc(2026, 5, 1))
+    assert len(ids) == 9
+    assert 's1_20260325T080000Z' not in ids
+    assert ids[0] == 's1_20260323T080000Z'
+    assert 's1_20260328T080000Z' in ids and 's1_20260330T070000Z' in ids
+    assert series.last_end() == int(utc(2026, 4, 1, 7, 30))
+
+
+def test_utc_until_and_window_bounds():
+    series = Series.from_google(standup('RRULE:FREQ=DAILY;UNTIL=20260326T080000Z'), BERLIN)
+    assert occurrence_ids(series, utc(2026, 3, 1), utc(2026, 5, 1)) == [
+        's1_20260323T080000Z', 's1_20260324T080000Z', 's1_20260325T080000Z', 's1_20260326T080000Z']
+    # Only occurrences starting inside the window
+    assert occurrence_ids(series, utc(2026, 3, 24, 8), utc(2026, 3, 25, 8)) == ['s1_20260324T080000Z']
+
+
+def test_every_occurrence_excluded():
+    series = Series.from_google(standup('RRULE:FREQ=DAILY;COUNT=1',
+                                        'EXDATE;TZID=Europe/Berlin:20260323T090000'), BERLIN)
+    # DTSTART itself can be excluded too
+    assert occurrence_ids(series, utc(2026, 3, 1), utc(2026, 5, 1)) == []
+
+
+def test_all_day_series_uses_dates():
+    event = {"id": 'a1', "summary": 'Holiday', "start": {"date": '2026-03-28'}, "end": {"date": '2026-03-29'},
+             "recurrence": ['RRULE:FREQ=DAILY;COUNT=3']}
+    series = Series.from_google(event, BERLIN)
+    occurrences = list(series.occurrences(utc(2026, 3, 1), utc(2026, 5, 1)))
+    assert [occurrence[3] for occurrence in occurrences] == ['a1_20260328', 'a1_20260329', 'a1_20260330']
+    # The night of the DST change makes 2026-03-29 23 hours long
+    assert occurrences[1][1] - occurrences[1][0] == 23 * 3600
+
+
+def test_expansion_cache_skips_instances():
+    series = Series.from_google(standup('RRULE:FREQ=DAILY;COUNT=3'), BERLIN)
+    cache = ExpansionCache()
+    events = cache.events(series, utc(2026, 3, 1), utc(2026, 5, 1), skip={'s1_20260324T080000Z'})
+    assert [event.id for event in events] == ['s1_20260323T080000Z', 's1_20260325T080000Z']
+    assert all(event.etag is None for event in events)
+    cache.events(series, utc(2026, 3, 1), utc(2026, 5, 1))
+    assert cache.hits > 0
+
+
+def test_mirror_applies_cancelled_and_moved_instances(calendar, tmp_path):
+    store = EventStore(lambda: calendar, path=str(tmp_path / 'mirror.db'), timezone='Europe/Berlin')
+    events = calendar.events()
+    events.put(standup('RRULE:FREQ=DAILY;COUNT=5'))
+    store.sync()
+    window = utc(2026, 3, 1), utc(2026, 5, 1)
+    assert len(store.recurring_between(*window)) == 5
+
+    # One occurrence cancelled, another moved to the afternoon
+    events.cancel('s1_20260324T080000Z', recurringEventId='s1')
+    events.put(timed_event('s1_20260325T080000Z', '2026-03-25T15:00:00+01:00', '2026-03-25T15:30:00+01:00',
+                           recurringEventId='s1'))
+    store.sync()
+    listed = list(store.events_between(datetime.datetime.fromtimestamp(window[0], datetime.timezone.utc),
+                                       datetime.datetime.fromtimestamp(window[1], datetime.timezone.utc)))
+    assert [event.id for event in listed] == ['s1_20260323T080000Z', 's1_20260325T080000Z',
+                                              's1_20260326T080000Z', 's1_20260327T080000Z']
+    assert listed[1].start == int(utc(2026, 3, 25, 14))
+    assert store.get_event('s1_20260324T080000Z') is None
+    assert store.get_event('s1_20260326T080000Z').start == int(utc(2026, 3, 26, 8))
+
+    # Deleting one occurrence locally cancels just that one
+    store.remove_event('s1_20260326T080000Z')
+    assert len(store.recurring_between(*window)) == 2
+
+    # Cancelling the series drops its exceptions too
+    events.cancel('s1')
+    store.sync()
+    assert list(store.events_between(datetime.datetime.fromtimestamp(window[0], datetime.timezone.utc),
+                                     datetime.datetime.fromtimestamp(window[1], datetime.timezone.utc))) == []
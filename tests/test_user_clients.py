@@ -0,0 +1,37 @@
+from user_clients import CredentialStore, UserClientPool
+
+
+def pool(tmp_path, **kwargs):
+    store = CredentialStore(directory=str(tmp_path), fake_auth=True)
+    return UserClientPool(store, discovery_document=lambda: {}, **kwargs)
+
+
+def test_pinned_user_is_not_evicted_until_released(tmp_path):
+    users = pool(tmp_path, max_users=1)
+    alice = users.acquire('alice')
+    users.get('bob')
+    assert users.stats()["users"] == 2
+    # Alice's request is still running, so she keeps the same client
+    assert users.get('alice') is alice
+    users.get('bob')
+    users.release(alice)
+    assert users.stats()["users"] == 1
+    assert users.get('alice') is not alice
+
+
+def test_service_of_evicted_client_does_not_return_it_to_the_pool(tmp_path, monkeypatch):
+    users = pool(tmp_path, max_users=1)
+    alice = users.get('alice')
+    monkeypatch.setattr(alice, 'get_service', lambda: 'service')
+    users.get('bob')
+    assert users.get_service(alice) == 'service'
+    assert users.stats()["users"] == 1
+
+
+def test_state_size_bounds_the_pool(tmp_path):
+    users = pool(tmp_path, state_size=lambda client: client.state.get('size', 0), max_state=10)
+    users.get('alice').state['size'] = 8
+    users.get('bob').state['size'] = 8
+    users.trim()
+    assert users.stats()["users"] == 1
+    assert users.stats()["state"] == 8
@@ -0,0 +1,116 @@
+import os
+import time
+import datetime
+
+import pytest
+
+import watch
+from busy_index import BusyIndexRegistry
+from event_store import EventStore
+from watch import ChannelStore, WatchChannelManager
+
+from conftest import FakeRequest, timed_event
+
+
+class WatchService:
+    """events.watch and channels.stop on top of a FakeService."""
+
+    def __init__(self, calendar):
+        self.calendar = calendar
+        self.stopped = []
+
+    def events(self):
+        service = self
+
+        class Events:
+            def list(self, **params):
+                return service.calendar.events().list(**params)
+
+            def watch(self, calendarId, body):
+                return FakeRequest(lambda: {"id": body['id'], "resourceId": f"resource-{calendarId}",
+                                            "expiration": str(int((time.time() + 3600 * 24) * 1000))})
+        return Events()
+
+    def channels(self):
+        service = self
+
+        class Channels:
+            def stop(self, body):
+                return FakeRequest(lambda: service.stopped.append(body['id']))
+        return Channels()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def fast_follow(monkeypatch):
+    monkeypatch.setattr(watch, 'FOLLOW_SECONDS', 0.05)
+
+
+def notification(store, state='exists'):
+    channel_id, channel = next(iter(store.channels().items()))
+    return {"X-Goog-Channel-ID": channel_id, "X-Goog-Channel-Token": channel["token"],
+            "X-Goog-Resource-ID": channel["resource_id"], "X-Goog-Resource-State": state}
+
+
+def test_one_owner_and_any_process_accepts_notifications(calendar, tmp_path, fast_follow):
+    service = WatchService(calendar)
+    path = str(tmp_path / 'watch.db')
+    changes, follows = [], []
+    owner = WatchChannelManager(lambda: service, changes.append, address='https://example.test/hook',
+                                token='secret', store=ChannelStore(path), on_follow=follows.append)
+    owner.start()
+    assert wait_for(lambda: owner.stats()["channels"])
+    other = WatchChannelManager(lambda: service, changes.append, address='https://example.test/hook',
+                                token='secret', store=ChannelStore(path), on_follow=follows.append)
+    other.start()
+    time.sleep(0.2)
+    assert owner.stats()["owner"] and not other.stats()["owner"]
+    assert len(owner.stats()["channels"]) == 1
+
+    headers = notification(other.store)
+    assert other.handle_notification({**headers, "X-Goog-Channel-Token": 'wrong'}) == (False, "Invalid channel token")
+    assert other.handle_notification(headers) == (True, "Change queued")
+    assert wait_for(lambda: 'primary' in changes and 'primary' in follows)
+
+    # The owner exiting hands renewal to the other process
+    owner._stop.set()
+    os.close(owner._owner_fd)
+    assert wait_for(lambda: other.stats()["owner"])
+    other.stop()
+
+
+def test_following_a_notification_updates_the_other_process_mirror(calendar, tmp_path, fast_follow):
+    service = WatchService(calendar)
+    mirror = str(tmp_path / 'mirror.db')
+    watched = str(tmp_path / 'watch.db')
+    workers = []
+    for _ in range(2):
+        store = EventStore(lambda: service, path=mirror, timezone='UTC', max_staleness=3600)
+        index = BusyIndexRegistry().attach(store)
+        manager = WatchChannelManager(lambda: service, lambda calendar_id, store=store: store.sync(),
+                                      address='https://example.test/hook', token='secret',
+                                      store=ChannelStore(watched),
+                                      on_follow=lambda calendar_id, store=store: store.follow())
+        store.sync()
+        manager.start()
+        workers.append((store, index, manager))
+    (_, index_a, manager_a), (_, index_b, manager_b) = workers
+    assert wait_for(lambda: manager_a.stats()["channels"])
+    time.sleep(0.2)
+
+    calendar.events().put(timed_event('new', '2026-11-02T10:00:00+00:00', '2026-11-02T11:00:00+00:00'))
+    ten = datetime.datetime(2026, 11, 2, 10, tzinfo=datetime.timezone.utc).timestamp()
+    window = (ten + 900, ten + 2700)
+    manager_b.handle_notification(notification(manager_b.store))
+    assert wait_for(lambda: not index_b.is_free(*window))
+    assert wait_for(lambda: not index_a.is_free(*window))
+    for _, _, manager in workers:
+        manager.stop()
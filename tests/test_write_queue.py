@@ -0,0 +1,99 @@
+import json
+import time
+import threading
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import write_queue
+from write_queue import WriteQueue, is_retryable
+
+
+def http_error(status, reason=None):
+    content = {"error": {"code": status, "errors": [{"reason": reason}] if reason else []}}
+    return HttpError(httplib2.Response({'status': status}), json.dumps(content).encode())
+
+
+def queue(path, handler=None, **kwargs):
+    # No worker threads: tests claim and run jobs themselves
+    return WriteQueue(handler or (lambda kind, payload, user_id: None), path=str(path), workers=0, **kwargs)
+
+
+def claim(q):
+    with q._lock:
+        return q._claim()[0]
+
+
+def test_only_one_process_claims_a_job(tmp_path):
+    first, second = queue(tmp_path / 'q.db'), queue(tmp_path / 'q.db')
+    job = first.submit('insert', {"n": 1})
+    claimed = claim(first)
+    assert claimed["id"] == job["id"] and claimed["attempts"] == 1
+    assert claim(second) is None
+
+
+def test_expired_lease_is_claimed_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_queue, 'LEASE_SECONDS', 0.05)
+    first, second = queue(tmp_path / 'q.db'), queue(tmp_path / 'q.db')
+    first.submit('insert', {"n": 1})
+    assert claim(first) is not None
+    time.sleep(0.1)
+    again = claim(second)
+    assert again is not None and again["attempts"] == 2
+
+
+def test_running_job_keeps_renewing_its_lease(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_queue, 'LEASE_SECONDS', 0.2)
+    monkeypatch.setattr(write_queue, 'LEASE_RENEW_SECONDS', 0.05)
+    release = threading.Event()
+    slow = queue(tmp_path / 'q.db', lambda kind, payload, user_id: release.wait(5) and {"ok": True})
+    other = queue(tmp_path / 'q.db')
+    job = slow.submit('insert', {"n": 1})
+    runner = threading.Thread(target=slow._run, args=(claim(slow),))
+    runner.start()
+    # Well past the original lease, the job still belongs to the first worker
+    time.sleep(0.5)
+    assert claim(other) is None
+    release.set()
+    runner.join()
+    assert slow.get(job["id"])["status"] == 'succeeded'
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (http_error(503), True),
+    (http_error(429), True),
+    (http_error(403, 'rateLimitExceeded'), True),
+    (http_error(403, 'userRateLimitExceeded'), True),
+    (http_error(403, 'forbidden'), False),
+    (http_error(403, 'insufficientPermissions'), False),
+    (http_error(404), False),
+    (TimeoutError(), True),
+    (ValueError("bad payload"), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_retries_with_backoff_then_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_queue, 'BACKOFF_BASE', 0)
+
+    def handler(kind, payload, user_id):
+        raise http_error(503)
+    q = queue(tmp_path / 'q.db', handler, max_attempts=2)
+    job = q.submit('patch', {"n": 1})
+    q._run(claim(q))
+    assert q.get(job["id"])["status"] == 'retrying'
+    q._run(claim(q))
+    assert q.get(job["id"])["status"] == 'failed'
+    assert claim(q) is None
+
+
+def test_permission_error_fails_at_once(tmp_path):
+    def handler(kind, payload, user_id):
+        raise http_error(403, 'forbidden')
+    q = queue(tmp_path / 'q.db', handler)
+    job = q.submit('delete', {"event_id": 'x'})
+    q._run(claim(q))
+    finished = q.get(job["id"])
+    assert (finished["status"], finished["attempts"]) == ('failed', 1)
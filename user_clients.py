@@ -0,0 +1,255 @@
+import os
+import re
+import sys
+import datetime
+import threading
+from collections import OrderedDict
+from google.auth.credentials import AnonymousCredentials
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest
+from calendar_client import CREDENTIALS_FILE, FAKE_ACCESS_TOKEN, FAKE_AUTH, REFRESH_MARGIN, PooledHttp
+
+# Configuration
+USER_TOKEN_DIR = os.getenv('USER_TOKEN_DIR', 'tokens')  # One <user_id>.json token file per user
+USER_POOL_SIZE = int(os.getenv('USER_POOL_SIZE', '200'))  # Users kept warm at once
+MAX_POOLED_SERVICES = int(os.getenv('MAX_POOLED_SERVICES', '400'))  # Built services (one per active user)
+MAX_POOLED_STATE = int(os.getenv('MAX_POOLED_STATE', '500000'))  # Items in per-user state, as measured by state_size
+USER_ID_PATTERN = re.compile(r'[A-Za-z0-9_.@+-]{1,128}')
+
+
+class CredentialStore:
+    """OAuth tokens per user, one JSON file each, written atomically like token.json."""
+
+    def __init__(self, directory=USER_TOKEN_DIR, scopes=None, fake_auth=FAKE_AUTH):
+        self.directory = directory
+        self.scopes = scopes
+        self.fake_auth = fake_auth
+
+    def _path(self, user_id):
+        # User ids end up in file names, so only a safe alphabet is accepted
+        if not USER_ID_PATTERN.fullmatch(user_id or '') or user_id.startswith('.'):
+            raise ValueError(f"Invalid user id: {user_id!r}")
+        return os.path.join(self.directory, f"{user_id}.json")
+
+    def load(self, user_id):
+        """Returns the user's credentials, or None if they never authorized."""
+        path = self._path(user_id)
+        if self.fake_auth:
+            return AnonymousCredentials()
+        if not os.path.exists(path):
+            return None
+        return Credentials.from_authorized_user_file(path, self.scopes)
+
+    def save(self, user_id, creds):
+        path = self._path(user_id)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as token:
+            token.write(creds.to_json())
+        os.replace(tmp_path, path)
+
+    def authorize(self, user_id, credentials_file=CREDENTIALS_FILE):
+        """Runs the OAuth consent flow for a user and stores the result."""
+        flow = InstalledAppFlow.from_client_secrets_file(credentials_file, self.scopes)
+        creds = flow.run_local_server(port=0)
+        self.save(user_id, creds)
+        return creds
+
+
+class UserClient:
+    """
+    One user's credentials and Calendar services.
+
+    Tokens are refreshed on demand, shortly before they expire, under a
+    per-user lock: concurrent requests for the same user refresh once, and
+    other users never wait on it. As with CalendarClientManager, the service
+    is built once and shared by all threads through a PooledHttp.
+    """
+
+    def __init__(self, user_id, creds, store, discovery_document, request_builder=HttpRequest):
+        self.user_id = user_id
+        self.creds = creds
+        self.store = store
+        self.discovery_document = discovery_document
+        self.request_builder = request_builder
+        self.refresh_lock = threading.Lock()
+        self.state = {}  # Per-user objects owned by the caller, dropped together with the client
+        self.pins = 0  # Holders that keep the client from eviction; guarded by the pool's lock
+        self.services_built = 0
+        self.refreshes = 0
+        self._service = None
+        self._service_lock = threading.Lock()
+
+    def _needs_refresh(self):
+        if isinstance(self.creds, AnonymousCredentials):
+            return False
+        if not self.creds.valid:
+            return True
+        # google-auth stores expiry as a naive UTC datetime
+        return self.creds.expiry is not None and \
+            self.creds.expiry - REFRESH_MARGIN < datetime.datetime.utcnow()
+
+    def ensure_valid(self):
+        if not self._needs_refresh():
+            return
+        with self.refresh_lock:
+            # Another thread may have refreshed while we waited
+            if self._needs_refresh():
+                self.creds.refresh(Request())
+                self.store.save(self.user_id, self.creds)
+                self.refreshes += 1
+
+    def get_service(self):
+        """Returns the user's shared service, with a fresh token."""
+        self.ensure_valid()
+        if self._service is None:
+            with self._service_lock:
+                if self._service is None:
+                    self._service = build_from_document(self.discovery_document(), http=PooledHttp(self.creds),
+                                                        requestBuilder=self.request_builder)
+                    self.services_built += 1
+        return self._service
+
+    def get_access_token(self):
+        if isinstance(self.creds, AnonymousCredentials):
+            return FAKE_ACCESS_TOKEN
+        self.ensure_valid()
+        return self.creds.token or ''
+
+
+class UserClientPool:
+    """
+    LRU pool of UserClients, bounded by user count, built services and the
+    size of the state callers keep on each client.
+
+    A built service holds its own parsed copy of the discovery document, and
+    a client's state (a user's mirror, busy index and caches) grows with
+    their calendar, so one busy user can outweigh hundreds of idle ones.
+    state_size(client) measures that state in items; the total is checked
+    whenever a client is added or a service built, and on trim(). The least
+    recently used users are evicted first, skipping users pinned with
+    acquire() until they are released, so a user never has two live
+    clients (and two copies of their state) at once.
+    """
+
+    def __init__(self, store, discovery_document, max_users=USER_POOL_SIZE, max_services=MAX_POOLED_SERVICES,
+                 request_builder=None, state_size=None, max_state=MAX_POOLED_STATE):
+        self.store = store
+        self.discovery_document = discovery_document
+        self.request_builder = request_builder  # user_id -> requestBuilder, e.g. one rate-limit bucket per user
+        self.max_users = max_users
+        self.max_services = max_services
+        self.state_size = state_size  # UserClient -> items held in client.state
+        self.max_state = max_state
+        self._lock = threading.Lock()
+        self._clients = OrderedDict()  # user_id -> UserClient, least recently used first
+        self._loading = {}  # user_id -> Lock, so one user's token file is read once
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id):
+        """Returns the user's client, loading their credentials on first use."""
+        with self._lock:
+            client = self._clients.get(user_id)
+            if client is not None:
+                self._clients.move_to_end(user_id)
+                self.hits += 1
+                return client
+            loading = self._loading.setdefault(user_id, threading.Lock())
+
+        with loading:
+            with self._lock:
+                client = self._clients.get(user_id)
+                if client is not None:
+                    self._clients.move_to_end(user_id)
+                    self.hits += 1
+                    return client
+            try:
+                creds = self.store.load(user_id)
+                if creds is None:
+                    raise LookupError(f"User {user_id} has not authorized calendar access")
+                request_builder = self.request_builder(user_id) if self.request_builder else HttpRequest
+                client = UserClient(user_id, creds, self.store, self.discovery_document, request_builder)
+                with self._lock:
+                    self.misses += 1
+                    self._clients[user_id] = client
+                    self._evict()
+            finally:
+                with self._lock:
+                    self._loading.pop(user_id, None)
+        return client
+
+    def acquire(self, user_id):
+        """Returns the user's client, pinned in the pool until release(client)."""
+        while True:
+            client = self.get(user_id)
+            with self._lock:
+                # Another thread may have evicted it between get() and here
+                if self._clients.get(user_id) is client:
+                    client.pins += 1
+                    return client
+
+    def release(self, client):
+        with self._lock:
+            client.pins -= 1
+            self._evict()
+
+    def get_service(self, client):
+        """
+        Returns the client's service, enforcing the service bound after a build.
+        Taking the client rather than a user id means a caller never re-creates
+        the pool entry of a client that was evicted meanwhile.
+        """
+        built = client.services_built
+        service = client.get_service()
+        if client.services_built != built:
+            with self._lock:
+                self._evict()
+        return service
+
+    def trim(self):
+        """Evicts users until every bound holds again, e.g. after a user's state grew."""
+        with self._lock:
+            self._evict()
+
+    def _state(self, client):
+        return self.state_size(client) if self.state_size else 0
+
+    def _evict(self):
+        # Caller must hold self._lock; the most recently used client and pinned ones always stay
+        services = sum(client.services_built for client in self._clients.values())
+        state = sum(self._state(client) for client in self._clients.values())
+        for user_id in list(self._clients)[:-1]:
+            if not (len(self._clients) > self.max_users or services > self.max_services or state > self.max_state):
+                return
+            client = self._clients[user_id]
+            if client.pins:
+                continue
+            del self._clients[user_id]
+            services -= client.services_built
+            state -= self._state(client)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._clients),
+                "services": sum(client.services_built for client in self._clients.values()),
+                "state": sum(self._state(client) for client in self._clients.values()),
+                "token_refreshes": sum(client.refreshes for client in self._clients.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+if __name__ == '__main__':
+    # Authorize a user: python user_clients.py <user_id>
+    if len(sys.argv) != 2:
+        sys.exit("usage: python user_clients.py <user_id>")
+    CredentialStore(scopes=['https://www.googleapis.com/auth/calendar']).authorize(sys.argv[1])
+    print(f"Stored credentials for {sys.argv[1]} in {USER_TOKEN_DIR}/")
@@ -0,0 +1,327 @@
+import os
+import time
+import uuid
+import sqlite3
+import secrets
+import threading
+from scheduling import data_path
+
+# fcntl is POSIX only; without it every process renews channels, as a single process would
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Configuration
+WEBHOOK_URL = os.getenv('CALENDAR_WEBHOOK_URL')  # Public HTTPS address of /calendar-webhook; unset disables push
+WEBHOOK_TOKEN = os.getenv('CALENDAR_WEBHOOK_TOKEN') or secrets.token_hex(16)
+CHANNEL_TTL = int(os.getenv('CALENDAR_CHANNEL_TTL', str(7 * 24 * 3600)))  # Seconds requested per channel
+# Open channels and change counters, shared by every process of the app
+WATCH_STORE_PATH = os.getenv('WATCH_STORE_PATH') or data_path('watch_channels.db')
+RENEW_MARGIN = 3600  # Renew channels this many seconds before they expire
+RETRY_SECONDS = 60  # Wait before retrying a failed registration
+FOLLOW_SECONDS = float(os.getenv('WATCH_FOLLOW_SECONDS', '2'))  # How often processes check the store
+
+
+class ChannelStore:
+    """
+    Open watch channels and a change counter per calendar, in SQLite.
+
+    Google delivers a notification to whichever process the load balancer
+    picks, so every process validates it against the same channel rows and
+    bumps the calendar's counter; the other processes see the new count
+    and follow the change.
+    """
+
+    def __init__(self, path=WATCH_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS channels (
+                id TEXT PRIMARY KEY,
+                calendar_id TEXT NOT NULL,
+                resource_id TEXT NOT NULL,
+                token TEXT NOT NULL,
+                expiration REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS changes (
+                calendar_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            );
+        """)
+
+    def add(self, channel_id, calendar_id, resource_id, token, expiration):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO channels VALUES (?, ?, ?, ?, ?)",
+                               (channel_id, calendar_id, resource_id, token, expiration))
+
+    def remove(self, channel_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM channels WHERE id = ?", (channel_id,))
+
+    def get(self, channel_id):
+        with self._lock:
+            row = self._conn.execute("SELECT calendar_id, resource_id, token, expiration FROM channels WHERE id = ?",
+                                     (channel_id,)).fetchone()
+        return dict(zip(("calendar_id", "resource_id", "token", "expiration"), row)) if row else None
+
+    def channels(self):
+        """channel id -> {"calendar_id", "resource_id", "token", "expiration"}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, calendar_id, resource_id, token, expiration FROM channels").fetchall()
+        return {row[0]: dict(zip(("calendar_id", "resource_id", "token", "expiration"), row[1:])) for row in rows}
+
+    def bump(self, calendar_id):
+        """Records a change to the calendar and returns its new version."""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO changes VALUES (?, 1) "
+                               "ON CONFLICT(calendar_id) DO UPDATE SET version = version + 1", (calendar_id,))
+            return self._conn.execute("SELECT version FROM changes WHERE calendar_id = ?",
+                                      (calendar_id,)).fetchone()[0]
+
+    def versions(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT calendar_id, version FROM changes").fetchall())
+
+
+class WatchChannelManager:
+    """
+    Keeps one events.watch channel open per calendar and dispatches its notifications.
+
+    Google POSTs to the webhook address whenever a watched calendar changes.
+    The notification carries no event data, only the channel and resource
+    ids, so on_change(calendar_id) is expected to pull the changes. Bursts of
+    notifications for one calendar collapse into a single on_change call,
+    run on a background thread so the webhook can answer immediately.
+    on_state(calendar_id, live) reports when push coverage starts or stops.
+
+    Every process of the app runs one: channels live in a shared
+    ChannelStore, and whichever process holds the store's lock file
+    registers and renews them. If that process exits, another takes over.
+    Only the process a notification reached calls on_change; the others
+    see its change counter move and call on_follow(calendar_id) instead
+    (on_change when unset), e.g. to pick up what that pull wrote to a
+    shared mirror rather than pulling again.
+    """
+
+    def __init__(self, service_factory, on_change, on_state=None, calendar_ids=('primary',),
+                 address=WEBHOOK_URL, token=WEBHOOK_TOKEN, ttl=CHANNEL_TTL, store=None, on_follow=None):
+        self.service_factory = service_factory
+        self.on_change = on_change
+        self.on_follow = on_follow or on_change
+        self.on_state = on_state
+        self.calendar_ids = list(calendar_ids)
+        self.address = address
+        self.token = token
+        self.ttl = ttl
+        self._store = store
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._pending = {}      # calendar id -> True if only followed from another process, not yet handled
+        self._dispatching = False
+        self._seen = {}         # calendar id -> last change version this process pulled for
+        self._live = set()      # Calendars this process has reported live through on_state
+        self._owner_fd = None
+        self._thread = None
+        self._renewer = None
+        self.notifications = 0
+        self.renewals = 0
+        self.failures = 0
+
+    @property
+    def store(self):
+        # Opened on first use, so an app without push never creates the file
+        with self._lock:
+            if self._store is None:
+                self._store = ChannelStore()
+            return self._store
+
+    # Channel lifecycle
+    def start(self):
+        """Follows the shared channels and renews them while this process owns them; no-op without an address."""
+        with self._lock:
+            if not self.address or self._thread is not None:
+                return False
+            self._thread = threading.Thread(target=self._follow_loop, name="calendar-watch-follower", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Stops following; the owning process also closes every open channel."""
+        self._stop.set()
+        self._wake.set()
+        if self._renewer is None:
+            return
+        for channel_id, channel in self.store.channels().items():
+            self._close(channel_id, channel)
+            self.store.remove(channel_id)
+            self._set_state(channel["calendar_id"], False)
+
+    def _try_own(self):
+        # Non-blocking flock on a file next to the store; the kernel drops it when the process exits
+        if self._owner_fd is not None:
+            return True
+        if fcntl is None:
+            self._owner_fd = -1
+            return True
+        fd = os.open(f"{self.store.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._owner_fd = fd
+        return True
+
+    def _watch(self, calendar_id):
+        channel_id = uuid.uuid4().hex
+        response = self.service_factory().events().watch(calendarId=calendar_id, body={
+            "id": channel_id,
+            "type": "web_hook",
+            "address": self.address,
+            "token": self.token,
+            "params": {"ttl": str(self.ttl)},
+        }).execute()
+        expiration = int(response.get('expiration', (time.time() + self.ttl) * 1000)) / 1000
+        self.store.add(channel_id, calendar_id, response['resourceId'], self.token, expiration)
+        return channel_id
+
+    def _close(self, channel_id, channel):
+        try:
+            self.service_factory().channels().stop(
+                body={"id": channel_id, "resourceId": channel["resource_id"]}).execute()
+        except Exception:
+            # An expired or unknown channel cannot deliver anything anyway
+            pass
+
+    def _set_state(self, calendar_id, live):
+        with self._lock:
+            if (calendar_id in self._live) == live:
+                return
+            if live:
+                self._live.add(calendar_id)
+            else:
+                self._live.discard(calendar_id)
+        if self.on_state:
+            self.on_state(calendar_id, live)
+
+    def _due(self):
+        """Calendars without a channel that stays open beyond the renewal margin."""
+        horizon = time.time() + RENEW_MARGIN
+        covered = {channel["calendar_id"] for channel in self.store.channels().values()
+                   if channel["expiration"] > horizon}
+        return [calendar_id for calendar_id in self.calendar_ids if calendar_id not in covered]
+
+    def _follow_loop(self):
+        # Every process: pick up ownership, push coverage and changes other processes were told about
+        while not self._stop.is_set():
+            try:
+                if self._renewer is None and self._try_own():
+                    self._renewer = threading.Thread(target=self._renew_loop, name="calendar-watch-renewer",
+                                                     daemon=True)
+                    self._renewer.start()
+                self._follow()
+            except Exception:
+                self.failures += 1
+            self._stop.wait(FOLLOW_SECONDS)
+
+    def _follow(self):
+        now = time.time()
+        live = {channel["calendar_id"] for channel in self.store.channels().values() if channel["expiration"] > now}
+        for calendar_id in self.calendar_ids:
+            self._set_state(calendar_id, calendar_id in live)
+        for calendar_id, version in self.store.versions().items():
+            with self._lock:
+                seen = self._seen.get(calendar_id)
+                self._seen[calendar_id] = max(version, seen or 0)
+            # The first look only records where the counter stands
+            if seen is not None and version > seen:
+                self._dispatch(calendar_id, followed=True)
+
+    def _renew_loop(self):
+        while not self._stop.is_set():
+            for calendar_id in self._due():
+                previous = [(channel_id, channel) for channel_id, channel in self.store.channels().items()
+                            if channel["calendar_id"] == calendar_id]
+                try:
+                    self._watch(calendar_id)
+                except Exception:
+                    self.failures += 1
+                    if not any(channel["expiration"] > time.time() for _, channel in previous):
+                        self._set_state(calendar_id, False)
+                    continue
+                # The new channel is open before the old one closes, so no change is missed
+                for channel_id, channel in previous:
+                    self.store.remove(channel_id)
+                    self._close(channel_id, channel)
+                    self.renewals += 1
+                self._set_state(calendar_id, True)
+                # Changes made while no channel was open are only seen by pulling, in every process
+                self._changed(calendar_id)
+
+            self._wake.wait(self._seconds_until_next_run())
+            self._wake.clear()
+
+    def _seconds_until_next_run(self):
+        if self._due():
+            return RETRY_SECONDS
+        earliest = min((channel["expiration"] for channel in self.store.channels().values()), default=None)
+        if earliest is None:
+            return RETRY_SECONDS
+        return max(1.0, earliest - RENEW_MARGIN - time.time())
+
+    # Notifications
+    def handle_notification(self, headers):
+        """
+        Handles one webhook POST given its headers.
+        Returns (accepted, reason); the initial "sync" message is accepted but ignored.
+        """
+        if not self.address:
+            return False, "Unknown channel"
+        channel = self.store.get(headers.get('X-Goog-Channel-ID'))
+        if channel is None or channel["resource_id"] != headers.get('X-Goog-Resource-ID'):
+            return False, "Unknown channel"
+        if not secrets.compare_digest(headers.get('X-Goog-Channel-Token') or '', channel["token"]):
+            return False, "Invalid channel token"
+
+        self.notifications += 1
+        if headers.get('X-Goog-Resource-State') == 'sync':
+            return True, "Channel confirmed"
+        self._changed(channel["calendar_id"])
+        return True, "Change queued"
+
+    def _changed(self, calendar_id):
+        # Pull here now; the other processes see the bumped version on their next follow
+        version = self.store.bump(calendar_id)
+        with self._lock:
+            self._seen[calendar_id] = max(version, self._seen.get(calendar_id, 0))
+        self._dispatch(calendar_id)
+
+    def _dispatch(self, calendar_id, followed=False):
+        with self._lock:
+            # A notification this process received takes precedence over following one
+            self._pending[calendar_id] = self._pending.get(calendar_id, True) and followed
+            if self._dispatching:
+                return
+            self._dispatching = True
+        threading.Thread(target=self._drain, name="calendar-watch-dispatch", daemon=True).start()
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._dispatching = False
+                    return
+                calendar_id, followed = self._pending.popitem()
+            try:
+                (self.on_follow if followed else self.on_change)(calendar_id)
+            except Exception:
+                self.failures += 1
+
+    def stats(self):
+        channels = [{"calendar_id": channel["calendar_id"], "expires_in": round(channel["expiration"] - time.time())}
+                    for channel in (self.store.channels().values() if self.address else ())]
+        return {"channels": channels, "owner": self._renewer is not None, "notifications": self.notifications,
+                "renewals": self.renewals, "failures": self.failures}
@@ -0,0 +1,84 @@
+import uuid
+import datetime
+import threading
+
+# Changes on every process start, so versions from an earlier run never match
+BOOT_ID = uuid.uuid4().hex[:8]
+
+
+class WindowVersions:
+    """
+    Change clock for one calendar, kept per local day.
+
+    Every change to the mirror ticks a counter and stamps the days the
+    event covered before and after the change. The version of a window is
+    the newest stamp among its days, so it moves whenever something inside
+    the window changes and stays put for changes elsewhere.
+    """
+
+    def __init__(self, timezone):
+        self.timezone = timezone
+        self._lock = threading.Lock()
+        self._clock = 0
+        self._floor = 0       # Clock value of the last full sync; every day is at least this new
+        self._days = {}       # day ordinal -> clock value of the last change touching it
+        self._spans = {}      # event_id -> (first_day, last_day) the event currently covers
+
+    def _day(self, timestamp):
+        return datetime.datetime.fromtimestamp(timestamp, self.timezone).toordinal()
+
+    def _span(self, start, end):
+        # End is exclusive, so an event ending at midnight does not touch the next day
+        return self._day(start), self._day(max(start, end - 1))
+
+    def _stamp(self, span):
+        for day in range(span[0], span[1] + 1):
+            self._days[day] = self._clock
+
+    def rebuild(self, intervals):
+        """Forgets per-day history after a full sync; (event_id, start, end) seeds the spans."""
+        with self._lock:
+            self._clock += 1
+            self._floor = self._clock
+            self._days = {}
+            self._spans = {event_id: self._span(start, end) for event_id, start, end in intervals}
+
+    def on_change(self, changed, removed, full):
+        """EventStore listener: stamps the days each changed or removed event touched."""
+        if full:
+            self.rebuild(changed)
+            return
+        with self._lock:
+            self._clock += 1
+            for event_id, start, end in changed:
+                span = self._span(start, end)
+                previous = self._spans.get(event_id)
+                if previous:
+                    self._stamp(previous)
+                self._stamp(span)
+                self._spans[event_id] = span
+            for event_id in removed:
+                previous = self._spans.pop(event_id, None)
+                if previous:
+                    self._stamp(previous)
+
+    def version(self, start, end):
+        """Returns an opaque version string for the window [start, end) in epoch seconds."""
+        first_day, last_day = self._span(start, end)
+        with self._lock:
+            latest = self._floor
+            # Walk whichever is smaller: the window's days or the days ever stamped
+            if last_day - first_day < len(self._days):
+                for day in range(first_day, last_day + 1):
+                    latest = max(latest, self._days.get(day, 0))
+            else:
+                for day, stamp in self._days.items():
+                    if first_day <= day <= last_day:
+                        latest = max(latest, stamp)
+        return f"{BOOT_ID}-{latest}"
+
+    def attach(self, store):
+        """Seeds spans from the store and follows its changes."""
+        self.rebuild(store.iter_bounds())
+        store.add_listener(self.on_change)
+        return self
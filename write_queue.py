@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import threading
+from googleapiclient.errors import HttpError
+from rate_limit import is_rate_limited
+from scheduling import data_path
+
+# Configuration
+WRITE_QUEUE_PATH = os.getenv('WRITE_QUEUE_PATH') or data_path('write_queue.db')
+WRITE_WORKERS = int(os.getenv('WRITE_WORKERS', '4'))
+MAX_ATTEMPTS = int(os.getenv('WRITE_MAX_ATTEMPTS', '8'))
+BACKOFF_BASE = float(os.getenv('WRITE_BACKOFF_BASE', '1'))  # Seconds before the first retry
+BACKOFF_MAX = float(os.getenv('WRITE_BACKOFF_MAX', '60'))
+LEASE_SECONDS = float(os.getenv('WRITE_LEASE_SECONDS', '300'))  # A running job whose lease lapses is re-queued
+LEASE_RENEW_SECONDS = LEASE_SECONDS / 3  # Workers extend the lease of the job they run this often
+POLL_SECONDS = float(os.getenv('WRITE_POLL_SECONDS', '5'))  # Idle workers look for jobs other processes queued
+RETRYABLE_STATUSES = {500, 502, 503, 504}  # Plus rate limits, which include some 403s
+ACTIVE_STATUSES = ('queued', 'running', 'retrying')
+JOB_COLUMNS = "id, user_id, kind, payload, status, attempts, next_run_at, result, error, created_at, updated_at"
+
+
+def is_retryable(error):
+    """
+    True for rate limits, server errors and network failures; anything else fails the job.
+    A 403 is only retried when it is a quota error: forbidden calendars and missing
+    permissions would fail the same way on every attempt.
+    """
+    if isinstance(error, HttpError):
+        return is_rate_limited(error) or error.resp.status in RETRYABLE_STATUSES
+    return isinstance(error, (OSError, TimeoutError))
+
+
+def backoff_delay(attempts):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1)))
+
+
+class WriteQueue:
+    """
+    Calendar mutations persisted in SQLite and executed by background workers.
+
+    submit() stores a job and returns at once. Workers claim due jobs, call
+    handler(kind, payload, user_id) and record its result. Transient errors
+    are retried with exponential backoff, up to max_attempts. A dedup key
+    maps repeated submissions of the same mutation onto one job. Several
+    processes may share the database: a job is claimed with a conditional
+    UPDATE, so only one worker gets it, and holds a lease while it runs.
+    The worker renews the lease every LEASE_RENEW_SECONDS, so a slow job
+    keeps it; a job whose lease lapsed (its process crashed or hung) is
+    claimed again, so delivery is at-least-once and handlers must be
+    idempotent.
+    """
+
+    def __init__(self, handler, path=WRITE_QUEUE_PATH, workers=WRITE_WORKERS, max_attempts=MAX_ATTEMPTS):
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads = []
+        self._stop = False
+        # Other processes may hold the write lock briefly while they claim or finish jobs
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                dedup_key TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_run_at REAL NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                lease_until REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_run_at);
+            CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key);
+        """)
+        # Queues created before leases existed
+        if 'lease_until' not in [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]:
+            with self._conn:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL")
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [threading.Thread(target=self._work, name=f"write-queue-{index}", daemon=True)
+                             for index in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stop = True
+            self._wakeup.notify_all()
+
+    def submit(self, kind, payload, user_id=None, dedup_key=None, active_only=False):
+        """
+        Queues a mutation and returns its job. If a job with the same dedup key
+        has not failed (or, with active_only, is still pending) it is returned instead.
+        """
+        now = time.time()
+        with self._lock:
+            existing = self._find(dedup_key, active_only)
+            if existing:
+                return existing
+            job_id = uuid.uuid4().hex
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO jobs (id, user_id, kind, payload, dedup_key, status, next_run_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                    (job_id, user_id, kind, json.dumps(payload), dedup_key, now, now, now))
+            self._wakeup.notify()
+        self.start()
+        return self.get(job_id)
+
+    def find(self, dedup_key, active_only=False):
+        """Returns the job submit() would deduplicate onto, or None."""
+        with self._lock:
+            return self._find(dedup_key, active_only)
+
+    def _find(self, dedup_key, active_only):
+        # Caller must hold self._lock
+        if not dedup_key:
+            return None
+        statuses = ACTIVE_STATUSES if active_only else ACTIVE_STATUSES + ('succeeded',)
+        row = self._conn.execute(
+            f"SELECT {JOB_COLUMNS} FROM jobs WHERE dedup_key = ? AND status IN {statuses} "
+            "ORDER BY created_at DESC LIMIT 1", (dedup_key,)).fetchone()
+        return self._to_job(row, deduplicated=True) if row else None
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None."""
+        with self._lock:
+            row = self._conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def active_payloads(self, user_id=None, kinds=None):
+        """Payloads of jobs not yet finished for a user, e.g. to treat queued inserts as busy time."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT kind, payload FROM jobs WHERE status IN {ACTIVE_STATUSES} AND user_id IS ?",
+                (user_id,)).fetchall()
+        return [json.loads(payload) for kind, payload in rows if kinds is None or kind in kinds]
+
+    def counts(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def _to_job(self, row, deduplicated=False):
+        job = dict(zip([column.strip() for column in JOB_COLUMNS.split(',')], row))
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        if deduplicated:
+            job["deduplicated"] = True
+        return job
+
+    # Workers
+    def _claim(self):
+        # Caller must hold self._lock; returns the next due job or the seconds until one is due
+        while True:
+            now = time.time()
+            with self._conn:
+                # Running jobs without a live lease belong to a worker that died
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', lease_until = NULL "
+                    "WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?)", (now,))
+            row = self._conn.execute(
+                f"SELECT {JOB_COLUMNS} FROM jobs WHERE status IN ('queued', 'retrying') "
+                "ORDER BY next_run_at LIMIT 1").fetchone()
+            if row is None:
+                return None, None
+            job = self._to_job(row)
+            if job["next_run_at"] > now:
+                return None, job["next_run_at"] - now
+            # Another process may claim the same row first; only one UPDATE matches
+            with self._conn:
+                claimed = self._conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? "
+                    "WHERE id = ? AND status IN ('queued', 'retrying')",
+                    (now + LEASE_SECONDS, now, job["id"])).rowcount
+            if claimed:
+                job["status"] = 'running'
+                job["attempts"] += 1
+                return job, None
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while True:
+                    if self._stop:
+                        return
+                    job, wait = self._claim()
+                    if job:
+                        break
+                    # Other processes queue jobs too, and their notify() does not reach us
+                    self._wakeup.wait(min(wait, POLL_SECONDS) if wait is not None else POLL_SECONDS)
+            self._run(job)
+
+    def _renew_lease(self, job_id, done):
+        while not done.wait(LEASE_RENEW_SECONDS):
+            with self._lock:
+                with self._conn:
+                    self._conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+                                       (time.time() + LEASE_SECONDS, job_id))
+
+    def _run(self, job):
+        done = threading.Event()
+        threading.Thread(target=self._renew_lease, args=(job["id"], done), name="write-queue-lease",
+                         daemon=True).start()
+        try:
+            result = self.handler(job["kind"], job["payload"], job["user_id"])
+        except Exception as e:
+            retry = is_retryable(e) and job["attempts"] < self.max_attempts
+            self._finish(job["id"], 'retrying' if retry else 'failed', error=str(e),
+                         next_run_at=time.time() + backoff_delay(job["attempts"]) if retry else None)
+        else:
+            self._finish(job["id"], 'succeeded', result=result)
+        finally:
+            done.set()
+
+    def _finish(self, job_id, status, result=None, error=None, next_run_at=None):
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = ?, next_run_at = COALESCE(?, next_run_at), "
+                    "lease_until = NULL, updated_at = ? WHERE id = ?",
+                    (status, json.dumps(result) if result is not None else None, error, next_run_at, now, job_id))
+            if status == 'retrying':
+                self._wakeup.notify()